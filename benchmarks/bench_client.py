@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+'''
+Benchmark the pidman REST client against a local
+:class:`~pidservices.fakeserver.FakePidmanServer`: single ``get_pid``
+requests, ``create_pid`` loops, bulk pid updates, and full pid search scans,
+at several concurrency levels and search page sizes.  Reports throughput
+(operations per second) and p50 / p99 request latency for each benchmark.
+
+Results can be saved as a JSON baseline, and compared with a saved baseline
+to flag regressions, e.g. before and after a client change::
+
+    python -m benchmarks.bench_client --save benchmarks/baselines/local.json
+    ... change the client ...
+    python -m benchmarks.bench_client --compare benchmarks/baselines/local.json
+
+With ``--compare``, the exit status is 1 if any benchmark is slower than
+the baseline by more than the threshold.  Baselines are only comparable
+when run on the same machine with the same options;
+``benchmarks/baselines/reference.json`` is an example run with the default
+options on a single development machine, for a rough idea of the expected
+numbers, and not a reference to compare other machines against.
+
+Usage, from the top-level directory of the repository::
+
+    python -m benchmarks.bench_client [-n COUNT] [--workers 1,4,16]
+        [--page-sizes 10,100,500] [--latency SECONDS] [--only NAME ...]
+        [--save PATH] [--compare PATH] [--threshold FRACTION]
+
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import requests
+
+from pidservices import __version__
+from pidservices.bulk import bounded_map
+from pidservices.clients import PidmanRestClient
+from pidservices.fakeserver import FakePidmanServer
+from pidservices.tracing import Tracer
+
+BENCHMARKS = ('get_pid', 'create_pid', 'bulk_update', 'search_scan')
+
+
+def percentile(values, q):
+    '''Nearest-rank percentile of a list of values, e.g. 0.99 for p99.'''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+def timed_run(server, workers, func, items, pool_size=None):
+    '''Run ``func`` on each item with a new client, using up to ``workers``
+    concurrent calls.  The client connection pool holds ``pool_size``
+    connections (defaults to ``workers``), which should be the number of
+    concurrent requests.  Returns the number of operations, the elapsed
+    time, and the latency of each request.'''
+    tracer = Tracer(max_spans=None)
+    client = PidmanRestClient(server.url, 'bench', 'bench', tracer=tracer,
+                              pool_maxsize=max(10, pool_size or workers))
+    try:
+        start = time.perf_counter()
+        if workers == 1:
+            operations = sum(func(client, item) or 1 for item in items)
+        else:
+            operations = sum(result or 1 for result in
+                             bounded_map(lambda item: func(client, item), items,
+                                         workers=workers))
+        elapsed = time.perf_counter() - start
+    finally:
+        client.session.close()
+    return operations, elapsed, [span.duration for span in tracer.finished]
+
+
+def result_info(operations, elapsed, latencies):
+    return {
+        'operations': operations,
+        'requests': len(latencies),
+        'elapsed': round(elapsed, 6),
+        'throughput': round(operations / elapsed, 3),
+        'p50': round(percentile(latencies, 0.5), 6),
+        'p99': round(percentile(latencies, 0.99), 6),
+    }
+
+
+def run_benchmarks(args):
+    '''Run the selected benchmarks, and return a dictionary of results
+    keyed on benchmark name and options.'''
+    results = {}
+    server = FakePidmanServer(username='bench', password='bench', latency=args.latency,
+                              page_size=max(args.page_sizes))
+    with server:
+        domain = server.add_domain('Benchmark')['uri']
+        noids = server.add_pids(args.count, domain=domain)
+        # new pids are created in a separate domain, so scans are repeatable
+        create_domain = server.add_domain('Benchmark (created)')['uri']
+
+        def get_pid(client, noid):
+            client.get_ark(noid)
+
+        def create_pid(client, i):
+            client.create_ark(create_domain, 'http://example.com/%d' % i, name='item %d' % i)
+
+        def update_pid(client, noid):
+            client.update_ark(noid, name='updated %s' % noid)
+
+        def search_scan(page_size, workers):
+            def scan(client, item):
+                return sum(1 for pid in client.iter_search_pids(domain_uri=domain,
+                                                                count=page_size,
+                                                                workers=workers))
+            return scan
+
+        for workers in args.workers:
+            tests = {
+                'get_pid': (get_pid, noids),
+                'create_pid': (create_pid, range(args.count)),
+                'bulk_update': (update_pid, noids),
+            }
+            for name in BENCHMARKS[:3]:
+                if name not in args.only:
+                    continue
+                func, items = tests[name]
+                key = '%s[workers=%d]' % (name, workers)
+                results[key] = best_of(args.repeat, server, workers, func, items)
+                report(key, results[key])
+
+            if 'search_scan' in args.only:
+                for page_size in args.page_sizes:
+                    # pages are requested concurrently by iter_search_pids,
+                    # so the scan itself runs once, with a connection for
+                    # each page worker
+                    key = 'search_scan[page_size=%d,workers=%d]' % (page_size, workers)
+                    results[key] = best_of(args.repeat, server, 1,
+                                           search_scan(page_size, workers), [None],
+                                           pool_size=workers)
+                    report(key, results[key])
+    return results
+
+
+def best_of(repeat, server, workers, func, items, pool_size=None):
+    '''Run a benchmark several times, and return the result with the
+    highest throughput.'''
+    runs = [result_info(*timed_run(server, workers, func, items, pool_size))
+            for i in range(repeat)]
+    return max(runs, key=lambda run: run['throughput'])
+
+
+def report(key, result):
+    print('%-44s %8d ops %10.1f ops/s   p50 %7.2fms   p99 %7.2fms' %
+          (key, result['operations'], result['throughput'],
+           result['p50'] * 1000, result['p99'] * 1000))
+
+
+def compare(results, baseline, threshold):
+    '''Compare results with a baseline, and print the change in throughput
+    and latency for each benchmark in both.  Returns a list of the
+    benchmarks that are slower than the baseline by more than ``threshold``
+    (e.g., 0.1 for 10%).'''
+    regressions = []
+    print('\n%-44s %10s %10s %10s' % ('compared with baseline', 'ops/s', 'p50', 'p99'))
+    for key in sorted(set(results) & set(baseline)):
+        current, base = results[key], baseline[key]
+        changes = [current['throughput'] / base['throughput'] - 1,
+                   current['p50'] / base['p50'] - 1 if base['p50'] else 0,
+                   current['p99'] / base['p99'] - 1 if base['p99'] else 0]
+        # lower throughput or higher latency is a regression
+        regressed = changes[0] < -threshold or changes[1] > threshold or \
+            changes[2] > threshold
+        if regressed:
+            regressions.append(key)
+        print('%-44s %+9.1f%% %+9.1f%% %+9.1f%%%s' % (
+            key, changes[0] * 100, changes[1] * 100, changes[2] * 100,
+            '   REGRESSION' if regressed else ''))
+    return regressions
+
+
+def int_list(value):
+    return [int(val) for val in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pidman REST client')
+    parser.add_argument('-n', '--count', type=int, default=500,
+                        help='number of pids for each benchmark (default: %(default)s)')
+    parser.add_argument('--workers', type=int_list, default=[1, 4, 16],
+                        help='comma-separated concurrency levels (default: 1,4,16)')
+    parser.add_argument('--page-sizes', type=int_list, default=[10, 100, 500],
+                        help='comma-separated search page sizes (default: 10,100,500)')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='simulated server latency in seconds (default: %(default)s)')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs for each benchmark; best is reported '
+                        '(default: %(default)s)')
+    parser.add_argument('--save', metavar='PATH', help='save results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare results with a saved JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fractional slowdown to report as a regression '
+                        '(default: %(default)s)')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    if args.save:
+        with open(args.save, 'w') as outfile:
+            json.dump({
+                # only details that help compare runs, not identify the machine
+                'environment': {
+                    'pidservices': __version__,
+                    'requests': requests.__version__,
+                    'python': platform.python_version(),
+                    'cpu_count': os.cpu_count(),
+                },
+                'options': {'count': args.count, 'latency': args.latency,
+                            'repeat': args.repeat},
+                'results': results,
+            }, outfile, indent=2, sort_keys=True)
+        print('\nSaved results to %s' % args.save)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+        if baseline['options'] != {'count': args.count, 'latency': args.latency,
+                                   'repeat': args.repeat}:
+            print('Warning: baseline was run with different options: %s' %
+                  baseline['options'])
+        if compare(results, baseline['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+'''
+Benchmark parsing a large batch of identifiers with
+:meth:`pidservices.clients.parse_arks`, compared with calling
+:meth:`pidservices.clients.parse_ark` on each identifier.
+
+Usage, from the top-level directory of the repository::
+
+    python -m benchmarks.bench_parse_arks [-n COUNT] [--ark-ratio RATIO]
+
+'''
+import argparse
+import timeit
+
+from pidservices.clients import parse_ark, parse_arks
+
+
+def identifiers(count, ark_ratio):
+    '''Generate a mix of resolvable and short-form ARKs (with and without
+    qualifiers) and other catalog identifiers.'''
+    ids = []
+    for i in range(count):
+        if (i % 100) < ark_ratio * 100:
+            if i % 2:
+                ids.append('http://pid.emory.edu/ark:/25593/%06dx' % i)
+            else:
+                ids.append('ark:/25593/%06dq/PDF' % i)
+        elif i % 2:
+            ids.append('ocm%08d' % i)
+        else:
+            ids.append('http://example.com/catalog/record/%d' % i)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch ARK parsing')
+    parser.add_argument('-n', '--count', type=int, default=1000000,
+                        help='number of identifiers to parse (default: %(default)s)')
+    parser.add_argument('--ark-ratio', type=float, default=0.5,
+                        help='fraction of identifiers that are ARKs (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timing runs; best is reported (default: %(default)s)')
+    args = parser.parse_args()
+
+    ids = identifiers(args.count, args.ark_ratio)
+    tests = [
+        ('parse_ark (per call)', lambda: [parse_ark(ark) for ark in ids]),
+        ('parse_arks', lambda: parse_arks(ids)),
+        ('parse_arks (columnar)', lambda: parse_arks(ids, columnar=True)),
+    ]
+    baseline = None
+    for label, func in tests:
+        elapsed = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        if baseline is None:
+            baseline = elapsed
+        print('%-24s %8.3fs %12.0f ids/s %6.2fx' %
+              (label, elapsed, args.count / elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
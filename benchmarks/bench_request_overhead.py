@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+'''
+Benchmark the client-side overhead of a single request: everything
+:class:`~pidservices.clients.PidmanRestClient` does to make a request and
+handle its response, with the session replaced by a stub that returns a
+response immediately, so no network or server time is included.
+
+Usage, from the top-level directory of the repository::
+
+    python -m benchmarks.bench_request_overhead [-n COUNT] [--debug]
+
+'''
+import argparse
+import logging
+import timeit
+
+import requests
+
+from pidservices.clients import PidmanRestClient
+
+
+class StubResponse(object):
+    status_code = requests.codes.ok
+    headers = {}
+
+    def json(self):
+        return {'pid': 'aa'}
+
+
+# the client uses the name of the session method as the http method
+def get(url, headers=None, **kwargs):
+    return StubResponse()
+
+
+def put(url, headers=None, **kwargs):
+    return StubResponse()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-request client overhead')
+    parser.add_argument('-n', '--count', type=int, default=20000,
+                        help='number of requests to time (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of timing runs; best is reported (default: %(default)s)')
+    parser.add_argument('--debug', action='store_true',
+                        help='enable debug logging of request details')
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG, filename='/dev/null')
+    client = PidmanRestClient('http://pid.example.com/', 'bench', 'bench')
+    client.session.get = get
+    client.session.put = put
+    tests = [
+        ('get_pid', lambda: client.get_ark('aa')),
+        ('update_pid', lambda: client.update_ark('aa', name='updated')),
+    ]
+    for label, func in tests:
+        elapsed = min(timeit.repeat(func, number=args.count, repeat=args.repeat))
+        print('%-12s %8.1f us/request %12.0f requests/s' %
+              (label, elapsed / args.count * 1000000, args.count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+'''
+*"Many hands make light work."* - **John Heywood**
+
+Utilities for running many pidman API calls concurrently, e.g. minting or
+updating a large batch of pids, while keeping a bound on the number of
+requests in flight at once.
+'''
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import contextvars
+
+from pidservices.concurrency import AdaptiveLimit
+
+
+def bounded_map(func, iterable, workers=4, ordered=True, return_exceptions=False):
+    '''Call ``func`` on each item of ``iterable`` using a pool of threads,
+    and generate the results.  Items are read from the iterable only as
+    threads are available to process them, so at most ``workers`` calls are
+    in flight and only a small window of pending results is held in memory,
+    even for a very large or unbounded iterable.  Each call runs in a copy
+    of the caller's context, so context variables (e.g., the current
+    tracing span) are available to ``func``.
+
+    :param func: function to call with each item
+    :param iterable: items to process
+    :param workers: maximum number of calls to run concurrently, or an
+        :class:`~pidservices.concurrency.AdaptiveLimit` to adjust the
+        number of calls in flight as its limit changes
+    :param ordered: if True (the default), results are generated in the
+        same order as the input items; otherwise, results are generated as
+        soon as each call completes
+    :param return_exceptions: if True, an exception raised by a call is
+        generated in place of the result for that item, rather than being
+        raised and ending the iteration
+    :returns: generator of results
+    '''
+    if isinstance(workers, AdaptiveLimit):
+        for result in _adaptive_map(func, iterable, workers, ordered, return_exceptions):
+            yield result
+        return
+    if workers < 1:
+        raise ValueError('workers must be at least 1')
+
+    def result(future):
+        return _result(future, return_exceptions)
+
+    items = iter(iterable)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # keep every worker busy, with one extra queued call each
+            # so a worker never waits on the caller to submit more work
+            for item in items:
+                pending.append(executor.submit(contextvars.copy_context().run,
+                                               func, item))
+                if len(pending) >= workers * 2:
+                    break
+
+            if not pending:
+                break
+
+            if ordered:
+                yield result(pending.popleft())
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield result(future)
+    finally:
+        # if the caller stops iterating early, don't start any queued calls
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _result(future, return_exceptions):
+    if return_exceptions:
+        err = future.exception()
+        if err is not None:
+            return err
+    return future.result()
+
+
+def _adaptive_map(func, iterable, limit, ordered, return_exceptions):
+    # bounded_map with the number of calls in flight set by an AdaptiveLimit
+    items = iter(iterable)
+    # calls not yet generated, and calls still running; when ordered,
+    # the number of pending calls is capped so only a bounded number of
+    # results are held while waiting on an earlier item
+    pending = deque()
+    running = set()
+    max_pending = limit.maximum * 2
+    executor = ThreadPoolExecutor(max_workers=limit.maximum)
+    try:
+        exhausted = False
+        while True:
+            running = set(future for future in running if not future.done())
+            while not exhausted and len(running) < limit.limit and \
+              len(pending) < max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(contextvars.copy_context().run, func, item)
+                pending.append(future)
+                running.add(future)
+
+            if not pending:
+                break
+
+            if ordered:
+                if not pending[0].done():
+                    # wake when any call completes, so a free slot is filled
+                    wait(running, return_when=FIRST_COMPLETED)
+                while pending and pending[0].done():
+                    yield _result(pending.popleft(), return_exceptions)
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield _result(future, return_exceptions)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def bounded_map_async(func, iterable, workers=4, ordered=True,
+                            return_exceptions=False):
+    '''Asynchronous generator version of :func:`bounded_map`, for use
+    with the asyncio client: calls the coroutine function ``func`` on each
+    item of ``iterable`` in a task, with at most ``workers`` tasks running
+    at once, and generates the results.  As with :func:`bounded_map`,
+    items are read from the iterable only as tasks are started, and only a
+    small window of pending results is held, so a very large batch does not
+    create a pending coroutine for every item.  Takes the same parameters
+    as :func:`bounded_map`.
+    '''
+    adaptive = isinstance(workers, AdaptiveLimit)
+    if not adaptive and workers < 1:
+        raise ValueError('workers must be at least 1')
+    max_pending = (workers.maximum if adaptive else workers) * 2
+    items = iter(iterable)
+    # tasks whose results have not been generated yet, in input order
+    pending = deque()
+    try:
+        exhausted = False
+        while True:
+            window = workers.limit if adaptive else workers
+            running = sum(1 for task in pending if not task.done())
+            while not exhausted and running < window and len(pending) < max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append(asyncio.ensure_future(func(item)))
+                running += 1
+
+            if not pending:
+                break
+
+            if ordered:
+                if not pending[0].done():
+                    # wake when any task completes, so a free slot is filled
+                    await asyncio.wait([task for task in pending if not task.done()],
+                                       return_when=asyncio.FIRST_COMPLETED)
+                while pending and pending[0].done():
+                    yield _result(pending.popleft(), return_exceptions)
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.remove(task)
+                    yield _result(task, return_exceptions)
+    finally:
+        # if the caller stops iterating early, cancel the remaining tasks
+        for task in pending:
+            task.cancel()
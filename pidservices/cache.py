@@ -0,0 +1,476 @@
+'''
+*"There are only two hard things in Computer Science: cache invalidation
+and naming things."* - **Phil Karlton**
+
+Caching for pidman API lookups (pids, targets, and domains), which change
+rarely but may be requested very frequently, e.g. to display citation links.
+'''
+
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class CacheEntry(object):
+    '''A single cached value, with expiration time, invalidation tag,
+    and optional http validators (``ETag`` and ``Last-Modified`` response
+    headers) for revalidating the value when it expires.'''
+    __slots__ = ('value', 'expires', 'tag', 'etag', 'last_modified')
+
+    def __init__(self, value, expires, tag=None, etag=None, last_modified=None):
+        self.value = value
+        self.expires = expires
+        self.tag = tag
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def revalidatable(self):
+        '''True if this entry has validators for a conditional request.'''
+        return bool(self.etag or self.last_modified)
+
+    def fresh(self, now=None):
+        '''True if this entry has not yet expired.'''
+        return (now if now is not None else time.monotonic()) < self.expires
+
+
+class LRUCache(object):
+    '''Thread-safe, size-bounded in-memory cache with per-entry time to live.
+    When the cache is full, the least recently used entry is evicted.
+
+    Entries may be stored with a tag (e.g., the pid type and noid) so that
+    all entries related to a pid can be invalidated at once.
+
+    Expired entries with http validators are kept (until evicted) so that
+    they can be revalidated with a conditional request; see :meth:`get_entry`
+    and :meth:`refresh`.
+
+    Cached values are returned as stored, and should not be modified.
+
+    :param maxsize: maximum number of entries to keep; defaults to 1024
+    :param ttl: default time to live in seconds for cached entries;
+        defaults to 300
+    '''
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self._entries = OrderedDict()
+        # index of keys by tag, for invalidation
+        self._tags = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        '''Get a cached value, if present and not expired.
+
+        :param key: cache key
+        :param default: value to return if the key is not cached
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.fresh():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                # keep expired entries that can be revalidated
+                if not entry.revalidatable:
+                    self._remove(key)
+            self.misses += 1
+            return default
+
+    def get_entry(self, key):
+        '''Get the :class:`CacheEntry` for a key, whether or not it has
+        expired, e.g. to revalidate an expired value.  Does not count as a
+        cache hit or miss.
+
+        :param key: cache key
+        :returns: :class:`CacheEntry` or None
+        '''
+        with self._lock:
+            return self._entries.get(key)
+
+    def refresh(self, key, ttl=None):
+        '''Renew the expiration time of an entry after it has been
+        successfully revalidated.
+
+        :param key: cache key
+        :param ttl: time to live in seconds; defaults to the cache ttl
+        '''
+        expires = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires = expires
+                self._entries.move_to_end(key)
+                self.revalidations += 1
+
+    def set(self, key, value, tag=None, ttl=None, etag=None, last_modified=None):
+        '''Add or replace a cached value.
+
+        :param key: cache key
+        :param value: value to cache
+        :param tag: optional tag for invalidating related entries
+        :param ttl: time to live in seconds; defaults to the cache ttl
+        :param etag: optional ``ETag`` header for revalidation
+        :param last_modified: optional ``Last-Modified`` header for revalidation
+        '''
+        expires = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(value, expires, tag, etag, last_modified)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        '''Remove a single entry from the cache, if present.'''
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate(self, tag):
+        '''Remove all entries stored with the specified tag.'''
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        '''Remove all entries from the cache.'''
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        # remove an entry and its tag index; caller must hold the lock
+        entry = self._entries.pop(key)
+        if entry.tag is not None:
+            keys = self._tags.get(entry.tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[entry.tag]
+
+    def stats(self):
+        '''Report cache usage: hits, misses, evictions, revalidations
+        (expired entries refreshed by a conditional request), and current
+        and maximum size.
+
+        :rtype: dict
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'revalidations': self.revalidations,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+class SQLiteCache(object):
+    '''Persistent cache stored in a SQLite database, which can be shared by
+    several processes on the same host (e.g., web server workers and
+    command-line scripts), so that information retrieved by one process is
+    available to the others and survives restarts.  Uses SQLite write-ahead
+    logging so that readers do not block while another process writes.
+
+    Provides the same methods as :class:`LRUCache`, and can be used as the
+    client cache directly, or as the shared level of a :class:`TieredCache`.
+    Keys, tags and values must be JSON-serializable; tuples are stored as lists.
+
+    :param path: path to the SQLite database file; created if it does not exist
+    :param maxsize: approximate maximum number of entries to keep; least
+        recently used entries are evicted periodically when the cache grows
+        beyond this size; defaults to 100000
+    :param ttl: default time to live in seconds for cached entries;
+        defaults to 3600
+    :param touch_interval: minimum number of seconds between updates to
+        the last-used time of an entry, to avoid a database write on every
+        cache hit; defaults to 60
+    '''
+    #: number of writes between checks for entries to evict
+    evict_interval = 100
+
+    def __init__(self, path, maxsize=100000, ttl=3600, touch_interval=60):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        db = self._db()
+        db.execute('''CREATE TABLE IF NOT EXISTS pidcache (
+            key TEXT PRIMARY KEY,
+            tag TEXT,
+            value TEXT NOT NULL,
+            expires REAL NOT NULL,
+            accessed REAL NOT NULL,
+            etag TEXT,
+            last_modified TEXT)''')
+        db.execute('CREATE INDEX IF NOT EXISTS pidcache_tag ON pidcache (tag)')
+        db.execute('CREATE INDEX IF NOT EXISTS pidcache_accessed ON pidcache (accessed)')
+
+    def _db(self):
+        # sqlite connections may not be shared between threads, or across a
+        # fork, so use a separate connection for each thread in each process
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @staticmethod
+    def _dumps(value):
+        return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+    def _entry(self, row, now):
+        # convert a database row to a CacheEntry; expiration is stored
+        # as wall clock time, but CacheEntry uses the monotonic clock
+        value, expires, tag, etag, last_modified = row
+        return CacheEntry(json.loads(value), time.monotonic() + (expires - now),
+                          _tuples(json.loads(tag)) if tag is not None else None,
+                          etag, last_modified)
+
+    def __len__(self):
+        return self._db().execute('SELECT COUNT(*) FROM pidcache').fetchone()[0]
+
+    def get(self, key, default=None):
+        '''Get a cached value, if present and not expired; see :meth:`LRUCache.get`.'''
+        db = self._db()
+        dbkey = self._dumps(key)
+        now = time.time()
+        row = db.execute('SELECT value, expires, accessed, etag, last_modified '
+                         'FROM pidcache WHERE key = ?', (dbkey, )).fetchone()
+        if row is not None:
+            value, expires, accessed, etag, last_modified = row
+            if now < expires:
+                if now - accessed > self.touch_interval:
+                    db.execute('UPDATE pidcache SET accessed = ? WHERE key = ?',
+                               (now, dbkey))
+                with self._lock:
+                    self.hits += 1
+                return json.loads(value)
+            if not (etag or last_modified):
+                db.execute('DELETE FROM pidcache WHERE key = ? AND expires <= ?',
+                           (dbkey, now))
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def get_entry(self, key):
+        '''Get the :class:`CacheEntry` for a key, whether or not it has
+        expired; see :meth:`LRUCache.get_entry`.'''
+        row = self._db().execute('SELECT value, expires, tag, etag, last_modified '
+                                 'FROM pidcache WHERE key = ?',
+                                 (self._dumps(key), )).fetchone()
+        if row is not None:
+            return self._entry(row, time.time())
+
+    def refresh(self, key, ttl=None):
+        '''Renew the expiration time of an entry; see :meth:`LRUCache.refresh`.'''
+        now = time.time()
+        expires = now + (ttl if ttl is not None else self.ttl)
+        cursor = self._db().execute('UPDATE pidcache SET expires = ?, accessed = ? '
+                                    'WHERE key = ?', (expires, now, self._dumps(key)))
+        if cursor.rowcount:
+            with self._lock:
+                self.revalidations += 1
+
+    def set(self, key, value, tag=None, ttl=None, etag=None, last_modified=None):
+        '''Add or replace a cached value; see :meth:`LRUCache.set`.'''
+        now = time.time()
+        expires = now + (ttl if ttl is not None else self.ttl)
+        self._db().execute('INSERT OR REPLACE INTO pidcache '
+            '(key, tag, value, expires, accessed, etag, last_modified) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (self._dumps(key), self._dumps(tag) if tag is not None else None,
+             self._dumps(value), expires, now, etag, last_modified))
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_interval == 0
+        if evict:
+            self.evict()
+
+    def delete(self, key):
+        '''Remove a single entry from the cache, if present.'''
+        self._db().execute('DELETE FROM pidcache WHERE key = ?', (self._dumps(key), ))
+
+    def invalidate(self, tag):
+        '''Remove all entries stored with the specified tag.'''
+        self._db().execute('DELETE FROM pidcache WHERE tag = ?', (self._dumps(tag), ))
+
+    def clear(self):
+        '''Remove all entries from the cache.'''
+        self._db().execute('DELETE FROM pidcache')
+
+    def evict(self):
+        '''Remove expired entries that cannot be revalidated, and the least
+        recently used entries beyond the maximum cache size.
+
+        :returns: number of entries removed
+        '''
+        db = self._db()
+        removed = db.execute('DELETE FROM pidcache WHERE expires <= ? AND '
+                             'etag IS NULL AND last_modified IS NULL',
+                             (time.time(), )).rowcount
+        excess = len(self) - self.maxsize
+        if excess > 0:
+            removed += db.execute('DELETE FROM pidcache WHERE key IN '
+                '(SELECT key FROM pidcache ORDER BY accessed LIMIT ?)',
+                (excess, )).rowcount
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def warm(self, cache, limit=None):
+        '''Copy the most recently used unexpired entries into another cache,
+        e.g. to pre-load an in-memory :class:`LRUCache` when a process starts.
+
+        :param cache: cache to load entries into
+        :param limit: maximum number of entries to copy; defaults to the
+            maximum size of the target cache, if it has one
+        :returns: number of entries copied
+        '''
+        if limit is None:
+            limit = getattr(cache, 'maxsize', -1)
+        now = time.time()
+        rows = self._db().execute('SELECT key, value, expires, tag, etag, last_modified '
+            'FROM pidcache WHERE expires > ? ORDER BY accessed DESC LIMIT ?',
+            (now, limit)).fetchall()
+        # add least recently used first, so that most recently used entries
+        # are also most recent in the target cache
+        for row in reversed(rows):
+            key, entry = row[0], self._entry(row[1:], now)
+            cache.set(_tuples(json.loads(key)), entry.value, tag=entry.tag,
+                      ttl=_expires_in(entry), etag=entry.etag,
+                      last_modified=entry.last_modified)
+        return len(rows)
+
+    def stats(self):
+        '''Report cache usage for this process, and current and maximum size.
+        See :meth:`LRUCache.stats`.
+
+        :rtype: dict
+        '''
+        with self._lock:
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'revalidations': self.revalidations,
+                'maxsize': self.maxsize,
+            }
+        stats['size'] = len(self)
+        return stats
+
+
+def _tuples(value):
+    # convert JSON-decoded lists back to tuples, so keys and tags loaded
+    # from a SQLiteCache match those used by the client
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+def _expires_in(entry):
+    # number of seconds until a CacheEntry expires
+    return entry.expires - time.monotonic()
+
+
+class TieredCache(object):
+    '''Two-level cache: a fast cache local to the process (e.g.
+    :class:`LRUCache`) in front of a slower shared cache (e.g.
+    :class:`SQLiteCache`).  Lookups check the local cache first; values
+    found in the shared cache are copied into the local cache until they
+    expire.  Updates and invalidations are applied to both levels.
+
+    :param local: process-local cache
+    :param shared: shared cache
+    :param warm: if True, pre-load the local cache from the shared cache
+        (see :meth:`SQLiteCache.warm`), so a newly started process can
+        use information already retrieved by other processes; defaults to True
+    '''
+
+    def __init__(self, local, shared, warm=True):
+        self.local = local
+        self.shared = shared
+        if warm:
+            shared.warm(local)
+
+    def __len__(self):
+        return len(self.shared)
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        value = self.shared.get(key)
+        if value is not None:
+            entry = self.shared.get_entry(key)
+            if entry is not None:
+                self.local.set(key, value, tag=entry.tag, ttl=_expires_in(entry),
+                               etag=entry.etag, last_modified=entry.last_modified)
+            return value
+        return default
+
+    def get_entry(self, key):
+        return self.local.get_entry(key) or self.shared.get_entry(key)
+
+    def refresh(self, key, ttl=None):
+        self.shared.refresh(key, ttl)
+        if self.local.get_entry(key) is not None:
+            self.local.refresh(key, ttl)
+        else:
+            entry = self.shared.get_entry(key)
+            if entry is not None:
+                self.local.set(key, entry.value, tag=entry.tag, ttl=_expires_in(entry),
+                               etag=entry.etag, last_modified=entry.last_modified)
+
+    def set(self, key, value, tag=None, ttl=None, etag=None, last_modified=None):
+        self.shared.set(key, value, tag=tag, ttl=ttl, etag=etag,
+                        last_modified=last_modified)
+        self.local.set(key, value, tag=tag, ttl=ttl, etag=etag,
+                       last_modified=last_modified)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+    def invalidate(self, tag):
+        self.shared.invalidate(tag)
+        self.local.invalidate(tag)
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+    def stats(self):
+        '''Report usage for both cache levels.
+
+        :rtype: dict
+        '''
+        return {'local': self.local.stats(), 'shared': self.shared.stats()}
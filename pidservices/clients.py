@@ -6,37 +6,96 @@ Module contains classes that build clients to interact with the Pidman Applicati
 via services.
 '''
 
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import json
 import logging
 import re
-import urllib
-from urllib.parse import urlparse
+import time
+from urllib.parse import quote, urlencode, urlparse
 import requests
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
 from pidservices import __version__
+from pidservices.bulk import bounded_map, bounded_map_async
+from pidservices.concurrency import AdaptiveLimit
+from pidservices.jsonstream import JSONArrayStream
+from pidservices.records import DomainRecord, PidRecord, TargetRecord, \
+    search_results
+from pidservices.retry import RetryPolicy
+from pidservices.singleflight import SingleFlight, AsyncSingleFlight
+from pidservices.tracing import Span
 
 logger = logging.getLogger(__name__)
 
+# request headers for each combination of http method, accepted content
+# type, and content length header, generated once and shared by all requests
+_REQUEST_HEADERS = {}
+# expected response status codes, as a tuple, for a single status code
+_EXPECTED_RESPONSES = {}
+
 # characters expected to be present in NOID portion of ARKs and PURLs (noid template .zek)
 NOID_CHARACTERS = '0123456789bcdfghjkmnpqrstvwxz'
 ARK_REGEXP = re.compile('^(?P<nma>https?://[a-z./]+/)?ark:/(?P<naan>[0-9]+)/(?P<noid>[%s]+)(?:/(?P<qualifier>.*))?$' % \
     NOID_CHARACTERS, re.IGNORECASE)
+# ordinal value of each noid character, for calculating check characters
+NOID_ORDINALS = dict((char, i) for i, char in enumerate(NOID_CHARACTERS))
+
+def noid_check_character(noid):
+    '''Calculate the NCDA check character for a noid, as generated for the
+    final ``k`` of the ``.zek`` noid template: the sum of the ordinal value
+    of each character in :data:`NOID_CHARACTERS` (other characters count as
+    zero) multiplied by its position, starting at 1, modulo 29.  The check
+    character is calculated over the noid only, not the NAAN.
+
+    :param noid: noid without a check character
+    :returns: check character
+    '''
+    ordinals = NOID_ORDINALS
+    total = 0
+    for position, char in enumerate(noid.lower(), 1):
+        total += ordinals.get(char, 0) * position
+    return NOID_CHARACTERS[total % len(NOID_CHARACTERS)]
+
+def valid_noid(noid):
+    '''Check that the final character of a noid is the correct check
+    character (see :meth:`noid_check_character`).  Detects a mistyped
+    character or two transposed adjacent characters in the noid, and most
+    truncated noids, without making a request.
+
+    :param noid: noid to check, including check character
+    :returns: boolean
+    '''
+    return len(noid) > 1 and noid[-1].lower() == noid_check_character(noid[:-1])
 
-def is_ark(str):
+def is_ark(str, verify=False):
     '''Check if a string matches a regular expression for an ARK, in either
     resolvable url form or short-form id, with or without qualifiers.
 
     :param str: string to check
+    :param verify: if True, also check the noid check character (see
+        :meth:`valid_noid`); defaults to False
     :returns: :class:`re.MatchObject` or None (can be treated as a boolean)
     '''
-    return ARK_REGEXP.match(str)
+    matches = ARK_REGEXP.match(str)
+    if verify and matches is not None and not valid_noid(matches.group('noid')):
+        return None
+    return matches
 
-def parse_ark(ark):
+def parse_ark(ark, verify=False):
     '''Parse an ARK into its component parts.  Uses the same regular expression
     as :meth:`~pidservices.clients.is_ark`; matches both short and resolvable
     ARKs, with and without qualifiers.
 
     :param ark: ARK string to parse
+    :param verify: if True, ARKs with an incorrect noid check character are
+        not matched (see :meth:`valid_noid`); defaults to False
     :returns: dictionary with parsed ARK information or None if the regular
         expression does not match.  Dictionary keys in the return:
 
@@ -45,10 +104,93 @@ def parse_ark(ark):
         - **noid** - Nice Opaque Identifier
         - **qualifier** - qualifier
     '''
-    matches = is_ark(ark)
+    matches = is_ark(ark, verify)
     if matches is not None:
         return matches.groupdict()
 
+#: columns of ARK information returned by :meth:`parse_arks`
+ArkColumns = namedtuple('ArkColumns', ['index', 'nma', 'naan', 'noid', 'qualifier'])
+
+def parse_arks(arks, columnar=False, verify=False):
+    '''Parse many ARKs at once, e.g. identifiers from a large batch of
+    catalog records.  Matches the same ARKs as :meth:`parse_ark`, but
+    strings that cannot be ARKs are rejected with a quick substring check
+    before the regular expression is used, and results are returned as
+    tuples rather than dictionaries, so checking a large number of
+    identifiers is much faster than calling :meth:`parse_ark` on each one.
+
+    :param arks: iterable of strings to parse
+    :param columnar: if True, return the parsed ARKs as columns rather
+        than one tuple per string
+    :param verify: if True, ARKs with an incorrect noid check character are
+        treated as non-ARKs (see :meth:`valid_noid`); defaults to False
+    :returns: if ``columnar`` is False, a list with a tuple of
+        ``(nma, naan, noid, qualifier)`` for each string, or None for strings
+        that are not ARKs.  If ``columnar`` is True, an :class:`ArkColumns`
+        named tuple of lists (index, nma, naan, noid, qualifier) with an entry
+        for each ARK, where index is the position of the ARK in ``arks``.
+    '''
+    match = ARK_REGEXP.match
+    if verify:
+        def match(ark, match=match):
+            m = match(ark)
+            if m is not None and valid_noid(m.group(3)):
+                return m
+    # every ARK contains "ark:/" in some combination of case
+    if not columnar:
+        return [m.groups() if m is not None else None for m in
+                [match(ark) if ('k:/' in ark or 'K:/' in ark) else None for ark in arks]]
+
+    columns = ArkColumns([], [], [], [], [])
+    index, nma, naan, noid, qualifier = [column.append for column in columns]
+    for i, ark in enumerate(arks):
+        if 'k:/' in ark or 'K:/' in ark:
+            m = match(ark)
+            if m is not None:
+                index(i)
+                parts = m.groups()
+                nma(parts[0])
+                naan(parts[1])
+                noid(parts[2])
+                qualifier(parts[3])
+    return columns
+
+def validate_arks(arks):
+    '''Check a batch of ARKs, e.g. from an input file for a migration, and
+    report any that are not valid ARKs or have an incorrect noid check
+    character (e.g. a typo or a truncated ARK), so they can be rejected
+    without making a request for each one.
+
+    :param arks: iterable of ARK strings to check
+    :returns: list of ``(index, ark, reason)`` tuples for each invalid ARK,
+        where index is the position in ``arks`` and reason is either
+        ``not an ARK`` or ``invalid check character``
+    '''
+    invalid = []
+    arks = list(arks)
+    for i, parts in enumerate(parse_arks(arks)):
+        if parts is None:
+            invalid.append((i, arks[i], 'not an ARK'))
+        elif not valid_noid(parts[2]):
+            invalid.append((i, arks[i], 'invalid check character'))
+    return invalid
+
+
+def _single_flight_key(url, params, accept):
+    # identical GET requests have the same url, parameters, and response format
+    return (url, tuple(sorted(params.items())) if params else None, accept)
+
+
+def _content_length(body):
+    # size in bytes of a request body, as sent
+    if body is None:
+        return 0
+    if isinstance(body, dict):
+        body = urlencode(body)
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return len(body)
+
 
 class PidmanRestClient(object):
     """
@@ -65,6 +207,66 @@ class PidmanRestClient(object):
                     ``http://my.domain.com/pidserver``
     :param username: optional username for REST API access
     :param password: optional password
+    :param pool_connections: number of connection pools (one per host) to
+        keep; defaults to 10
+    :param pool_maxsize: maximum number of connections to keep open in each
+        pool; should be at least the number of threads making concurrent
+        requests with this client, or connections will be discarded and
+        re-opened; defaults to 10
+    :param pool_block: if True, requests wait for a free connection when
+        ``pool_maxsize`` connections are in use, rather than opening an
+        additional connection that will not be kept; defaults to False
+    :param keep_alive: keep connections open for reuse by later requests;
+        defaults to True
+    :param retry_policy: :class:`~pidservices.retry.RetryPolicy` for retrying
+        failed requests; by default, idempotent requests are retried using
+        the default policy settings.  Specify False to disable retries.
+    :param method_retry_policies: optional dictionary of retry policies
+        for specific http methods, e.g. ``{'POST': RetryPolicy(methods=['POST'])}``,
+        overriding ``retry_policy``; use None to disable retries for a method
+    :param circuit_breaker: optional :class:`~pidservices.retry.CircuitBreaker`
+        to fail fast while the server is unhealthy
+    :param cache: optional cache, e.g. :class:`~pidservices.cache.LRUCache`,
+        for pid, target, and domain information returned by :meth:`get_pid`,
+        :meth:`get_target`, and :meth:`get_domain`.  Cached information
+        for a pid is invalidated when it is updated or deleted using this
+        client; changes made elsewhere are visible when the cached
+        information expires.
+    :param records: if True, pid, target, and domain information is returned
+        as compact, read-only :mod:`~pidservices.records` objects (e.g.,
+        :class:`~pidservices.records.PidRecord`) that can be accessed like
+        dictionaries, rather than as dictionaries; recommended when holding
+        many search results in memory.  Defaults to False.
+    :param metrics: optional :class:`~pidservices.metrics.ClientMetrics`
+        to record request counts, status codes, bytes sent and received,
+        retries, and latency for each API operation
+    :param tracer: optional :class:`~pidservices.tracing.Tracer` to record
+        a :class:`~pidservices.tracing.Span` for each request, and send a
+        ``traceparent`` header to the server
+    :param hooks: optional dictionary of functions to call for request
+        events, either a single function or a list for each event:
+        ``before_request`` functions are called with the request
+        :class:`~pidservices.tracing.Span` and a dictionary of request
+        headers, which may be modified; ``after_response`` functions are
+        called with the span and the response, or None if the request failed
+        (the exception is available as ``span.error``)
+    :param coalesce: if True, concurrent identical GET requests (e.g., for
+        the same pid from several threads) share a single request to the
+        server and its result or error; results are not kept after the
+        request completes, unless a ``cache`` is configured.  Callers that
+        share a request get the same result object, so should not modify it.
+    :param rate_limiter: optional :class:`~pidservices.ratelimit.RateLimiter`
+        to limit the rate of read and write requests (including retries),
+        e.g. to keep a bulk job within the request rate the pid manager can
+        handle; requests wait until they are allowed.  Time spent waiting
+        is not included in request latency metrics.
+    :param adaptive_limit: optional
+        :class:`~pidservices.concurrency.AdaptiveLimit`, updated with the
+        latency and status of every request (including retries); pass the
+        same limit as ``workers`` to bulk methods such as
+        :meth:`create_pids` or :meth:`iter_search_pages` to adjust their
+        concurrency automatically.  The current limit is reported in
+        ``metrics``.  ``pool_maxsize`` should be at least the limit's maximum.
 
     """
     baseurl = {
@@ -73,6 +275,19 @@ class PidmanRestClient(object):
         'path': None,
     }
     _auth = None
+    retry_policy = None
+    method_retry_policies = {}
+    circuit_breaker = None
+    cache = None
+    records = False
+    metrics = None
+    tracer = None
+    hooks = {}
+    single_flight = None
+    rate_limiter = None
+    adaptive_limit = None
+    #: request events that hook functions can be registered for
+    hook_events = ('before_request', 'after_response')
     # Requests verifies SSL certificates for HTTPS requests, just like a web browser.
     # By default, SSL verification is enabled, and Requests will throw a SSLError if
     # it's unable to verify the certificate.
@@ -92,11 +307,29 @@ class PidmanRestClient(object):
     # The portion of the url that contains this token should be replaced with a noid
     pid_token = '{%PID%}'
 
-    def __init__(self, url, username="", password=""):
+    def __init__(self, url, username="", password="", pool_connections=10,
+                 pool_maxsize=10, pool_block=False, keep_alive=True,
+                 retry_policy=None, method_retry_policies=None, circuit_breaker=None,
+                 cache=None, records=False, metrics=None, tracer=None, hooks=None,
+                 coalesce=False, rate_limiter=None, adaptive_limit=None):
         self._set_baseurl(url)
+        self._set_retry_options(retry_policy, method_retry_policies, circuit_breaker)
+        self.cache = cache
+        self.records = records
+        self.metrics = metrics
+        self._set_hooks(tracer, hooks)
+        if coalesce:
+            self.single_flight = SingleFlight()
+        self.rate_limiter = rate_limiter
+        self.adaptive_limit = adaptive_limit
 
         # create a requests session to be used for all API calls
         self.session = requests.Session()
+        # configure connection pooling for the session
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         # Set headers that should be passed with every request
 
         # Requests verifies SSL certificates for HTTPS requests, just like a web browser.
@@ -106,10 +339,113 @@ class PidmanRestClient(object):
             'User-Agent': 'pidmanclient/%s (python-requests/%s)' % \
                 (__version__, requests.__version__)
         }
+        if not keep_alive:
+            # ask the server to close each connection after the response
+            self.session.headers['Connection'] = 'close'
         # store auth if credentials were specified
         if username and password:
             self._auth = (username, password)
 
+    def _set_retry_options(self, retry_policy=None, method_retry_policies=None,
+                           circuit_breaker=None):
+        # use the default retry policy unless retries are disabled
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy or None
+        self.method_retry_policies = method_retry_policies or {}
+        self.circuit_breaker = circuit_breaker
+
+    def _set_hooks(self, tracer=None, hooks=None):
+        self.tracer = tracer
+        self.hooks = {}
+        for event, funcs in (hooks or {}).items():
+            if callable(funcs):
+                funcs = [funcs]
+            for func in funcs:
+                self.add_hook(event, func)
+
+    def add_hook(self, event, func):
+        '''Register a function to be called for a request event; see the
+        ``hooks`` parameter for details.
+
+        :param event: ``before_request`` or ``after_response``
+        :param func: function to call
+        '''
+        if event not in self.hook_events:
+            raise ValueError('Unsupported hook event: %s' % event)
+        self.hooks.setdefault(event, []).append(func)
+
+    def _start_span(self, operation, method_name, url, noid, headers):
+        '''Start a span for a request, when tracing or hooks are configured,
+        and call any ``before_request`` hooks.  Returns the span and the
+        headers to send, including the trace context header.'''
+        url_template = url.replace('/%s' % noid, '/{noid}', 1) if noid else url
+        if self.tracer is not None:
+            span = self.tracer.start_span(operation, method_name, url, url_template, noid)
+        else:
+            span = Span(operation, method_name, url, url_template, noid)
+        headers = headers.copy()
+        if self.tracer is not None:
+            headers['traceparent'] = span.traceparent
+        try:
+            for hook in self.hooks.get('before_request', ()):
+                hook(span, headers)
+        except BaseException as err:
+            # the request is not sent; end the span with the hook error
+            self._end_span(span, error=err)
+            raise
+        return span, headers
+
+    def _end_span(self, span, response=None, status=None, error=None):
+        '''End a request span, and call any ``after_response`` hooks.'''
+        if self.tracer is not None:
+            self.tracer.end_span(span, status, error)
+        else:
+            span.end(status, error)
+        for hook in self.hooks.get('after_response', ()):
+            hook(span, response)
+
+    def _get_retry_policy(self, method_name):
+        '''Retry policy for requests with the specified http method, or
+        None if those requests should not be retried.'''
+        if method_name in self.method_retry_policies:
+            return self.method_retry_policies[method_name]
+        return self.retry_policy
+
+    def pool_stats(self):
+        '''Report connection pool usage for this client's session, e.g.
+        to check that ``pool_maxsize`` is large enough for the number of
+        threads making requests.  Includes the following keys:
+
+        - **pools** - number of connection pools (one per host)
+        - **requests** - number of requests made with pooled connections
+        - **connections_created** - number of new connections opened
+        - **connections_reused** - number of requests that reused an open
+          connection instead of opening a new one
+        - **idle_connections** - number of open connections currently
+          available for reuse
+
+        :rtype: dict
+        '''
+        stats = dict.fromkeys(['pools', 'requests', 'connections_created',
+                               'connections_reused', 'idle_connections'], 0)
+        adapters = set(self.session.adapters.values())
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats['pools'] += 1
+                stats['requests'] += pool.num_requests
+                stats['connections_created'] += pool.num_connections
+                # pool.pool is a queue of open connections or None placeholders
+                if pool.pool is not None:
+                    stats['idle_connections'] += len([conn for conn in list(pool.pool.queue)
+                                                      if conn is not None])
+        stats['connections_reused'] = max(0, stats['requests'] - stats['connections_created'])
+        return stats
+
     def _set_baseurl(self, url):
         """
         Provides some cleanup for consistency on the input url.  If it has no
@@ -119,9 +455,14 @@ class PidmanRestClient(object):
 
         """
         obj = urlparse(url.rstrip('/'))
-        self.baseurl['scheme'] = obj.scheme
-        self.baseurl['host'] = obj.netloc
-        self.baseurl['path'] = obj.path
+        # set a new dictionary on the instance rather than updating the
+        # class-level default, so that clients for different servers
+        # do not share a base url
+        self.baseurl = {
+            'scheme': obj.scheme,
+            'host': obj.netloc,
+            'path': obj.path,
+        }
 
     def _get_baseurl(self):
         """
@@ -133,9 +474,9 @@ class PidmanRestClient(object):
         """
         Prep an API URL for access based on base url.
         """
-        url_info = self.baseurl.copy()
-        url_info['local_path'] = path.lstrip('/')
-        return '%(scheme)s://%(host)s%(path)s/%(local_path)s' % url_info
+        baseurl = self.baseurl
+        return '%s://%s%s/%s' % (baseurl['scheme'], baseurl['host'], baseurl['path'],
+                                 path.lstrip('/'))
 
     def _check_pid_type(self, type):
         '''Several pid- and target-specific methods take a pid type, but only
@@ -173,48 +514,53 @@ class PidmanRestClient(object):
             'qualifier': qualifier,
         }
 
-    def _make_request(self, reqmeth, url, params=None, body=None,
-        expected_response=requests.codes.ok, accept="application/json"):
-        '''Make an API request.  Common functionality for making http requests
-        and simple error handling.  Defaults are set so that simple access
-        requests can specify very few parameters.
+    def _request_options(self, method_name, params=None, body=None):
+        '''Generate the keyword options for an API request: request body,
+        query string parameters, and authentication when required.
 
-        Checks the returned response status code against the expected response,
-        and raises an :class:`urllib2.HTTPError` if they are not equal.  Otherwise,
-        the response object is returned for any further processing.
-
-        :param url: url to request
-        :param body: data to send in request body, if any (optional)
+        :param method_name: http method name, e.g. ``GET``
         :param params: dictionary of query string or post parameters, if any
-        :param expected_response: expected http status code on the returned
-            response; if the response does not match, an error is raised - can be
-            either a single status code, or a list of valid codes; defaults to 200
-        :param accept: expected/accepted content type in the response; defaults
-            to application/json
-
-        :returns: the content of the response, based on the specified accept
-            format: if accept is ``application/json``, loads the response as JSON
-            and returns the resulting object; if accept is ``text/plain``, returns
-            the body of the response.  Otherwise, returns the
-            :class:`request.Response` response object.
+        :param body: data to send in request body, if any
         '''
-        method_name = reqmeth.__name__.upper()
         request_options = {}
         if body is not None:
             request_options['data'] = body
         if params is not None:
             request_options['params'] = params
-        headers = {}
         # any api calls that modify data require authentication
         if method_name in ['PUT', 'POST', 'DELETE']:
             # only include auth information when required
             request_options['auth'] = self._auth
-
-        # set headers that vary depending on the request
-        # All headers must be strings.
-
-        # - set content length based on the actual body
-        headers["Content-Length"] = str(len(body)) if body is not None else '0'
+        return request_options
+
+    def _request_headers(self, method_name, body=None, accept="application/json",
+                         content_length=True):
+        '''Generate the headers that vary depending on the request.
+        All headers must be strings.  Headers for requests without a body
+        are only generated once, and the same dictionary is returned for
+        every request; it must be copied before it is modified.
+
+        :param method_name: http method name, e.g. ``GET``
+        :param body: data to send in request body, if any
+        :param accept: expected/accepted content type in the response
+        :param content_length: include a ``Content-Length`` header;
+            defaults to True
+        '''
+        key = (method_name, accept, content_length)
+        headers = _REQUEST_HEADERS.get(key)
+        if headers is None:
+            headers = _REQUEST_HEADERS[key] = \
+                self._build_request_headers(method_name, accept, content_length)
+        if body is not None and content_length:
+            # - set content length based on the actual body
+            headers = headers.copy()
+            headers["Content-Length"] = str(len(body))
+        return headers
+
+    def _build_request_headers(self, method_name, accept, content_length):
+        headers = {}
+        if content_length:
+            headers["Content-Length"] = '0'
         # - set content type based on the data being sent (if any)
         # for current implementation, we can make the following assumptions:
         # - all POST methods are currently form-encoded key=>value data
@@ -228,14 +574,135 @@ class PidmanRestClient(object):
 
         # - expected result format
         headers['Accept'] = accept
+        return headers
+
+    def _make_request(self, reqmeth, url, params=None, body=None,
+        expected_response=requests.codes.ok, accept="application/json",
+        cache_key=None, cache_tag=None, invalidate_cache=None, stream=False,
+        record=None, operation=None, noid=None):
+        '''Make an API request.  Common functionality for making http requests
+        and simple error handling.  Defaults are set so that simple access
+        requests can specify very few parameters.
+
+        Checks the returned response status code against the expected response,
+        and raises an :class:`urllib2.HTTPError` if they are not equal.  Otherwise,
+        the response object is returned for any further processing.
+
+        :param url: url to request
+        :param body: data to send in request body, if any (optional)
+        :param params: dictionary of query string or post parameters, if any
+        :param expected_response: expected http status code on the returned
+            response; if the response does not match, an error is raised - can be
+            either a single status code, or a list of valid codes; defaults to 200
+        :param accept: expected/accepted content type in the response; defaults
+            to application/json
+        :param cache_key: if a cache is configured, key for caching the
+            JSON response (optional); an expired cached response is
+            revalidated with a conditional request, if possible
+        :param cache_tag: tag for invalidating the cached response (optional)
+        :param invalidate_cache: tag for cached responses that should be
+            invalidated by this request (optional)
+        :param stream: if True, the response body is not read, and the
+            :class:`request.Response` is returned for the caller to read
+            incrementally; defaults to False
+        :param record: function to convert the JSON response to
+            :mod:`~pidservices.records` objects, used when :attr:`records`
+            is enabled (optional); cached responses are stored unconverted
+        :param operation: name of the API operation, e.g. ``get_pid``, for
+            recording :attr:`metrics` and tracing; defaults to the http
+            method name
+        :param noid: noid the request is for, if any, for tracing
+
+        :returns: the content of the response, based on the specified accept
+            format: if accept is ``application/json``, loads the response as JSON
+            and returns the resulting object; if accept is ``text/plain``, returns
+            the body of the response.  Otherwise, returns the
+            :class:`request.Response` response object.
+        '''
+        stale_entry = None
+        if cache_key is not None and self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if self.metrics is not None:
+                    self.metrics.record_cache_hit(operation or reqmeth.__name__.lower())
+                return self._record(cached, record)
+            stale_entry = self._revalidatable_entry(cache_key)
+
+        method_name = reqmeth.__name__.upper()
+        operation = operation or method_name.lower()
+        request_args = (reqmeth, method_name, url, params, body, expected_response,
+                        accept, cache_key, cache_tag, invalidate_cache, stream,
+                        operation, noid, stale_entry)
+        if self.single_flight is not None and method_name == 'GET' and not stream:
+            result, shared = self.single_flight.do(
+                _single_flight_key(url, params, accept), self._request, *request_args)
+            if shared and self.metrics is not None:
+                self.metrics.record_coalesced(operation)
+        else:
+            result = self._request(*request_args)
+        return self._record(result, record)
+
+    def _request(self, reqmeth, method_name, url, params, body, expected_response,
+                 accept, cache_key, cache_tag, invalidate_cache, stream, operation,
+                 noid, stale_entry):
+        '''Send an API request that was not answered from the cache, and
+        return the content of the response, as described for
+        :meth:`_make_request`; JSON responses are returned as loaded,
+        without converting to records.'''
+        request_options = self._request_options(method_name, params, body)
+        if stream:
+            request_options['stream'] = True
+        headers = self._request_headers(method_name, body, accept)
 
         # absolutize url based on configured pidman base url
         url = self.absolute_url(url)
-        logger.debug('Request: %s %s %s <![BODY[%s]]>', method_name, url, headers, body)
-        response = reqmeth(url, headers=headers, **request_options)
-        # convert expected response code into list for simpler comparison
-        if not isinstance(expected_response, list):
-            expected_response = [expected_response]
+        # convert expected response code into a sequence for simpler comparison
+        expected_response = self._expected_responses(expected_response)
+        if stale_entry is not None:
+            headers, expected_response = self._add_conditional_headers(
+                headers, stale_entry, expected_response)
+
+        if self.rate_limiter is not None:
+            self._wait_for_rate_limit(method_name, operation)
+        span = None
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+        try:
+            if self.tracer is not None or self.hooks:
+                span, headers = self._start_span(operation, method_name, url, noid,
+                                                 headers)
+            response = self._send(reqmeth, method_name, url, headers, request_options,
+                                  expected_response, body, operation)
+        except BaseException as err:
+            # record every request that does not get a response, including
+            # errors from hooks or the circuit breaker, and interrupts
+            if metrics is not None:
+                self._record_metrics(operation, started, type(err).__name__, body)
+            if span is not None:
+                self._end_span(span, error=err)
+            raise
+        finally:
+            # invalidate whether or not the request succeeded, since
+            # the outcome of a failed update may not be known
+            if invalidate_cache is not None and self.cache is not None:
+                self.cache.invalidate(invalidate_cache)
+
+        if metrics is not None:
+            if stream:
+                # don't read a streamed response to find its size
+                received = int(response.headers.get('Content-Length') or 0)
+            else:
+                received = len(response.content or b'')
+            self._record_metrics(operation, started, response.status_code, body, received)
+        if span is not None:
+            self._end_span(span, response, response.status_code)
+
+        if stale_entry is not None and \
+          response.status_code == requests.codes.not_modified:
+            # cached value is still current
+            self.cache.refresh(cache_key)
+            return stale_entry.value
 
         if response.status_code not in expected_response:
             # Some errors (e.g., bad request) include a more detailed error
@@ -248,13 +715,128 @@ class PidmanRestClient(object):
                 # otherwise let requests raise the error
                 response.raise_for_status()
 
-        if accept == 'application/json':
-            return response.json()
+        if stream:
+            return response
+        elif accept == 'application/json':
+            result = response.json()
+            if cache_key is not None and self.cache is not None:
+                self.cache.set(cache_key, result, tag=cache_tag,
+                               etag=response.headers.get('ETag'),
+                               last_modified=response.headers.get('Last-Modified'))
+            return result
         elif accept == 'text/plain':
             return response.content
         else:
             return response
 
+    def _record_metrics(self, operation, started, status, body, received=0):
+        # record a completed request with the configured metrics
+        self.metrics.record_request(operation, status, time.perf_counter() - started,
+                                    bytes_sent=_content_length(body),
+                                    bytes_received=received)
+
+    def _wait_for_rate_limit(self, method_name, operation):
+        # wait until the rate limiter allows a request
+        wait = self.rate_limiter.acquire(method_name)
+        if wait and self.metrics is not None:
+            self.metrics.record_rate_limited(operation, wait)
+
+    def _record_outcome(self, sent, status):
+        # update the adaptive concurrency limit with a request attempt
+        limit = self.adaptive_limit.record(time.perf_counter() - sent, status)
+        if self.metrics is not None:
+            self.metrics.record_concurrency_limit(limit)
+
+    def _record(self, result, record):
+        # convert a JSON result to record objects, if enabled
+        if record is not None and self.records:
+            return record(result)
+        return result
+
+    def _revalidatable_entry(self, cache_key):
+        # expired cache entry with validators for a conditional request, if any
+        get_entry = getattr(self.cache, 'get_entry', None)
+        if get_entry is not None:
+            entry = get_entry(cache_key)
+            if entry is not None and entry.revalidatable:
+                return entry
+
+    def _expected_responses(self, expected_response):
+        # expected status codes as a sequence; a tuple for a single status
+        # code is only created once
+        if isinstance(expected_response, (list, tuple)):
+            return expected_response
+        expected = _EXPECTED_RESPONSES.get(expected_response)
+        if expected is None:
+            expected = _EXPECTED_RESPONSES[expected_response] = (expected_response, )
+        return expected
+
+    def _add_conditional_headers(self, headers, entry, expected_response):
+        '''Add conditional request headers to a copy of the request headers
+        to revalidate an expired cache entry.  Returns the updated headers and
+        expected response codes, updated to allow a 304 Not Modified response.'''
+        headers = headers.copy()
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers, tuple(expected_response) + (requests.codes.not_modified, )
+
+    def _send(self, reqmeth, method_name, url, headers, request_options,
+              expected_response, body=None, operation=None):
+        '''Send a request, retrying according to the retry policy for the
+        request method, and checking the circuit breaker if configured.
+        Returns the final :class:`requests.Response`.'''
+        retry_policy = self._get_retry_policy(method_name)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        attempt = 0
+        while True:
+            attempt += 1
+            # the first attempt is rate limited before the request is timed
+            if attempt > 1 and self.rate_limiter is not None:
+                self._wait_for_rate_limit(method_name, operation or method_name.lower())
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request()
+            if debug:
+                logger.debug('Request: %s %s %s <![BODY[%s]]>', method_name, url,
+                             headers, body)
+            if self.adaptive_limit is not None:
+                sent = time.perf_counter()
+            try:
+                response = reqmeth(url, headers=headers, **request_options)
+            except requests.exceptions.RequestException as err:
+                if self.adaptive_limit is not None:
+                    self._record_outcome(sent, type(err).__name__)
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+                if retry_policy is None or \
+                  not retry_policy.retry_exception(method_name, err, attempt):
+                    raise
+                logger.warning('Retrying %s %s after error (attempt %d): %s',
+                               method_name, url, attempt, err)
+                if self.metrics is not None:
+                    self.metrics.record_retry(operation or method_name.lower())
+                retry_policy.sleep(attempt)
+                continue
+
+            if self.adaptive_limit is not None:
+                self._record_outcome(sent, response.status_code)
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_response(response.status_code)
+            if response.status_code not in expected_response and \
+              retry_policy is not None and \
+              retry_policy.retry_response(method_name, response.status_code, attempt):
+                logger.warning('Retrying %s %s after %s response (attempt %d)',
+                               method_name, url, response.status_code, attempt)
+                if self.metrics is not None:
+                    self.metrics.record_retry(operation or method_name.lower())
+                # return the connection to the pool, even if the response
+                # body was not read (e.g., for a streamed request)
+                response.close()
+                retry_policy.sleep(attempt, response.headers)
+                continue
+            return response
+
     def get(self, *args, **kwargs):
         return self._make_request(self.session.get, *args, **kwargs)
 
@@ -273,7 +855,8 @@ class PidmanRestClient(object):
         """
         Returns the default domain list from the rest server.
         """
-        return self.get(self.domain_url)
+        return self.get(self.domain_url, record=DomainRecord.from_list,
+                        operation='list_domains')
 
     def create_domain(self, name, policy=None, parent=None):
         """
@@ -299,7 +882,7 @@ class PidmanRestClient(object):
 
         # returns the URI for the newly-created domain on success
         return self.post(self.domain_url, body=domain_info, expected_response=requests.codes.created,
-                         accept='text/plain')
+                         accept='text/plain', operation='create_domain')
 
     def get_domain(self, domain_id):
         """
@@ -308,8 +891,10 @@ class PidmanRestClient(object):
         :param domain_id: ID of the domain to return.
 
         """
-        url = '%s%s/' % (self.domain_url, urllib.quote(str(domain_id)))
-        return self.get(url)
+        url = '%s%s/' % (self.domain_url, quote(str(domain_id)))
+        return self.get(url, cache_key=('domain', str(domain_id)),
+                        cache_tag=('domain', str(domain_id)),
+                        record=DomainRecord.from_dict, operation='get_domain')
 
     def update_domain(self, domain_id, name=None, policy=None, parent=None):
         """
@@ -330,14 +915,15 @@ class PidmanRestClient(object):
             domain_info['parent'] = parent
 
         # Setup the data to pass in the request.
-        url = '%s%s/' % (self.domain_url, urllib.quote(str(domain_id)))
+        url = '%s%s/' % (self.domain_url, quote(str(domain_id)))
         body = json.dumps(domain_info)
 
         if not domain_info:
             raise Exception("No domain update data specified")
 
         # If successful the view returns the object just updated.
-        return self.put(url, body=body)
+        return self.put(url, body=body, invalidate_cache=('domain', str(domain_id)),
+                        record=DomainRecord.from_dict, operation='update_domain')
 
     def search_pids(self, pid=None, type=None, target=None, domain=None,
             domain_uri=None, page=None, count=None):
@@ -354,11 +940,128 @@ class PidmanRestClient(object):
 
         """
         # generate a dictionary with any parameters that are set
-        query = dict([(key, val) for key, val in locals().iteritems() if
+        query = dict([(key, val) for key, val in locals().items() if
                       key not in ['self'] and val])
 
         url = 'pids/'
-        return self.get(url, params=query)
+        return self.get(url, params=query, record=search_results,
+                        operation='search_pids')
+
+    def stream_search_pids(self, pid=None, type=None, target=None, domain=None,
+            domain_uri=None, page=None, count=None, chunk_size=65536):
+        """
+        Queries the PID search api, like :meth:`search_pids`, but decodes the
+        response incrementally as it is received and generates each pid in
+        the results as soon as it has been decoded, so that memory use
+        stays low even for a very large page of results.
+
+        Takes the same search parameters as :meth:`search_pids`.  Other
+        values in the search response (e.g., ``page_count``) are available
+        in the ``fields`` dictionary of the returned
+        :class:`~pidservices.jsonstream.JSONArrayStream`; values that
+        follow the results in the response are only available after all
+        results have been read.
+
+        :param chunk_size: number of bytes to read from the response at a time
+        :returns: :class:`~pidservices.jsonstream.JSONArrayStream` iterator
+            of pid search results
+        """
+        query = dict([(key, val) for key, val in locals().items() if
+                      key not in ['self', 'chunk_size'] and val])
+        response = self.get('pids/', params=query, stream=True,
+                            operation='stream_search_pids')
+        return JSONArrayStream(response.iter_content(chunk_size), key='results',
+                               close=response.close,
+                               item=PidRecord.from_dict if self.records else None)
+
+    def iter_search_pages(self, pid=None, type=None, target=None, domain=None,
+            domain_uri=None, count=None, workers=4, ordered=True):
+        """
+        Iterate over all the pages of results for a PID search, e.g. to scan
+        every pid in a domain.  Takes the same search parameters as
+        :meth:`search_pids`.  After the first page is retrieved, the remaining
+        pages (based on the ``page_count`` in the first response) are
+        requested concurrently.  Using a moderate page ``count`` with several
+        workers is generally faster than requesting a few very large pages.
+
+        :param count: Number of results to request on a single page.
+        :param workers: maximum number of pages to request concurrently, or
+            an :class:`~pidservices.concurrency.AdaptiveLimit`
+        :param ordered: if True (the default), pages are generated in page
+            order; otherwise, each page is generated as soon as it is received
+        :returns: generator of tuples of page number and search results for
+            that page, as returned by :meth:`search_pids`
+        """
+        search_opts = {'pid': pid, 'type': type, 'target': target,
+                       'domain': domain, 'domain_uri': domain_uri, 'count': count}
+
+        def search_page(page):
+            return page, self.search_pids(page=page, **search_opts)
+
+        page, data = search_page(1)
+        page_count = data.get('page_count', 1)
+        yield page, data
+
+        for page_data in bounded_map(search_page, range(2, page_count + 1),
+                                     workers=workers, ordered=ordered):
+            yield page_data
+
+    def iter_search_pids(self, pid=None, type=None, target=None, domain=None,
+            domain_uri=None, count=None, prefetch=True, workers=1, ordered=True):
+        """
+        Iterate over all the results for a PID search, one pid at a time,
+        requesting pages of results from the search api as needed.  Takes
+        the same search parameters as :meth:`search_pids`.
+
+        By default, the next page of results is requested in the background
+        while the current page is being processed, so no more than two pages
+        of results are held in memory at once.  To scan a large result set
+        more quickly, specify multiple ``workers`` to request pages
+        concurrently; see :meth:`iter_search_pages`.
+
+        :param count: Number of results to request on a single page.
+        :param prefetch: request the next page in the background; defaults
+            to True
+        :param workers: number of pages to request concurrently, or an
+            :class:`~pidservices.concurrency.AdaptiveLimit`; defaults to 1
+        :param ordered: when using multiple workers, whether results should
+            be generated in page order (the default), or as each page is received
+        :returns: generator of pid search results
+        """
+        search_opts = {'pid': pid, 'type': type, 'target': target,
+                       'domain': domain, 'domain_uri': domain_uri, 'count': count}
+
+        if isinstance(workers, AdaptiveLimit) or workers > 1:
+            for page, data in self.iter_search_pages(workers=workers,
+                                                     ordered=ordered, **search_opts):
+                for result in data['results']:
+                    yield result
+            return
+
+        def search_page(page):
+            return self.search_pids(page=page, **search_opts)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = 1
+            data = search_page(page)
+            while True:
+                more_pages = page < data.get('page_count', 1)
+                if more_pages and prefetch:
+                    # run in the current context, e.g. for tracing
+                    next_page = executor.submit(contextvars.copy_context().run,
+                                                search_page, page + 1)
+
+                for result in data['results']:
+                    yield result
+
+                if not more_pages:
+                    break
+                page += 1
+                data = next_page.result() if prefetch else search_page(page)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
 
     def create_pid(self, type, domain, target_uri, name=None, external_system=None,
                 external_system_key=None, policy=None, proxy=None,
@@ -399,7 +1102,7 @@ class PidmanRestClient(object):
 
         # on success, returns new purl or ark in resolvable form as plain text
         return self.post(url, body=pid_opts, expected_response=requests.codes.created,
-                         accept='text/plain')
+                         accept='text/plain', operation='create_pid')
 
     def create_purl(self, *args, **kwargs):
         '''Convenience method to create a new PURL.  See :meth:`create_pid` for
@@ -411,6 +1114,61 @@ class PidmanRestClient(object):
         details and supported parameters.'''
         return self.create_pid('ark', *args, **kwargs)
 
+    def _create_pid_spec(self, spec):
+        # create a pid from a single set of create_pid arguments:
+        # a dictionary of keyword arguments or a sequence of positional arguments
+        if isinstance(spec, dict):
+            return self.create_pid(**spec)
+        return self.create_pid(*spec)
+
+    def iter_create_pids(self, specs, workers=4, ordered=True):
+        '''Create pids concurrently; generator version of :meth:`create_pids`.
+        Results are generated as the pids are created, so they can be recorded
+        while a large batch is still in progress.
+
+        :param specs: iterable of :meth:`create_pid` arguments, as described
+            for :meth:`create_pids`
+        :param workers: maximum number of create requests to run
+            concurrently, or an :class:`~pidservices.concurrency.AdaptiveLimit`
+        :param ordered: if True (the default), generate results in the same
+            order as ``specs``; otherwise, results are generated as soon as
+            each request completes, as a tuple of spec and result
+        '''
+        if ordered:
+            return bounded_map(self._create_pid_spec, specs, workers=workers,
+                               return_exceptions=True)
+        return bounded_map(lambda spec: (spec, self._create_pid_spec(spec)),
+                           specs, workers=workers, ordered=False,
+                           return_exceptions=True)
+
+    def create_pids(self, specs, workers=4):
+        '''Create a batch of pids, running up to ``workers`` create requests
+        concurrently on the shared session.  To avoid opening a new
+        connection for each request, ``workers`` should be no more than
+        the session connection pool size.
+
+        Each item in ``specs`` is a set of :meth:`create_pid` arguments,
+        either a dictionary of keyword arguments or a tuple of positional
+        arguments, e.g.::
+
+            client.create_pids([
+                {'type': 'ark', 'domain': domain, 'target_uri': uri, 'name': name}
+                for uri, name in items
+            ], workers=8)
+
+        A failure to create one pid does not stop the rest of the batch;
+        instead, the exception is returned as the result for that item.
+
+        :param specs: iterable of :meth:`create_pid` arguments
+        :param workers: maximum number of create requests to run
+            concurrently, or an :class:`~pidservices.concurrency.AdaptiveLimit`
+        :returns: list of newly created pids in resolvable form, in the same
+            order as ``specs``, with an exception in place of any pid that
+            could not be created
+        :rtype: list
+        '''
+        return list(self.iter_create_pids(specs, workers=workers))
+
     def get_pid(self, type, noid):
         """Get information about a single pid, identified by type and noid.
 
@@ -420,7 +1178,8 @@ class PidmanRestClient(object):
         """
         # rest url for accessing the requested pid
         url = self._pid_url(type, noid)       # also checks pid type
-        return self.get(url)
+        return self.get(url, cache_key=('pid', type, noid), cache_tag=(type, noid),
+                        record=PidRecord.from_dict, operation='get_pid', noid=noid)
 
     def get_purl(self, noid):
         '''Convenience method to access information about a purl.  See
@@ -443,7 +1202,9 @@ class PidmanRestClient(object):
         '''
         # generate target url and check pid type
         url = self._target_url(type, noid, qualifier)
-        return self.get(url)
+        return self.get(url, cache_key=('target', type, noid, qualifier),
+                        cache_tag=(type, noid), record=TargetRecord.from_dict,
+                        operation='get_target', noid=noid)
 
     def get_purl_target(self, noid):
         'Convenience method to retrieve information about a purl target.'
@@ -490,7 +1251,8 @@ class PidmanRestClient(object):
         # Setup the data to pass in the request.
         data = json.dumps(pid_info)
         # If successful the view returns the object just updated.
-        return self.put(url, body=data)
+        return self.put(url, body=data, invalidate_cache=(type, noid),
+                        record=PidRecord.from_dict, operation='update_pid', noid=noid)
 
     def update_purl(self, *args, **kwargs):
         '''Convenience method to update an existing purl.  See :meth:`update_pid`
@@ -541,7 +1303,9 @@ class PidmanRestClient(object):
 
         # Setup the data to pass in the request.
         data = json.dumps(target_info)
-        return self.put(url, body=data, expected_response=success_codes)
+        return self.put(url, body=data, expected_response=success_codes,
+                        invalidate_cache=(type, noid), record=TargetRecord.from_dict,
+                        operation='update_target', noid=noid)
 
     def update_purl_target(self, noid, *args, **kwargs):
         '''Convenience method to update a single existing purl target.  See
@@ -565,6 +1329,481 @@ class PidmanRestClient(object):
         pid_type = 'ark'
         # generate target url and check pid type
         url = self._target_url(pid_type, noid, qualifier)
-        self.delete(url, accept='text/plain')
+        self.delete(url, accept='text/plain', invalidate_cache=(pid_type, noid),
+                    operation='delete_ark_target', noid=noid)
+        # no processing to do with the response - if status code was 200, success
+        return True
+
+
+class AsyncPidmanRestClient(PidmanRestClient):
+    """
+    Asyncio version of :class:`PidmanRestClient`, for making many pidman
+    API calls concurrently from a single event loop.  Requires
+    `aiohttp <https://docs.aiohttp.org/>`_.
+
+    Provides the same API methods as :class:`PidmanRestClient` (e.g.
+    :meth:`~PidmanRestClient.create_pid`, :meth:`~PidmanRestClient.get_pid`,
+    :meth:`~PidmanRestClient.search_pids`, and the domain methods) with the
+    same parameters, but each API method returns a coroutine which must be
+    awaited.  Errors are reported in the same way, as a
+    :class:`requests.exceptions.HTTPError` when the response status does not
+    match the expected response.  Invalid parameters (e.g., an unknown pid type)
+    are still checked, and raise an exception, when the method is called.
+
+    All API calls share a single :class:`aiohttp.ClientSession` and connection
+    pool, which is created on first use; call :meth:`close` when done, or use
+    the client as an asynchronous context manager::
+
+        async with AsyncPidmanRestClient(url, username, password) as client:
+            arks = await asyncio.gather(*[client.create_ark(domain, target)
+                                          for target in targets])
+
+    :param baseurl: base url of the api for the pidman REST service., e.g.
+                    ``http://my.domain.com/pidserver``
+    :param username: optional username for REST API access
+    :param password: optional password
+    :param limit: maximum number of simultaneous connections in the shared
+        connection pool; defaults to 100
+    :param limit_per_host: maximum number of simultaneous connections to
+        the same host; defaults to 0 (no limit beyond ``limit``)
+    :param keep_alive: keep connections open for reuse by later requests;
+        defaults to True
+    :param retry_policy: retry policy, as for :class:`PidmanRestClient`
+    :param method_retry_policies: per-method retry policies, as for
+        :class:`PidmanRestClient`
+    :param circuit_breaker: optional circuit breaker, as for
+        :class:`PidmanRestClient`
+    :param cache: optional cache, as for :class:`PidmanRestClient`
+    :param records: return record objects, as for :class:`PidmanRestClient`
+    :param metrics: optional metrics, as for :class:`PidmanRestClient`
+    :param tracer: optional tracer, as for :class:`PidmanRestClient`; requests
+        made by tasks started within :meth:`~pidservices.tracing.Tracer.span`
+        are traced as its children
+    :param hooks: optional request event hooks, as for :class:`PidmanRestClient`
+    :param coalesce: share concurrent identical GET requests between tasks,
+        as for :class:`PidmanRestClient`
+    :param rate_limiter: optional rate limiter, as for :class:`PidmanRestClient`;
+        tasks wait for a request to be allowed without blocking the event loop
+    :param adaptive_limit: optional adaptive concurrency limit, as for
+        :class:`PidmanRestClient`
+    """
+
+    def __init__(self, url, username="", password="", limit=100,
+                 limit_per_host=0, keep_alive=True, retry_policy=None,
+                 method_retry_policies=None, circuit_breaker=None, cache=None,
+                 records=False, metrics=None, tracer=None, hooks=None, coalesce=False,
+                 rate_limiter=None, adaptive_limit=None):
+        if aiohttp is None:
+            raise ImportError('AsyncPidmanRestClient requires aiohttp')
+
+        self._set_baseurl(url)
+        self._set_retry_options(retry_policy, method_retry_policies, circuit_breaker)
+        self.cache = cache
+        self.records = records
+        self.metrics = metrics
+        self._set_hooks(tracer, hooks)
+        if coalesce:
+            self.single_flight = AsyncSingleFlight()
+        self.rate_limiter = rate_limiter
+        self.adaptive_limit = adaptive_limit
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keep_alive = keep_alive
+        # connection pool usage, counted by session trace callbacks
+        self._pool_counts = dict.fromkeys(['requests', 'connections_created',
+                                           'connections_reused'], 0)
+        self._pool_hosts = set()
+        # aiohttp session must be created from within a running event loop,
+        # so it is initialized on first request; see _get_session
+        self.session = None
+        # store auth if credentials were specified
+        if username and password:
+            self._auth = aiohttp.BasicAuth(username, password)
+
+    def _get_session(self):
+        '''Return the shared :class:`aiohttp.ClientSession`, creating it
+        if it has not yet been initialized or has been closed.'''
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             force_close=not self.keep_alive)
+            self.session = aiohttp.ClientSession(connector=connector, headers={
+                'User-Agent': 'pidmanclient/%s (aiohttp/%s)' % \
+                    (__version__, aiohttp.__version__)
+            }, trace_configs=[self._pool_trace_config()])
+        return self.session
+
+    def _pool_trace_config(self):
+        # count requests and connections for pool_stats
+        counts = self._pool_counts
+
+        async def request_start(session, context, params):
+            counts['requests'] += 1
+            self._pool_hosts.add((params.url.scheme, params.url.host, params.url.port))
+
+        async def connection_created(session, context, params):
+            counts['connections_created'] += 1
+
+        async def connection_reused(session, context, params):
+            counts['connections_reused'] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(request_start)
+        trace_config.on_connection_create_end.append(connection_created)
+        trace_config.on_connection_reuseconn.append(connection_reused)
+        return trace_config
+
+    def pool_stats(self):
+        '''Report connection pool usage for this client's
+        :class:`aiohttp.TCPConnector`, with the same keys as
+        :meth:`PidmanRestClient.pool_stats`, e.g. to check that ``limit`` is
+        large enough for the number of concurrent tasks; **pools** is the
+        number of hosts requested.  Counts include requests made by sessions
+        that have since been closed.
+
+        :rtype: dict
+        '''
+        stats = dict(self._pool_counts, pools=len(self._pool_hosts), idle_connections=0)
+        if self.session is not None and not self.session.closed:
+            # open connections available for reuse, for each host
+            idle = getattr(self.session.connector, '_conns', {})
+            stats['idle_connections'] = sum(len(conns) for conns in idle.values())
+        return stats
+
+    async def close(self):
+        '''Close the shared session and any open connections.'''
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _make_request(self, method_name, url, params=None, body=None,
+        expected_response=requests.codes.ok, accept="application/json",
+        cache_key=None, cache_tag=None, invalidate_cache=None, stream=False,
+        record=None, operation=None, noid=None):
+        '''Make an API request.  Asynchronous equivalent of
+        :meth:`PidmanRestClient._make_request`, with the same parameters,
+        except that the request method is specified by name (e.g. ``GET``).
+
+        :returns: the content of the response, based on the specified accept
+            format: if accept is ``application/json``, loads the response as JSON
+            and returns the resulting object; if accept is ``text/plain``, returns
+            the body of the response.  Otherwise, returns the
+            :class:`aiohttp.ClientResponse` response object, with the body
+            already read unless ``stream`` is True.
+        '''
+        stale_entry = None
+        if cache_key is not None and self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if self.metrics is not None:
+                    self.metrics.record_cache_hit(operation or method_name.lower())
+                return self._record(cached, record)
+            stale_entry = self._revalidatable_entry(cache_key)
+
+        operation = operation or method_name.lower()
+        request_args = (method_name, url, params, body, expected_response, accept,
+                        cache_key, cache_tag, invalidate_cache, stream, operation, noid,
+                        stale_entry)
+        if self.single_flight is not None and method_name == 'GET' and not stream:
+            result, shared = await self.single_flight.do(
+                _single_flight_key(url, params, accept), self._request, *request_args)
+            if shared and self.metrics is not None:
+                self.metrics.record_coalesced(operation)
+        else:
+            result = await self._request(*request_args)
+        return self._record(result, record)
+
+    async def _request(self, method_name, url, params, body, expected_response, accept,
+                       cache_key, cache_tag, invalidate_cache, stream, operation, noid,
+                       stale_entry):
+        '''Asynchronous equivalent of :meth:`PidmanRestClient._request`.'''
+        request_options = self._request_options(method_name, params, body)
+        # aiohttp calculates content length from the data actually sent
+        headers = self._request_headers(method_name, body, accept,
+                                        content_length=False)
+
+        # absolutize url based on configured pidman base url
+        url = self.absolute_url(url)
+        # convert expected response code into a sequence for simpler comparison
+        expected_response = self._expected_responses(expected_response)
+        if stale_entry is not None:
+            headers, expected_response = self._add_conditional_headers(
+                headers, stale_entry, expected_response)
+
+        if self.rate_limiter is not None:
+            await self._wait_for_rate_limit(method_name, operation)
+        span = None
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+        try:
+            if self.tracer is not None or self.hooks:
+                span, headers = self._start_span(operation, method_name, url, noid,
+                                                 headers)
+            response, content = await self._send(method_name, url, headers,
+                                                 request_options, expected_response,
+                                                 body, operation, stream)
+        except BaseException as err:
+            # including cancellation of the task making the request
+            if metrics is not None:
+                self._record_metrics(operation, started, type(err).__name__, body)
+            if span is not None:
+                self._end_span(span, error=err)
+            raise
+        finally:
+            if invalidate_cache is not None and self.cache is not None:
+                self.cache.invalidate(invalidate_cache)
+
+        if metrics is not None:
+            if content is None:
+                # don't read a streamed response to find its size
+                received = int(response.headers.get('Content-Length') or 0)
+            else:
+                received = len(content)
+            self._record_metrics(operation, started, response.status, body, received)
+        if span is not None:
+            self._end_span(span, response, response.status)
+
+        if stale_entry is not None and \
+          response.status == requests.codes.not_modified:
+            # cached value is still current
+            self.cache.refresh(cache_key)
+            return stale_entry.value
+
+        if response.status not in expected_response:
+            # Some errors (e.g., bad request) include a more detailed error
+            # message in response body - if present, add to error message detail
+            if content is not None and len(content):
+                detail = '%s: %s' % (response.status, content)
+            else:
+                # otherwise use the same message requests would raise
+                detail = '%s %s Error: %s for url: %s' % \
+                    (response.status,
+                     'Client' if response.status < 500 else 'Server',
+                     response.reason, url)
+            raise requests.exceptions.HTTPError(detail, response=response)
+
+        if stream:
+            return response
+        elif accept == 'application/json':
+            result = json.loads(content)
+            if cache_key is not None and self.cache is not None:
+                self.cache.set(cache_key, result, tag=cache_tag,
+                               etag=response.headers.get('ETag'),
+                               last_modified=response.headers.get('Last-Modified'))
+            return result
+        elif accept == 'text/plain':
+            return content
+        else:
+            return response
+
+    async def _send(self, method_name, url, headers, request_options,
+                    expected_response, body=None, operation=None, stream=False):
+        '''Send a request, retrying according to the retry policy for the
+        request method, and checking the circuit breaker if configured.
+        Returns the final response and its content; when ``stream`` is True,
+        the content of an expected response is not read, and is None.'''
+        retry_policy = self._get_retry_policy(method_name)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        attempt = 0
+        while True:
+            attempt += 1
+            if attempt > 1 and self.rate_limiter is not None:
+                await self._wait_for_rate_limit(method_name,
+                                                operation or method_name.lower())
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request()
+            if debug:
+                logger.debug('Request: %s %s %s <![BODY[%s]]>', method_name, url,
+                             headers, body)
+            if self.adaptive_limit is not None:
+                sent = time.perf_counter()
+            try:
+                if stream:
+                    response, content = await self._open_stream(
+                        method_name, url, headers, request_options, expected_response)
+                else:
+                    async with self._get_session().request(method_name, url,
+                                                           headers=headers,
+                                                           **request_options) as response:
+                        content = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as client_err:
+                if self.adaptive_limit is not None:
+                    self._record_outcome(sent, type(client_err).__name__)
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+                # report connection problems as requests errors, so they can
+                # be handled the same way as for the synchronous client
+                err = requests.exceptions.ConnectionError(client_err)
+                if retry_policy is None or \
+                  not retry_policy.retry_exception(method_name, err, attempt):
+                    raise err from client_err
+                logger.warning('Retrying %s %s after error (attempt %d): %s',
+                               method_name, url, attempt, err)
+                if self.metrics is not None:
+                    self.metrics.record_retry(operation or method_name.lower())
+                await asyncio.sleep(retry_policy.delay(attempt))
+                continue
+
+            if self.adaptive_limit is not None:
+                self._record_outcome(sent, response.status)
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_response(response.status)
+            if response.status not in expected_response and \
+              retry_policy is not None and \
+              retry_policy.retry_response(method_name, response.status, attempt):
+                logger.warning('Retrying %s %s after %s response (attempt %d)',
+                               method_name, url, response.status, attempt)
+                if self.metrics is not None:
+                    self.metrics.record_retry(operation or method_name.lower())
+                await asyncio.sleep(retry_policy.delay(attempt, response.headers))
+                continue
+            return response, content
+
+    async def _open_stream(self, method_name, url, headers, request_options,
+                           expected_response):
+        # send a request without reading the body of an expected response,
+        # so it can be read incrementally; other responses (e.g., errors to
+        # report or retry) are read and released
+        response = await self._get_session().request(method_name, url, headers=headers,
+                                                     **request_options)
+        if response.status in expected_response:
+            return response, None
+        try:
+            return response, await response.read()
+        finally:
+            response.release()
+
+    async def _wait_for_rate_limit(self, method_name, operation):
+        # wait until the rate limiter allows a request
+        wait = await self.rate_limiter.acquire_async(method_name)
+        if wait and self.metrics is not None:
+            self.metrics.record_rate_limited(operation, wait)
+
+    def get(self, *args, **kwargs):
+        return self._make_request('GET', *args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        return self._make_request('PUT', *args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self._make_request('POST', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._make_request('DELETE', *args, **kwargs)
+
+    async def iter_create_pids(self, specs, workers=10, ordered=True):
+        '''Create pids concurrently, with up to ``workers`` create requests
+        in flight at once; asynchronous generator version of
+        :meth:`create_pids`.  Results are generated as the pids are created.
+        See :meth:`PidmanRestClient.iter_create_pids`.'''
+        async def create(spec):
+            # invalid arguments raise when create_pid is called, so call it
+            # within the task to report them as the result for the spec
+            result = await self._create_pid_spec(spec)
+            return result if ordered else (spec, result)
+
+        async for result in bounded_map_async(create, specs, workers=workers,
+                                              ordered=ordered, return_exceptions=True):
+            yield result
+
+    async def create_pids(self, specs, workers=10):
+        '''Create a batch of pids, with up to ``workers`` create requests
+        in flight at once.  See :meth:`PidmanRestClient.create_pids`.'''
+        return [result async for result in self.iter_create_pids(specs, workers=workers)]
+
+    async def stream_search_pids(self, pid=None, type=None, target=None, domain=None,
+            domain_uri=None, page=None, count=None, chunk_size=65536):
+        '''Queries the PID search api and decodes the response incrementally
+        as it is received; see :meth:`PidmanRestClient.stream_search_pids`.
+        Returns a :class:`~pidservices.jsonstream.JSONArrayStream` to iterate
+        with ``async for``::
+
+            results = await client.stream_search_pids(domain='LSDI', count=10000)
+            async for pid in results:
+                ...
+        '''
+        query = dict([(key, val) for key, val in locals().items() if
+                      key not in ['self', 'chunk_size'] and val])
+        response = await self.get('pids/', params=query, stream=True,
+                                  operation='stream_search_pids')
+        return JSONArrayStream(response.content.iter_chunked(chunk_size), key='results',
+                               close=response.close,
+                               item=PidRecord.from_dict if self.records else None)
+
+    async def iter_search_pages(self, pid=None, type=None, target=None, domain=None,
+            domain_uri=None, count=None, workers=4, ordered=True):
+        '''Asynchronous generator over all the pages of results for a PID
+        search, with up to ``workers`` pages requested concurrently.  See
+        :meth:`PidmanRestClient.iter_search_pages`.'''
+        search_opts = {'pid': pid, 'type': type, 'target': target,
+                       'domain': domain, 'domain_uri': domain_uri, 'count': count}
+
+        async def search_page(page):
+            return page, await self.search_pids(page=page, **search_opts)
+
+        page, data = await search_page(1)
+        page_count = data.get('page_count', 1)
+        yield page, data
+
+        # at most workers pages are requested at once, and the next page is
+        # requested as each one is generated, as for bounded_map
+        async for page_data in bounded_map_async(search_page, range(2, page_count + 1),
+                                                 workers=workers, ordered=ordered):
+            yield page_data
+
+    async def iter_search_pids(self, pid=None, type=None, target=None, domain=None,
+            domain_uri=None, count=None, prefetch=True, workers=1, ordered=True):
+        '''Asynchronous generator over all the results for a PID search;
+        the next page is requested in a background task while the current
+        page is processed.  See :meth:`PidmanRestClient.iter_search_pids`.'''
+        search_opts = {'pid': pid, 'type': type, 'target': target,
+                       'domain': domain, 'domain_uri': domain_uri, 'count': count}
+        if isinstance(workers, AdaptiveLimit) or workers > 1:
+            async for page, data in self.iter_search_pages(workers=workers,
+                                                           ordered=ordered, **search_opts):
+                for result in data['results']:
+                    yield result
+            return
+
+        page = 1
+        data = await self.search_pids(page=page, **search_opts)
+        next_page = None
+        try:
+            while True:
+                more_pages = page < data.get('page_count', 1)
+                if more_pages and prefetch:
+                    next_page = asyncio.ensure_future(
+                        self.search_pids(page=page + 1, **search_opts))
+
+                for result in data['results']:
+                    yield result
+
+                if not more_pages:
+                    break
+                page += 1
+                if prefetch:
+                    data = await next_page
+                    next_page = None
+                else:
+                    data = await self.search_pids(page=page, **search_opts)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def delete_ark_target(self, noid, qualifier=''):
+        '''Delete an ARK target.  See
+        :meth:`PidmanRestClient.delete_ark_target`.'''
+        pid_type = 'ark'
+        # generate target url and check pid type
+        url = self._target_url(pid_type, noid, qualifier)
+        await self.delete(url, accept='text/plain', invalidate_cache=(pid_type, noid),
+                          operation='delete_ark_target', noid=noid)
         # no processing to do with the response - if status code was 200, success
         return True
@@ -0,0 +1,116 @@
+'''
+*"Adapt or perish, now as ever, is nature's inexorable imperative."* - **H. G. Wells**
+
+Adaptive concurrency control for bulk operations.  An :class:`AdaptiveLimit`
+adjusts the number of requests a bulk operation keeps in flight based on
+how the pid manager is responding, using additive increase / multiplicative
+decrease (AIMD): the limit grows slowly while responses are successful and
+latency stays flat, and is cut sharply when the server reports it is
+overloaded (429 or 503 responses, or failed requests) or latency spikes.
+
+Configure a client with the limit, so that it can record the outcome of
+each request, and pass the same limit as ``workers`` to a bulk operation::
+
+    limit = AdaptiveLimit(initial=4, maximum=32)
+    client = PidmanRestClient(url, username, password, adaptive_limit=limit,
+                              pool_maxsize=32)
+    results = client.create_pids(specs, workers=limit)
+
+The current limit is available as :attr:`AdaptiveLimit.limit`, and is
+reported by the client's :class:`~pidservices.metrics.ClientMetrics`, if
+configured.
+'''
+
+import threading
+
+
+class AdaptiveLimit(object):
+    '''Concurrency limit adjusted with additive increase / multiplicative
+    decrease based on the outcome of each request.  Thread-safe; a single
+    limit may be shared by several clients.
+
+    :param initial: initial number of concurrent requests
+    :param minimum: smallest limit
+    :param maximum: largest limit; a session connection pool should
+        have at least this many connections
+    :param increase: amount the limit grows for each limit's worth of
+        successful requests
+    :param decrease: factor the limit is multiplied by when the server is
+        overloaded or latency spikes
+    :param latency_tolerance: latency is considered to have spiked when
+        recent latency is more than this multiple of the long-term average
+    :param overload_statuses: response status codes that indicate the
+        server is overloaded; requests that fail without a response (e.g.,
+        a timeout) are also treated as overload
+    '''
+    #: weight of each new latency in the recent and long-term averages
+    recent_weight = 0.25
+    baseline_weight = 0.02
+
+    def __init__(self, initial=4, minimum=1, maximum=32, increase=1, decrease=0.5,
+                 latency_tolerance=2.0, overload_statuses=(429, 503)):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('limits must satisfy 1 <= minimum <= initial <= maximum')
+        if not 0 < decrease < 1:
+            raise ValueError('decrease must be between 0 and 1')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.overload_statuses = frozenset(overload_statuses)
+        #: recent and long-term average latency, in seconds
+        self.latency = None
+        self.baseline = None
+        #: number of times the limit was increased and decreased
+        self.increases = 0
+        self.decreases = 0
+        self._limit = float(initial)
+        # number of responses to record before the limit can be decreased again
+        self._cooldown = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        '''Current number of concurrent requests allowed.'''
+        return int(self._limit)
+
+    def __repr__(self):
+        return '<AdaptiveLimit %d>' % self.limit
+
+    def record(self, latency, status):
+        '''Record the outcome of a single request, and adjust the limit.
+
+        :param latency: time taken by the request, in seconds
+        :param status: response status code, or the name of the exception
+            for a request that failed without a response
+        :returns: the current limit
+        '''
+        with self._lock:
+            if self.latency is None:
+                self.latency = self.baseline = latency
+            else:
+                self.latency += self.recent_weight * (latency - self.latency)
+                self.baseline += self.baseline_weight * (latency - self.baseline)
+            overloaded = not isinstance(status, int) or status in self.overload_statuses
+            spiked = self.latency > self.baseline * self.latency_tolerance
+
+            if overloaded or spiked:
+                # decrease only once for the requests that were in flight
+                # when the server became overloaded
+                if self._cooldown <= 0:
+                    self._cooldown = self.limit - 1
+                    self._limit = max(self.minimum, self._limit * self.decrease)
+                    self.decreases += 1
+                else:
+                    self._cooldown -= 1
+            else:
+                self._cooldown -= 1
+                # other server errors neither increase nor decrease the limit
+                if status < 500 and self._limit < self.maximum:
+                    before = self.limit
+                    self._limit = min(self.maximum,
+                                      self._limit + float(self.increase) / self._limit)
+                    if self.limit > before:
+                        self.increases += 1
+            return self.limit
@@ -19,14 +19,18 @@ class DjangoPidmanRestClient(PidmanRestClient):
         PIDMAN_USER = '' # Username for authentication to the pidman app.
         PIDMAN_PASSWORD = '' # Pasword for username above.
 
+    Any keyword arguments, e.g. connection pool options, are passed through
+    to :class:`PidmanRestClient`.
+
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         try:
             baseurl = settings.PIDMAN_HOST
             username = settings.PIDMAN_USER
             password = settings.PIDMAN_PASSWORD
-            super(DjangoPidmanRestClient, self).__init__(baseurl, username, password)
+            super(DjangoPidmanRestClient, self).__init__(baseurl, username, password,
+                                                         **kwargs)
         except AttributeError: # Raise error if values do not exist.
             errmsg = """
             Configuration Error!  The following values must be set in django
@@ -0,0 +1,495 @@
+'''
+*"All the world's a stage, and all the men and women merely players."*
+- **William Shakespeare**
+
+An in-process stand-in for the pidman REST API, for testing and
+benchmarking client code against a real HTTP server without a pid manager
+or a network.  :class:`FakePidmanServer` implements the endpoints used by
+:class:`~pidservices.clients.PidmanRestClient`: domains, pid search with
+pagination, ark and purl create, get, and update, and target get, update,
+and delete.  Data is kept in memory and lost when the server stops.
+
+Responses can be slowed down with artificial latency, and errors can be
+injected at random or for a set number of requests, to test retries,
+timeouts, and concurrency::
+
+    with FakePidmanServer(latency=0.01, error_rate=0.05) as server:
+        domain = server.add_domain('Test Domain')
+        client = PidmanRestClient(server.url, 'user', 'pass')
+        ark = client.create_ark(domain['uri'], 'http://example.com/')
+
+The server can also be run from the command line, e.g. for a benchmark
+in another process::
+
+    python -m pidservices.fakeserver --port 8000 --pids 10000 --latency 0.02
+'''
+
+from collections import Counter
+import argparse
+import base64
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlparse
+
+from pidservices.clients import PidmanRestClient, noid_check_character
+from pidservices.noids import NOID_BASE, decode_noid
+
+# pid and target urls, relative to the server root; any leading path is ignored
+_PID_URL = re.compile(r'/(?P<type>ark|purl)/(?P<noid>[^/]*)(?P<target>/(?P<qualifier>.*))?$')
+_DOMAIN_URL = re.compile(r'/domains/(?:(?P<id>[^/]+)/)?$')
+_SEARCH_URL = re.compile(r'/pids/$')
+
+# values that may be set when creating or updating pids, targets, and domains
+_PID_FIELDS = ('domain', 'name', 'external_system_id', 'external_system_key', 'policy')
+_TARGET_FIELDS = ('target_uri', 'proxy', 'active')
+_DOMAIN_FIELDS = ('name', 'policy', 'parent')
+
+
+class _HTTPError(Exception):
+    # error response for a request
+    def __init__(self, status, message=''):
+        self.status = status
+        self.message = message
+
+
+class FakePidmanServer(object):
+    '''Fake pidman REST API server, running in a background thread.  Use
+    :meth:`start` and :meth:`stop`, or use the server as a context manager.
+
+    :param host: host to listen on; defaults to localhost
+    :param port: port to listen on; defaults to any available port
+    :param username: if set, requests that modify data require http basic
+        authentication with this username and ``password``
+    :param password: password for authenticated requests
+    :param latency: seconds to wait before responding to each request
+    :param jitter: maximum additional random latency, in seconds
+    :param error_rate: fraction of requests (0 to 1) that fail with
+        ``error_status`` instead of being processed
+    :param error_status: http status code for injected errors; defaults
+        to 503 Service Unavailable
+    :param page_size: default number of pid search results per page
+    :param resolver: base url for resolvable pids
+    :param naan: name assigning authority number for arks
+    :param seed: optional random seed, for repeatable latency and errors
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, username=None, password=None,
+                 latency=0, jitter=0, error_rate=0, error_status=503, page_size=10,
+                 resolver='http://pid.emory.edu/', naan='25593', seed=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_size = page_size
+        self.resolver = resolver.rstrip('/') + '/'
+        self.naan = naan
+        self.random = random.Random(seed)
+        #: number of requests handled, by http method and response status
+        self.request_counts = Counter()
+        self.domains = {}
+        self.pids = {}
+        self._failures = []
+        self._next_domain = 1
+        self._next_noid = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        '''Base url for the API, to configure a client.'''
+        return 'http://%s:%d/' % (self.host, self.port)
+
+    def start(self):
+        '''Start the server in a background thread.'''
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _FakePidmanHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.pidman = self
+        self.port = self._httpd.server_port
+        # poll often, so that the server stops quickly
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05},
+                                        name='FakePidmanServer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        '''Stop the server.'''
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def fail_next(self, count=1, status=503, retry_after=None):
+        '''Fail the next ``count`` requests, regardless of the error rate.
+
+        :param status: http status code to respond with, or None to close the
+            connection without a response
+        :param retry_after: optional ``Retry-After`` header value, in seconds
+        '''
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    # data
+
+    def add_domain(self, name, policy=None, parent=None):
+        '''Add a domain, and return the domain information.'''
+        with self._lock:
+            return self._add_domain({'name': name, 'policy': policy, 'parent': parent})
+
+    def add_pid(self, type, domain, target_uri, qualifier='', **kwargs):
+        '''Add a pid with a single target, and return the pid information.
+        Takes the same options as :meth:`~pidservices.clients.PidmanRestClient.create_pid`,
+        except that ``external_system`` is ``external_system_id``.'''
+        kwargs.update(domain=domain, target_uri=target_uri, qualifier=qualifier)
+        with self._lock:
+            return self._add_pid(type, kwargs, 'fakeserver')
+
+    def add_pids(self, count, type='ark', domain=None, target_uri='http://example.com/{%PID%}'):
+        '''Add a number of pids, e.g. as data for a benchmark; adds a domain
+        if none is specified.  Returns a list of the new noids.'''
+        if domain is None:
+            domain = self.add_domain('Domain %d' % self._next_domain)['uri']
+        return [self.add_pid(type, domain, target_uri)['pid'] for i in range(count)]
+
+    def _add_domain(self, info):
+        domain_id = str(self._next_domain)
+        self._next_domain += 1
+        domain = {'id': domain_id, 'uri': '%sdomains/%s/' % (self.url, domain_id)}
+        for field in _DOMAIN_FIELDS:
+            domain[field] = info.get(field)
+        self.domains[domain_id] = domain
+        return domain
+
+    def _new_noid(self):
+        # sequential noids with a check character, at least five characters long
+        noid = decode_noid(NOID_BASE ** 4 + self._next_noid)
+        self._next_noid += 1
+        return noid + noid_check_character(noid)
+
+    def _add_pid(self, type, info, user):
+        noid = self._new_noid()
+        now = _timestamp()
+        pid = {'pid': noid, 'type': type.capitalize(), 'uri': '%s%s/%s' % (self.url, type, noid),
+               'created_by': user, 'created_at': now, 'updated_by': user, 'updated_at': now,
+               'targets': []}
+        for field in _PID_FIELDS:
+            pid[field] = info.get(field)
+        target_uri = info['target_uri'].replace(PidmanRestClient.pid_token, noid)
+        self._set_target(pid, info.get('qualifier') or '',
+                         {'target_uri': target_uri, 'proxy': info.get('proxy'), 'active': True})
+        self.pids[(type, noid)] = pid
+        return pid
+
+    def _resolvable(self, type, noid, qualifier=''):
+        if type == 'purl':
+            return '%s%s' % (self.resolver, noid)
+        url = '%sark:/%s/%s' % (self.resolver, self.naan, noid)
+        return '%s/%s' % (url, qualifier) if qualifier else url
+
+    def _get_pid(self, type, noid):
+        pid = self.pids.get((type, noid))
+        if pid is None:
+            raise _HTTPError(404, 'Pid not found')
+        return pid
+
+    def _get_target(self, pid, qualifier):
+        for target in pid['targets']:
+            if target['qualifier'] == qualifier:
+                return target
+        raise _HTTPError(404, 'Target not found')
+
+    def _set_target(self, pid, qualifier, info):
+        # update or add a target; returns True if the target was added
+        type = pid['type'].lower()
+        try:
+            target = self._get_target(pid, qualifier)
+            created = False
+        except _HTTPError:
+            target = {'uri': '%s%s/%s/%s' % (self.url, type, pid['pid'], qualifier),
+                      'access_uri': self._resolvable(type, pid['pid'], qualifier),
+                      'qualifier': qualifier, 'target_uri': None, 'proxy': None,
+                      'active': True}
+            pid['targets'].append(target)
+            created = True
+        for field in _TARGET_FIELDS:
+            if field in info:
+                target[field] = info[field]
+        return created
+
+    def _search(self, query):
+        # filter pids by search parameters, in creation order
+        results = list(self.pids.values())
+        if query.get('pid'):
+            results = [pid for pid in results if pid['pid'] == query['pid']]
+        if query.get('type'):
+            results = [pid for pid in results if pid['type'].lower() == query['type'].lower()]
+        if query.get('domain_uri'):
+            results = [pid for pid in results if pid['domain'] == query['domain_uri']]
+        if query.get('domain'):
+            uris = set(domain['uri'] for domain in self.domains.values()
+                       if domain['name'] == query['domain'])
+            results = [pid for pid in results if pid['domain'] in uris]
+        if query.get('target'):
+            results = [pid for pid in results
+                       if any(target['target_uri'] == query['target']
+                              for target in pid['targets'])]
+        return results
+
+    # request handling
+
+    def _delay(self):
+        # artificial latency, and an injected error if any
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            if self._failures:
+                return self._failures.pop(0)
+            if self.error_rate and self.random.random() < self.error_rate:
+                return self.error_status, None
+
+    def _authorized(self, authorization):
+        if self.username is None:
+            return True
+        expected = 'Basic %s' % base64.b64encode(
+            ('%s:%s' % (self.username, self.password)).encode('utf-8')).decode('ascii')
+        return authorization == expected
+
+    def handle(self, method, path, query, body):
+        '''Process a single API request, and return a tuple of status code,
+        content type, and response body text.'''
+        match = _PID_URL.search(path)
+        if match:
+            type, noid, qualifier = match.group('type', 'noid', 'qualifier')
+            if match.group('target') is not None:
+                return self._handle_target(method, type, noid, qualifier, body)
+            return self._handle_pid(method, type, noid, body)
+        match = _DOMAIN_URL.search(path)
+        if match:
+            return self._handle_domain(method, match.group('id'), body)
+        if _SEARCH_URL.search(path) and method == 'GET':
+            return self._handle_search(query)
+        raise _HTTPError(404, 'Not found')
+
+    def _handle_pid(self, method, type, noid, body):
+        with self._lock:
+            if method == 'POST' and not noid:
+                if not body.get('domain') or not body.get('target_uri'):
+                    raise _HTTPError(400, 'domain and target_uri are required')
+                if type == 'purl' and body.get('qualifier'):
+                    raise _HTTPError(400, 'Purl targets cannot be qualified')
+                pid = self._add_pid(type, body, self.username or 'fakeserver')
+                return 201, 'text/plain', self._resolvable(type, pid['pid'])
+            pid = self._get_pid(type, noid)
+            if method == 'GET':
+                return 200, 'application/json', json.dumps(pid)
+            if method == 'PUT':
+                for field in _PID_FIELDS:
+                    if field in body:
+                        pid[field] = body[field]
+                pid['updated_at'] = _timestamp()
+                return 200, 'application/json', json.dumps(pid)
+        raise _HTTPError(405, 'Method not allowed')
+
+    def _handle_target(self, method, type, noid, qualifier, body):
+        with self._lock:
+            pid = self._get_pid(type, noid)
+            if method == 'GET':
+                return 200, 'application/json', json.dumps(self._get_target(pid, qualifier))
+            if method == 'PUT':
+                if type == 'purl' and qualifier:
+                    raise _HTTPError(400, 'Purl targets cannot be qualified')
+                created = self._set_target(pid, qualifier, body)
+                pid['updated_at'] = _timestamp()
+                return (201 if created else 200), 'application/json', \
+                    json.dumps(self._get_target(pid, qualifier))
+            if method == 'DELETE':
+                if type == 'purl':
+                    raise _HTTPError(405, 'Purl targets cannot be deleted')
+                pid['targets'].remove(self._get_target(pid, qualifier))
+                return 200, 'text/plain', 'OK'
+        raise _HTTPError(405, 'Method not allowed')
+
+    def _handle_domain(self, method, domain_id, body):
+        with self._lock:
+            if domain_id is None:
+                if method == 'GET':
+                    return 200, 'application/json', json.dumps(list(self.domains.values()))
+                if method == 'POST':
+                    if not body.get('name'):
+                        raise _HTTPError(400, 'name is required')
+                    return 201, 'text/plain', self._add_domain(body)['uri']
+            else:
+                domain = self.domains.get(domain_id)
+                if domain is None:
+                    raise _HTTPError(404, 'Domain not found')
+                if method == 'GET':
+                    return 200, 'application/json', json.dumps(domain)
+                if method == 'PUT':
+                    for field in _DOMAIN_FIELDS:
+                        if field in body:
+                            domain[field] = body[field]
+                    return 200, 'application/json', json.dumps(domain)
+        raise _HTTPError(405, 'Method not allowed')
+
+    def _handle_search(self, query):
+        try:
+            count = int(query.get('count') or self.page_size)
+            page = int(query.get('page') or 1)
+        except ValueError:
+            raise _HTTPError(400, 'Invalid page or count')
+        with self._lock:
+            results = self._search(query)
+            page_count = max(1, -(-len(results) // count))
+            if page < 1 or page > page_count:
+                raise _HTTPError(404, 'Invalid page')
+            start = (page - 1) * count
+            return 200, 'application/json', json.dumps({
+                'results_count': len(results),
+                'page_count': page_count,
+                'current_page': page,
+                'max_per_page': count,
+                'results': results[start:start + count],
+            })
+
+
+class _FakePidmanHandler(BaseHTTPRequestHandler):
+    # request handler for FakePidmanServer
+    protocol_version = 'HTTP/1.1'
+    # send each response in a single write, without waiting for the
+    # client to acknowledge the headers, so latency is only as configured
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def do_PUT(self):
+        self._respond('PUT')
+
+    def do_DELETE(self):
+        self._respond('DELETE')
+
+    def _respond(self, method):
+        pidman = self.server.pidman
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        headers = {}
+
+        failure = pidman._delay()
+        if failure is not None:
+            status, retry_after = failure
+            if status is None:
+                # drop the connection without responding
+                self.close_connection = True
+                with pidman._lock:
+                    pidman.request_counts[(method, None)] += 1
+                return
+            if retry_after is not None:
+                headers['Retry-After'] = str(retry_after)
+            content_type, content = 'text/plain', 'Injected error'
+        elif method != 'GET' and \
+          not pidman._authorized(self.headers.get('Authorization')):
+            status, content_type, content = 401, 'text/plain', 'Authorization required'
+            headers['WWW-Authenticate'] = 'Basic realm="pidman"'
+        else:
+            try:
+                status, content_type, content = pidman.handle(
+                    method, url.path, dict(parse_qsl(url.query)), self._parse_body(body))
+            except _HTTPError as err:
+                status, content_type, content = err.status, 'text/plain', err.message
+
+        content = content.encode('utf-8')
+        if method == 'GET' and status == 200:
+            headers['ETag'] = '"%s"' % hashlib.md5(content).hexdigest()
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                status, content = 304, b''
+
+        with pidman._lock:
+            pidman.request_counts[(method, status)] += 1
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _parse_body(self, body):
+        if not body:
+            return {}
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            return dict(parse_qsl(body.decode('utf-8')))
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise _HTTPError(400, 'Invalid JSON')
+
+    def log_message(self, *args):
+        pass
+
+
+def _timestamp():
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a fake pidman REST API server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--username', help='require authentication to modify data')
+    parser.add_argument('--password')
+    parser.add_argument('--pids', type=int, default=0, help='number of arks to create')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds to wait before each response')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='maximum additional random latency')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of requests to fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    server = FakePidmanServer(args.host, args.port, args.username, args.password,
+                              latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, error_status=args.error_status,
+                              seed=args.seed)
+    server.start()
+    if args.pids:
+        server.add_pids(args.pids)
+    print('Fake pidman server running at %s (Ctrl-C to stop)' % server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+'''
+*"Little drops of water, little grains of sand, make the mighty ocean and
+the pleasant land."* - **Julia Carney**
+
+Incremental decoding for large JSON responses, such as a pid search with a
+very large page size, so that individual results can be processed as they
+are received without loading the entire response into memory.
+'''
+
+import codecs
+import json
+import re
+
+# whitespace allowed between JSON tokens
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+#: generated by the parser when it needs another chunk from an asynchronous source
+_NEED_DATA = object()
+
+
+class _NeedData(Exception):
+    # raised when an asynchronous stream must wait for more data to continue
+    pass
+
+
+class JSONArrayStream(object):
+    '''Iterator over the items of an array in a JSON object, decoded
+    incrementally from chunks of text or bytes (e.g., from
+    :meth:`requests.Response.iter_content`).  Each item is generated as soon
+    as it has been completely received, so memory use depends on the chunk
+    size and the size of a single item, not the size of the whole document.
+
+    Other top-level values in the object (e.g., the ``page_count`` of a pid
+    search) are collected in :attr:`fields` as they are decoded; values that
+    follow the array in the document are only available once iteration
+    has finished.
+
+    An asynchronous iterable of chunks (e.g., from
+    :meth:`aiohttp.StreamReader.iter_chunked`) is also supported; the stream
+    is then iterated with ``async for``.
+
+    :param chunks: iterable or asynchronous iterable of str or utf-8
+        encoded bytes
+    :param key: name of the top-level array to iterate; defaults to ``results``
+    :param close: optional function to call when iteration ends, e.g. to
+        close the response the chunks are read from
+    :param item: optional function to convert each decoded item, e.g.
+        :meth:`pidservices.records.PidRecord.from_dict`
+    '''
+
+    def __init__(self, chunks, key='results', close=None, item=None):
+        self.key = key
+        self._item = item
+        #: other top-level values decoded from the JSON object
+        self.fields = {}
+        if hasattr(chunks, '__aiter__'):
+            # chunks are added to the buffer by __anext__ as the parser needs them
+            self._async_chunks = chunks.__aiter__()
+            self._chunks = iter(())
+        else:
+            self._async_chunks = None
+            self._chunks = iter(chunks)
+        self._close = close
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        # start of the text for the current parsing step, which is decoded
+        # again if an asynchronous stream has to wait for more data
+        self._mark = 0
+        self._eof = False
+        self._received = False
+        self._items = self._parse()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._items)
+        if item is _NEED_DATA:
+            raise TypeError('Use async for to iterate over an asynchronous stream')
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        for item in self._items:
+            if item is not _NEED_DATA:
+                return item
+            try:
+                chunk = await self._async_chunks.__anext__()
+            except StopAsyncIteration:
+                self._received = True
+                continue
+            except BaseException:
+                # e.g., the connection was lost; release the response
+                self.close()
+                raise
+            if isinstance(chunk, bytes):
+                chunk = self._utf8.decode(chunk)
+            self._append(chunk)
+        raise StopAsyncIteration
+
+    def close(self):
+        '''Stop iterating and release the underlying response, if any.'''
+        self._items.close()
+
+    def _append(self, text):
+        # add text to the buffer, discarding text before the current step
+        self._buffer = self._buffer[self._mark:] + text
+        self._pos -= self._mark
+        self._mark = 0
+
+    def _fill(self):
+        # read the next chunk into the buffer; returns False when there is
+        # no more data
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._utf8.decode(chunk)
+            if chunk:
+                self._append(chunk)
+                return True
+        if self._async_chunks is not None and not self._received:
+            raise _NeedData()
+        self._append(self._utf8.decode(b'', final=True))
+        self._eof = True
+        return False
+
+    def _step(self, parse, *args):
+        # run a single parsing step; for an asynchronous stream, generate
+        # _NEED_DATA and start the step over when more data is needed
+        while True:
+            self._mark = self._pos
+            try:
+                return parse(*args)
+            except _NeedData:
+                self._pos = self._mark
+                yield _NEED_DATA
+
+    def _peek(self):
+        # skip whitespace and return the next character without consuming it,
+        # or None at the end of the data
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return None
+
+    def _next_char(self, expected=None):
+        char = self._peek()
+        if char is None or (expected is not None and char not in expected):
+            raise ValueError('Invalid JSON: expected %s at position %d, got %r' %
+                             (' or '.join(expected or ['data']), self._pos, char))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        # decode the complete JSON value starting at the current position
+        first = self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # objects, arrays and strings are complete when decoded, but a
+                # number at the end of the buffer may continue in the next chunk
+                if first in '{["' or end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _key(self):
+        # an object key and the following colon
+        if self._peek() != '"':
+            self._next_char('"')
+        key = self._value()
+        self._next_char(':')
+        return key
+
+    def _parse(self):
+        try:
+            yield from self._step(self._next_char, '{')
+            if (yield from self._step(self._peek)) == '}':
+                return
+            while True:
+                key = yield from self._step(self._key)
+                if key == self.key:
+                    yield from self._array()
+                else:
+                    self.fields[key] = yield from self._step(self._value)
+                if (yield from self._step(self._next_char, ',}')) == '}':
+                    break
+        finally:
+            if self._close is not None:
+                self._close()
+
+    def _array(self):
+        yield from self._step(self._next_char, '[')
+        if (yield from self._step(self._peek)) == ']':
+            self._pos += 1
+            return
+        item = self._item
+        while True:
+            # each item and the following separator are parsed inline,
+            # rather than with _step, since this runs for every result
+            self._mark = self._pos
+            try:
+                value = self._value()
+            except _NeedData:
+                self._pos = self._mark
+                yield _NEED_DATA
+                continue
+            yield item(value) if item is not None else value
+            self._mark = self._pos
+            try:
+                end = self._next_char(',]')
+            except _NeedData:
+                end = yield from self._step(self._next_char, ',]')
+            if end == ']':
+                break
@@ -0,0 +1,272 @@
+'''
+*"What gets measured gets managed."* - **Peter Drucker**
+
+Request metrics for pidman API clients: request counts by operation and
+response status, bytes sent and received, retries, cache hits, time spent
+waiting on a client rate limit, request latency histograms, and the current
+adaptive concurrency limit, available as an in-process snapshot or in the
+Prometheus text exposition format.
+'''
+
+from bisect import bisect_left
+import threading
+
+#: default latency histogram bucket boundaries, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class LatencyHistogram(object):
+    '''Histogram of request latencies, with a count for each bucket.
+
+    :param buckets: sorted upper bounds of the buckets, in seconds; an
+        additional bucket holds any larger values
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        '''Record a single latency, in seconds.'''
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        '''List of ``(upper bound, count)`` tuples, where count is the number
+        of values less than or equal to the upper bound, ending with
+        ``float('inf')`` for the total.'''
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'), ), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        '''Estimate a quantile (e.g., 0.95) from the bucket counts, as the upper
+        bound of the bucket that contains it; returns None if there are no values.'''
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+
+
+class OperationMetrics(object):
+    '''Metrics for a single API operation, e.g. ``get_pid``.'''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        #: number of requests (not including retries) by response status
+        #: code, or exception name for requests that failed without a response
+        self.status_codes = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.cache_hits = 0
+        #: requests that shared the response to an identical concurrent request
+        self.coalesced = 0
+        #: requests (including retries) delayed by the client rate limiter,
+        #: and the total time spent waiting, in seconds
+        self.rate_limited = 0
+        self.rate_limit_wait = 0.0
+        self.latency = LatencyHistogram(buckets)
+
+    @property
+    def count(self):
+        return sum(self.status_codes.values())
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'status_codes': dict(self.status_codes),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'retries': self.retries,
+            'cache_hits': self.cache_hits,
+            'coalesced': self.coalesced,
+            'rate_limited': self.rate_limited,
+            'rate_limit_wait': self.rate_limit_wait,
+            'latency': {
+                'count': self.latency.count,
+                'sum': self.latency.sum,
+                'buckets': self.latency.cumulative(),
+                'p50': self.latency.quantile(0.5),
+                'p95': self.latency.quantile(0.95),
+                'p99': self.latency.quantile(0.99),
+            },
+        }
+
+
+class ClientMetrics(object):
+    '''Collects metrics for the API requests made by a client, by operation
+    (e.g., ``create_pid``, ``get_target``, ``search_pids``).  Pass an instance
+    to a client to enable metrics; a single instance may be shared by several
+    clients and threads.  Latency is measured from sending the request until
+    the response is received, including any retries, so it reflects time
+    spent waiting on the pid manager (and the network) rather than in the
+    calling code::
+
+        metrics = ClientMetrics()
+        client = PidmanRestClient(url, username, password, metrics=metrics)
+        ...
+        metrics.snapshot()['create_pid']['latency']['p95']
+
+    :param buckets: latency histogram bucket boundaries, in seconds
+    '''
+
+    #: current limit of a client's
+    #: :class:`~pidservices.concurrency.AdaptiveLimit`, if configured
+    concurrency_limit = None
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, operation):
+        # must be called with the lock held
+        metrics = self._operations.get(operation)
+        if metrics is None:
+            metrics = self._operations[operation] = OperationMetrics(self.buckets)
+        return metrics
+
+    def record_request(self, operation, status, elapsed, bytes_sent=0, bytes_received=0):
+        '''Record a completed request.
+
+        :param operation: name of the API operation
+        :param status: response status code, or the name of the exception
+            for a request that failed without a response
+        :param elapsed: time in seconds to complete the request, including retries
+        :param bytes_sent: size of the request body
+        :param bytes_received: size of the response body
+        '''
+        with self._lock:
+            metrics = self._operation(operation)
+            metrics.status_codes[status] = metrics.status_codes.get(status, 0) + 1
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            metrics.latency.observe(elapsed)
+
+    def record_retry(self, operation):
+        '''Record a retry of a failed request.'''
+        with self._lock:
+            self._operation(operation).retries += 1
+
+    def record_cache_hit(self, operation):
+        '''Record a request answered from the client cache.'''
+        with self._lock:
+            self._operation(operation).cache_hits += 1
+
+    def record_coalesced(self, operation):
+        '''Record a request that shared the response to an identical
+        concurrent request (see the client ``coalesce`` option).'''
+        with self._lock:
+            self._operation(operation).coalesced += 1
+
+    def record_rate_limited(self, operation, wait):
+        '''Record a request delayed by the client rate limiter (see the
+        client ``rate_limiter`` option).
+
+        :param wait: time spent waiting, in seconds
+        '''
+        with self._lock:
+            metrics = self._operation(operation)
+            metrics.rate_limited += 1
+            metrics.rate_limit_wait += wait
+
+    def record_concurrency_limit(self, limit):
+        '''Record the current adaptive concurrency limit (see the client
+        ``adaptive_limit`` option).'''
+        self.concurrency_limit = limit
+
+    def snapshot(self):
+        '''Current metrics, as a dictionary keyed on operation name.  Each
+        operation has the total request ``count``, counts by
+        ``status_codes``, ``bytes_sent``, ``bytes_received``, ``retries``,
+        ``cache_hits``, ``coalesced``, ``rate_limited`` and ``rate_limit_wait``,
+        and ``latency`` (count, sum, cumulative bucket counts, and estimated
+        p50, p95, and p99 latency).'''
+        with self._lock:
+            return dict((operation, metrics.snapshot())
+                        for operation, metrics in self._operations.items())
+
+    def reset(self):
+        '''Discard all collected metrics.'''
+        with self._lock:
+            self._operations = {}
+            self.concurrency_limit = None
+
+    def prometheus(self, prefix='pidman_client'):
+        '''Current metrics in the Prometheus text exposition format, e.g.
+        to serve from a metrics endpoint or write to a node exporter
+        textfile collector.
+
+        :param prefix: prefix for metric names
+        :returns: str
+        '''
+        snapshot = self.snapshot()
+        operations = sorted(snapshot.items())
+        lines = []
+
+        def metric(name, type, help, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, type))
+            for suffix, labels, value in samples:
+                labels = ','.join('%s="%s"' % (key, _escape(val)) for key, val in labels)
+                lines.append('%s_%s%s%s %s' % (
+                    prefix, name, suffix, '{%s}' % labels if labels else '',
+                    _format_value(value)))
+
+        metric('requests_total', 'counter',
+               'Pidman API requests, by operation and response status.',
+               [('', [('operation', operation), ('status', status)], count)
+                for operation, info in operations
+                for status, count in sorted(info['status_codes'].items(),
+                                            key=lambda item: str(item[0]))])
+        for name, key, help in [
+            ('request_bytes_total', 'bytes_sent', 'Bytes sent in pidman API request bodies.'),
+            ('response_bytes_total', 'bytes_received',
+             'Bytes received in pidman API response bodies.'),
+            ('retries_total', 'retries', 'Pidman API requests retried after a failure.'),
+            ('cache_hits_total', 'cache_hits', 'Pidman API requests answered from the cache.'),
+            ('coalesced_total', 'coalesced',
+             'Pidman API requests that shared an identical concurrent request.'),
+            ('rate_limited_total', 'rate_limited',
+             'Pidman API requests delayed by the client rate limiter.'),
+            ('rate_limit_wait_seconds_total', 'rate_limit_wait',
+             'Time pidman API requests spent waiting on the client rate limiter.'),
+        ]:
+            metric(name, 'counter', help,
+                   [('', [('operation', operation)], info[key])
+                    for operation, info in operations])
+
+        samples = []
+        for operation, info in operations:
+            latency = info['latency']
+            for bound, count in latency['buckets']:
+                samples.append(('_bucket', [('operation', operation), ('le', bound)], count))
+            samples.append(('_sum', [('operation', operation)], latency['sum']))
+            samples.append(('_count', [('operation', operation)], latency['count']))
+        metric('request_duration_seconds', 'histogram',
+               'Pidman API request latency in seconds, including retries.', samples)
+        if self.concurrency_limit is not None:
+            metric('concurrency_limit', 'gauge',
+                   'Current adaptive limit on concurrent pidman API requests.',
+                   [('', [], self.concurrency_limit)])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    if isinstance(value, float):
+        return _format_value(value)
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
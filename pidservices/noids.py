@@ -0,0 +1,211 @@
+'''
+*"The art of being wise is the art of knowing what to overlook."*
+- **William James**
+
+Compact integer representation of noids, and :class:`NoidSet`, a
+read-only set of noids stored as a sorted array of integers, for
+comparing very large sets of pids (e.g., all the pids in the pid manager
+against the pids referenced in another system) without the memory cost of
+a Python set of strings.
+'''
+
+from array import array
+from bisect import bisect_left
+from itertools import chain, groupby
+import mmap
+import sys
+
+from pidservices.clients import NOID_CHARACTERS, NOID_ORDINALS, parse_arks
+
+# number of noid characters
+NOID_BASE = len(NOID_CHARACTERS)
+#: maximum length of a noid that can be encoded as a 64-bit integer
+MAX_NOID_LENGTH = 12
+
+# file header for a saved NoidSet: identifier, followed by a byte order mark
+_FILE_MAGIC = b'NOIDSET'
+_BYTE_ORDERS = {'little': b'<', 'big': b'>'}
+_HEADER_SIZE = len(_FILE_MAGIC) + 1
+
+
+def encode_noid(noid):
+    '''Encode a noid as an integer.  Each character is a base 29 digit (its
+    position in :data:`~pidservices.clients.NOID_CHARACTERS`), following a
+    leading 1 so that noids with leading zeros (e.g., ``0b`` and ``b``) are
+    encoded differently.  Noids are not case sensitive.
+
+    :param noid: noid to encode, up to :data:`MAX_NOID_LENGTH` characters
+    :returns: int
+    :raises ValueError: if the noid is too long or contains characters
+        that are not noid characters
+    '''
+    if len(noid) > MAX_NOID_LENGTH:
+        raise ValueError('Noid is too long to encode: %s' % noid)
+    value = 1
+    try:
+        for char in noid.lower():
+            value = value * NOID_BASE + NOID_ORDINALS[char]
+    except KeyError:
+        raise ValueError('Invalid noid: %s' % noid)
+    return value
+
+
+def decode_noid(value):
+    '''Decode an integer created by :meth:`encode_noid` back to a noid.
+
+    :param value: encoded noid
+    :returns: noid string
+    '''
+    if value < 1:
+        raise ValueError('Invalid encoded noid: %s' % value)
+    chars = []
+    while value > 1:
+        value, ordinal = divmod(value, NOID_BASE)
+        chars.append(NOID_CHARACTERS[ordinal])
+    if value != 1:
+        raise ValueError('Invalid encoded noid')
+    return ''.join(reversed(chars))
+
+
+class NoidSet(object):
+    '''Read-only set of noids, stored as a sorted array of encoded noids
+    (8 bytes per noid; see :meth:`encode_noid`).  Supports fast membership
+    tests, iteration in encoded order, and union, intersection, and
+    difference with another :class:`NoidSet`.  A set can be saved to a file
+    and loaded back with :meth:`load`, which maps the file into memory
+    rather than reading it.
+
+    Noids are not case sensitive; iterating returns lower case noids.
+
+    :param noids: iterable of noid strings
+    '''
+
+    def __init__(self, noids=()):
+        self._values = self._sorted(map(encode_noid, noids))
+        self._mmap = None
+
+    @classmethod
+    def _from_values(cls, values):
+        noidset = cls.__new__(cls)
+        noidset._values = values
+        noidset._mmap = None
+        return noidset
+
+    @staticmethod
+    def _sorted(values):
+        # sorted array of unique values
+        return array('Q', (value for value, _ in groupby(sorted(values))))
+
+    @classmethod
+    def from_arks(cls, arks):
+        '''Create a set of the noids from an iterable of ARKs, e.g.
+        ARKs referenced in another system; values that are not ARKs are
+        ignored (see :meth:`~pidservices.clients.parse_arks`).'''
+        return cls(parse_arks(arks, columnar=True).noid)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        for value in self._values:
+            yield decode_noid(value)
+
+    def __contains__(self, noid):
+        try:
+            value = encode_noid(noid)
+        except (ValueError, TypeError, AttributeError):
+            return False
+        values = self._values
+        i = bisect_left(values, value)
+        return i < len(values) and values[i] == value
+
+    def __eq__(self, other):
+        if not isinstance(other, NoidSet):
+            return NotImplemented
+        return self._values == other._values
+
+    def __repr__(self):
+        return '<%s: %d noids>' % (self.__class__.__name__, len(self))
+
+    def union(self, other):
+        '''Return a new set with the noids in either set.'''
+        # sorting the concatenated sorted arrays is a linear-time merge
+        return self._from_values(self._sorted(chain(self._values, other._values)))
+
+    def intersection(self, other):
+        '''Return a new set with the noids in both sets.'''
+        return self._from_values(array('Q', self._common(other, True)))
+
+    def difference(self, other):
+        '''Return a new set with the noids in this set that are not in
+        the other set.'''
+        return self._from_values(array('Q', self._common(other, False)))
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def _common(self, other, present):
+        # generate values from this set that are (or are not) in the
+        # other set, walking both sorted arrays once
+        others = iter(other._values)
+        current = next(others, None)
+        for value in self._values:
+            while current is not None and current < value:
+                current = next(others, None)
+            if (current == value) == present:
+                yield value
+
+    def save(self, path):
+        '''Save the set to a file, which can be loaded with :meth:`load`.'''
+        values = self._values
+        if not isinstance(values, array):
+            values = array('Q', values)
+        with open(path, 'wb') as outfile:
+            outfile.write(_FILE_MAGIC + _BYTE_ORDERS[sys.byteorder])
+            values.tofile(outfile)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        '''Load a set saved with :meth:`save`.  By default, the file is
+        mapped into memory, so loading is immediate and the noids are only
+        read from disk as needed; call :meth:`close` when done with the set.
+
+        :param path: path to the saved file
+        :param use_mmap: map the file into memory instead of reading it;
+            defaults to True
+        '''
+        with open(path, 'rb') as infile:
+            header = infile.read(_HEADER_SIZE)
+            if header[:len(_FILE_MAGIC)] != _FILE_MAGIC or \
+              header[-1:] not in _BYTE_ORDERS.values():
+                raise ValueError('%s is not a saved NoidSet' % path)
+            native = header[-1:] == _BYTE_ORDERS[sys.byteorder]
+
+            if use_mmap and native:
+                data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+                noidset = cls._from_values(
+                    memoryview(data)[_HEADER_SIZE:].cast('Q'))
+                noidset._mmap = data
+                return noidset
+
+            values = array('Q')
+            values.frombytes(infile.read())
+            if not native:
+                values.byteswap()
+            return cls._from_values(values)
+
+    def close(self):
+        '''Release the memory-mapped file for a set loaded with :meth:`load`.
+        The set is empty after it is closed.'''
+        if self._mmap is not None:
+            self._values.release()
+            self._values = array('Q')
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,323 @@
+'''
+*"Fortune favors the prepared mind."* - **Louis Pasteur**
+
+:class:`PidPool` keeps a reservoir of pre-minted placeholder pids, so that
+code that needs a new pid (e.g., an ingest pipeline saving a new object)
+can get one immediately instead of waiting for a create request to the
+pid manager.  Like the ``allocate_pids`` script, pids are created ahead of
+time with placeholder values; when a pid is handed out, its real target
+and name are applied with :meth:`~pidservices.clients.PidmanRestClient.update_pid`
+and :meth:`~pidservices.clients.PidmanRestClient.update_target`.
+
+Every pid minted and handed out, and every update applied, is recorded in
+an append-only JSON-lines journal file, which is flushed to disk before a
+pid is handed out.  When a pool is created with an existing journal, minted
+pids that were never handed out are returned to the reservoir, and updates
+that were not applied (e.g., because the process crashed) are retried, so
+no pid is handed out twice or left with its placeholder values.
+'''
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import json
+import logging
+import os
+import threading
+
+from pidservices.clients import parse_ark
+
+logger = logging.getLogger(__name__)
+
+# pid options applied with update_pid and update_target
+_PID_OPTIONS = ('name', 'external_system', 'external_system_key', 'policy')
+_TARGET_OPTIONS = ('target_uri', 'proxy')
+
+
+def _noid(pid):
+    # noid from a resolvable ark or purl
+    ark = parse_ark(pid)
+    if ark is not None:
+        return ark['noid']
+    return pid.rstrip('/').rsplit('/', 1)[-1]
+
+
+class PidPool(object):
+    '''Reservoir of pre-minted pids for each pid type and domain, refilled
+    in the background::
+
+        pool = PidPool(client, 'http://example.com/pending', journal='pids.jsonl')
+        pool.fill('ark', domain)    # optional; otherwise filled on first use
+        ark = pool.assign('ark', domain, target_uri=url, name=title)
+        ...
+        pool.close()    # wait for updates to finish
+
+    When the number of pids available for a type and domain falls below
+    ``low_water``, more are created in the background to bring it back up
+    to ``size``.  If no pre-minted pid is available, :meth:`assign` creates
+    a new pid with the requested values instead.
+
+    :param client: :class:`~pidservices.clients.PidmanRestClient` to use for
+        creating and updating pids
+    :param placeholder_target: target uri for pre-minted pids
+    :param placeholder_name: optional name for pre-minted pids
+    :param size: number of pids to keep available for each type and domain
+    :param low_water: create more pids when fewer than this many are
+        available; defaults to a quarter of ``size``
+    :param journal: path to the journal file; if not specified, pids are
+        not recorded, and any that are not handed out are lost when the
+        process exits
+    :param workers: number of background threads for creating and
+        updating pids
+    '''
+
+    def __init__(self, client, placeholder_target, placeholder_name=None, size=100,
+                 low_water=None, journal=None, workers=4):
+        self.client = client
+        self.placeholder_target = placeholder_target
+        self.placeholder_name = placeholder_name
+        self.size = size
+        self.low_water = size // 4 if low_water is None else low_water
+        self.journal = journal
+        #: assigned pids with updates that failed, as a list of tuples of
+        #: the journal entry and the exception
+        self.failed = []
+        self._reservoirs = {}
+        # refills in progress, and updates not yet applied
+        self._refilling = {}
+        self._pending = {}
+        # reentrant, since journal entries are written with the lock held
+        self._lock = threading.RLock()
+        self._journal_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._journal_file = None
+        if journal is not None:
+            unapplied = self._load_journal()
+            self._journal_file = open(journal, 'a')
+            with self._lock:
+                for entry in unapplied:
+                    self._apply_later(entry)
+
+    # journal
+
+    def _load_journal(self):
+        # restore unassigned pids from the journal, and return the entries
+        # for assigned pids with updates that were not applied
+        minted = {}
+        assigned = {}
+        if not os.path.exists(self.journal):
+            return []
+        with open(self.journal) as infile:
+            for line in infile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a partial last line, if the process was interrupted
+                    logger.warning('Ignoring invalid journal entry in %s: %r',
+                                   self.journal, line)
+                    continue
+                pid = entry['pid']
+                if entry['event'] == 'minted':
+                    minted[pid] = entry
+                elif entry['event'] == 'assigned':
+                    minted.pop(pid, None)
+                    assigned[pid] = entry
+                elif entry['event'] == 'updated':
+                    assigned.pop(pid, None)
+        for entry in minted.values():
+            self._reservoir(entry['type'], entry['domain']).append(entry['pid'])
+        return list(assigned.values())
+
+    def _record(self, event, pid, **info):
+        # write a journal entry; called with the lock held, so that the
+        # journal is not compacted between writing an entry and updating
+        # the pool to match
+        if self._journal_file is None:
+            return
+        info.update(event=event, pid=pid)
+        with self._journal_lock:
+            self._journal_file.write(json.dumps(info, sort_keys=True) + '\n')
+            self._journal_file.flush()
+            os.fsync(self._journal_file.fileno())
+
+    def compact(self):
+        '''Rewrite the journal with only the pids that are still available
+        or have updates that have not been applied, so that it does not
+        grow without limit.'''
+        if self._journal_file is None:
+            return
+        with self._lock, self._journal_lock:
+            entries = [{'event': 'minted', 'pid': pid, 'type': type, 'domain': domain}
+                       for (type, domain), pids in self._reservoirs.items() for pid in pids]
+            entries.extend(dict(entry, event='assigned')
+                           for entry in list(self._pending.values()) +
+                           [entry for entry, err in self.failed])
+            tmpfile = '%s.tmp' % self.journal
+            with open(tmpfile, 'w') as outfile:
+                for entry in entries:
+                    outfile.write(json.dumps(entry, sort_keys=True) + '\n')
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            self._journal_file.close()
+            os.replace(tmpfile, self.journal)
+            self._journal_file = open(self.journal, 'a')
+
+    # reservoir
+
+    def _reservoir(self, type, domain):
+        key = (type, domain)
+        reservoir = self._reservoirs.get(key)
+        if reservoir is None:
+            reservoir = self._reservoirs[key] = deque()
+        return reservoir
+
+    def available(self, type, domain):
+        '''Number of pre-minted pids available for a type and domain.'''
+        with self._lock:
+            return len(self._reservoir(type, domain))
+
+    def fill(self, type, domain, wait=True):
+        '''Create pids for a type and domain until ``size`` are available.
+
+        :param wait: if True (the default), wait until the pids have been
+            created; otherwise, create them in the background
+        '''
+        with self._lock:
+            future = self._refilling.get((type, domain))
+            if future is None:
+                future = self._refilling[(type, domain)] = \
+                    self._executor.submit(self._refill, type, domain)
+        if wait:
+            future.result()
+
+    def _refill(self, type, domain):
+        try:
+            while self.available(type, domain) < self.size:
+                pid = self.client.create_pid(type, domain, self.placeholder_target,
+                                             name=self.placeholder_name)
+                if isinstance(pid, bytes):
+                    pid = pid.decode('utf-8')
+                with self._lock:
+                    self._record('minted', pid, type=type, domain=domain)
+                    self._reservoir(type, domain).append(pid)
+        except Exception:
+            logger.exception('Error creating pids for %s %s', type, domain)
+        finally:
+            with self._lock:
+                self._refilling.pop((type, domain), None)
+
+    # handing out pids
+
+    def assign(self, type, domain, target_uri, wait=False, **options):
+        '''Get a pid with the specified target and values.  A pre-minted
+        pid is used if one is available, and is recorded in the journal
+        before it is returned; its values are then updated in the
+        background, unless ``wait`` is True.
+
+        :param type: type of pid (ark or purl)
+        :param domain: domain uri
+        :param target_uri: uri the pid should resolve to; may include the
+            :attr:`~pidservices.clients.PidmanRestClient.pid_token`
+        :param wait: if True, wait for the pid to be updated, and raise
+            any error
+        :param options: other pid values to set: ``name``, ``external_system``,
+            ``external_system_key``, ``policy``, or ``proxy``
+        :returns: the pid, in resolvable form
+        '''
+        unknown = set(options) - set(_PID_OPTIONS) - set(_TARGET_OPTIONS)
+        if unknown:
+            raise TypeError('Unsupported pid options: %s' % ', '.join(sorted(unknown)))
+
+        with self._lock:
+            reservoir = self._reservoir(type, domain)
+            pid = reservoir.popleft() if reservoir else None
+            refill = len(reservoir) < self.low_water
+            if pid is not None:
+                options['target_uri'] = target_uri.replace(self.client.pid_token,
+                                                           _noid(pid))
+                entry = dict(options, pid=pid, type=type, domain=domain)
+                self._record('assigned', **entry)
+                if wait:
+                    token = object()
+                    self._pending[token] = entry
+                else:
+                    self._apply_later(entry)
+        if refill:
+            self.fill(type, domain, wait=False)
+
+        if pid is None:
+            # none available; create a pid with the requested values
+            pid = self.client.create_pid(type, domain, target_uri, **options)
+            return pid.decode('utf-8') if isinstance(pid, bytes) else pid
+
+        if wait:
+            try:
+                self._apply(entry)
+            except Exception as err:
+                # keep the entry, so the update can be retried and the
+                # journal entry survives compaction
+                with self._lock:
+                    self.failed.append((entry, err))
+                    self._pending.pop(token, None)
+                raise
+            finally:
+                self._done(token)
+        return pid
+
+    def _apply_later(self, entry):
+        # update an assigned pid in the background; called with the lock held
+        future = self._executor.submit(self._apply, entry, True)
+        self._pending[future] = entry
+        future.add_done_callback(self._done)
+
+    def _done(self, token):
+        with self._lock:
+            self._pending.pop(token, None)
+
+    def _apply(self, entry, background=False):
+        # update an assigned pid with its real values
+        type, noid = entry['type'], _noid(entry['pid'])
+        pid_options = dict((key, entry[key]) for key in _PID_OPTIONS if key in entry)
+        target_options = dict((key, entry[key]) for key in _TARGET_OPTIONS if key in entry)
+        try:
+            if pid_options:
+                self.client.update_pid(type, noid, **pid_options)
+            self.client.update_target(type, noid, **target_options)
+        except Exception as err:
+            if not background:
+                raise
+            logger.error('Error updating assigned pid %s: %s', entry['pid'], err)
+            with self._lock:
+                self.failed.append((entry, err))
+            return
+        with self._lock:
+            self._record('updated', entry['pid'])
+
+    def retry_failed(self):
+        '''Retry updates for assigned pids that could not be updated.'''
+        with self._lock:
+            failed, self.failed = self.failed, []
+            for entry, err in failed:
+                self._apply_later(entry)
+
+    def join(self):
+        '''Wait until all pids that have been handed out are updated.'''
+        while True:
+            with self._lock:
+                pending = [future for future in self._pending
+                           if isinstance(future, Future)]
+            if not pending:
+                break
+            wait(pending)
+
+    def close(self):
+        '''Wait for background work to finish, and close the journal.'''
+        self._executor.shutdown(wait=True)
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
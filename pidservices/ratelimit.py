@@ -0,0 +1,227 @@
+'''
+*"Slow and steady wins the race."* - **Aesop**
+
+Client-side rate limiting, to keep a batch job (e.g., allocating a large
+number of pids) within a request rate the pid manager can handle.  A
+:class:`RateLimiter` passed to a client as ``rate_limiter`` limits all of
+its requests, with separate limits for reads and writes; a
+:class:`SharedTokenBucket` shares a limit between all the processes on a
+host that use the same state file.
+'''
+
+import asyncio
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class TokenBucket(object):
+    '''Token bucket rate limiter, shared by any number of threads.  Tokens
+    are added at ``rate`` per second, up to ``capacity``; each request takes
+    a token, waiting until one is available.  Requests are granted in the
+    order they ask, and a burst of up to ``capacity`` requests is allowed
+    after an idle period.
+
+    :param rate: tokens (requests) per second
+    :param capacity: maximum number of tokens that can accumulate; defaults
+        to one second's worth of tokens, or 1 if the rate is less than one
+        per second
+    '''
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = self.clock()
+        self._lock = threading.Lock()
+
+    # clock and sleep functions, as methods to allow overriding in tests
+    def clock(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def _reserve(self, tokens, block):
+        # take tokens, and return the time to wait until they are available;
+        # tokens can be reserved ahead of time (going negative), so
+        # waiting callers are served in order
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if wait and not block:
+                return None
+            self._tokens -= tokens
+            return wait
+
+    def try_acquire(self, tokens=1):
+        '''Take tokens if they are available now, without waiting.
+
+        :returns: True if the tokens were taken
+        '''
+        return self._reserve(tokens, block=False) is not None
+
+    def acquire(self, tokens=1):
+        '''Take tokens, waiting until they are available.
+
+        :returns: number of seconds spent waiting
+        '''
+        wait = self._reserve(tokens, block=True)
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        '''Take tokens, waiting without blocking the event loop until they
+        are available.
+
+        :returns: number of seconds spent waiting
+        '''
+        wait = self._reserve(tokens, block=True)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class SharedTokenBucket(TokenBucket):
+    '''Token bucket with its state kept in a small file, so that a single
+    limit is shared by all the threads and processes on a host that use the
+    same file (e.g., several bulk jobs run at once).  Access to the state
+    is serialized with an exclusive :func:`fcntl.flock` lock on the file,
+    so it is only available on platforms that support it.  Every process
+    should use the same ``rate`` and ``capacity``.
+
+    :param path: path to the state file; created if it does not exist
+    :param rate: tokens (requests) per second
+    :param capacity: maximum number of tokens that can accumulate, as for
+        :class:`TokenBucket`
+    '''
+    # state file contents: number of tokens, and the time it was updated
+    _state = struct.Struct('<dd')
+
+    def __init__(self, path, rate, capacity=None):
+        if fcntl is None:
+            raise ImportError('SharedTokenBucket requires fcntl')
+        self.path = path
+        self._fd = None
+        self._pid = None
+        super(SharedTokenBucket, self).__init__(rate, capacity)
+
+    # wall clock time, since it is shared between processes
+    def clock(self):
+        return time.time()
+
+    def _file(self):
+        # open the state file, and open it again in a forked child process,
+        # since a lock on a file descriptor inherited from the parent
+        # would be shared with the parent
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _reserve(self, tokens, block):
+        # the thread lock is still needed, since threads in one process
+        # share the file lock
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(fd, self._state.size, 0)
+                now = self.clock()
+                if len(data) == self._state.size:
+                    available, updated = self._state.unpack(data)
+                    # ignore time going backwards, e.g. after a clock change
+                    available += max(0.0, now - updated) * self.rate
+                else:
+                    available = self.capacity
+                available = min(self.capacity, available)
+                wait = max(0.0, (tokens - available) / self.rate)
+                if wait and not block:
+                    available, wait = available + tokens, None
+                os.pwrite(fd, self._state.pack(available - tokens, now), 0)
+                return wait
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self):
+        '''Close the state file.'''
+        if self._fd is not None and self._pid == os.getpid():
+            os.close(self._fd)
+        self._fd = self._pid = None
+
+
+class RateLimiter(object):
+    '''Request rate limits for a client, with separate limits for reads
+    (GET requests) and writes (everything else)::
+
+        limiter = RateLimiter(read=50, write=10)
+        client = PidmanRestClient(url, username, password, rate_limiter=limiter)
+
+    Each limit is a :class:`TokenBucket` (or a subclass, e.g.
+    :class:`SharedTokenBucket`), or a number of requests per second for a
+    new :class:`TokenBucket`; use None for no limit.  The same bucket can
+    be used for both reads and writes to limit the total request rate.  A
+    rate limiter can be shared by several clients, including asyncio clients.
+
+    :param read: limit for read requests
+    :param write: limit for write requests
+    '''
+    #: http methods limited by the read limit
+    read_methods = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+    def __init__(self, read=None, write=None):
+        self.read = self._bucket(read)
+        self.write = self._bucket(write)
+
+    @classmethod
+    def shared(cls, path, read=None, write=None):
+        '''Create a rate limiter with limits shared by every process on
+        the host that uses the same path, using a :class:`SharedTokenBucket`
+        state file for each limit (``path`` with a ``.read`` or ``.write``
+        extension).
+
+        :param path: base path for the state files
+        :param read: read requests per second, or None for no limit
+        :param write: write requests per second, or None for no limit
+        '''
+        return cls(read=SharedTokenBucket('%s.read' % path, read) if read else None,
+                   write=SharedTokenBucket('%s.write' % path, write) if write else None)
+
+    @staticmethod
+    def _bucket(limit):
+        if limit is None or isinstance(limit, TokenBucket):
+            return limit
+        return TokenBucket(limit)
+
+    def bucket(self, method_name):
+        '''The bucket that limits requests with an http method, if any.'''
+        return self.read if method_name in self.read_methods else self.write
+
+    def acquire(self, method_name):
+        '''Wait until a request with the specified http method is allowed.
+
+        :returns: number of seconds spent waiting
+        '''
+        bucket = self.bucket(method_name)
+        return bucket.acquire() if bucket is not None else 0
+
+    async def acquire_async(self, method_name):
+        '''Wait without blocking the event loop until a request with the
+        specified http method is allowed.
+
+        :returns: number of seconds spent waiting
+        '''
+        bucket = self.bucket(method_name)
+        return await bucket.acquire_async() if bucket is not None else 0
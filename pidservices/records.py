@@ -0,0 +1,258 @@
+'''
+*"Have nothing in your houses that you do not know to be useful, or believe
+to be beautiful."* - **William Morris**
+
+Compact, read-only record types for pid, target, and domain information
+returned by the pidman REST API.  Records use ``__slots__`` instead of a
+per-object dictionary, share repeated values (e.g., the domain URI, or
+timestamps for pids created together) between records, store the pid URI
+as a shared prefix and the noid, and only decode the targets of a pid when
+they are accessed, so a large set of search results (e.g., a snapshot of
+every pid in a domain) takes less than a third of the memory of the
+equivalent dictionaries.
+
+Records are :class:`collections.abc.Mapping` objects, so existing code
+that reads results as dictionaries (``pid['name']``, ``pid.get('policy')``,
+``'targets' in pid``) continues to work, and a record compares equal to
+the dictionary it was created from.  Use :meth:`~PidRecord.to_dict` to get a
+plain dictionary, e.g. to modify or serialize as JSON.
+'''
+
+from collections.abc import Mapping
+import sys
+
+
+class _Record(Mapping):
+    '''Base class for slotted records.  Values for the fields listed in
+    ``_fields`` are stored in slots; any other values returned by the API
+    are kept in an extra dictionary, so no information is lost.'''
+    __slots__ = ('_extra',)
+
+    #: names of the values stored in slots, in API order
+    _fields = ()
+    #: fields with values that repeat across many records, which are
+    #: interned so that records share a single copy of each value
+    _shared = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # slot setters for each field, so that loading a record does not
+        # need an attribute lookup for every value
+        cls._setters = dict(
+            (field, getattr(cls, field if field in cls.__slots__ else '_' + field).__set__)
+            for field in cls._fields)
+
+    def __init__(self, **kwargs):
+        self._load(kwargs, {})
+
+    @classmethod
+    def from_dict(cls, data, strings=None):
+        '''Create a record from a dictionary as returned by the API.
+
+        :param strings: optional dictionary used to share equal strings
+            between records loaded together; see :meth:`from_list`
+        '''
+        record = cls.__new__(cls)
+        record._load(data, {} if strings is None else strings)
+        return record
+
+    @classmethod
+    def from_list(cls, data):
+        '''Create a list of records from a list of dictionaries.  Equal
+        strings in any of the records (e.g., the timestamps of pids created
+        in the same batch) are stored once.'''
+        strings = {}
+        return [cls.from_dict(item, strings) for item in data]
+
+    def _load(self, data, strings):
+        self._extra = None
+        setters, shared = self._setters, self._shared
+        # equal strings (e.g., a pid uri that is also the target access uri)
+        # are stored once
+        for key, value in data.items():
+            if type(value) is str:
+                value = strings.setdefault(value, value)
+                if key in shared:
+                    value = sys.intern(value)
+            setter = setters.get(key)
+            if setter is not None:
+                setter(self, value)
+            else:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[sys.intern(key)] = value
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                # fields not included in the API response are unset
+                raise KeyError(key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def _has(self, key):
+        return hasattr(self, key)
+
+    def __iter__(self):
+        for key in self._fields:
+            if self._has(key):
+                yield key
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join('%s=%r' % (key, self[key]) for key in self))
+
+    def to_dict(self):
+        '''Return the record information as a plain dictionary.'''
+        return dict((key, self[key]) for key in self)
+
+
+class TargetRecord(_Record):
+    '''Information about a single pid target.'''
+    __slots__ = ('uri', 'target_uri', 'access_uri', 'qualifier', 'proxy', 'active')
+    _fields = __slots__
+    _shared = frozenset(['qualifier', 'proxy'])
+
+
+class PidRecord(_Record):
+    '''Information about a single pid.  The list of targets is decoded into
+    :class:`TargetRecord` objects the first time it is accessed.'''
+    __slots__ = ('pid', 'type', '_uri', 'name', 'domain', 'external_system_id',
+                 'external_system_key', 'policy', 'created_by', 'created_at',
+                 'updated_by', 'updated_at', '_targets')
+    _fields = ('pid', 'type', 'uri', 'name', 'domain', 'external_system_id',
+               'external_system_key', 'policy', 'created_by', 'created_at',
+               'updated_by', 'updated_at', 'targets')
+    _shared = frozenset(['type', 'domain', 'external_system_id', 'policy',
+                         'created_by', 'updated_by'])
+
+    def _load(self, data, strings):
+        super()._load(data, strings)
+        uri = getattr(self, '_uri', None)
+        pid = getattr(self, 'pid', None)
+        if type(uri) is not str or type(pid) is not str or not pid or \
+          not uri.endswith(pid):
+            uri = None
+        if hasattr(self, '_targets'):
+            self._targets = _pack_targets(self._targets, strings, uri)
+        if uri is not None:
+            # store the pid uri as a prefix shared by every pid on the same
+            # server, e.g. http://pid.emory.edu/ark:/25593/
+            prefix = uri[:-len(pid)]
+            self._uri = _URI_PREFIXES.get(prefix) or \
+                _URI_PREFIXES.setdefault(prefix, _UriPrefix(prefix))
+
+    def _has(self, key):
+        # check for targets without decoding them
+        if key == 'targets':
+            return hasattr(self, '_targets')
+        return hasattr(self, key)
+
+    @property
+    def uri(self):
+        uri = self._uri
+        if type(uri) is _UriPrefix:
+            return uri + self.pid
+        return uri
+
+    @uri.setter
+    def uri(self, value):
+        self._uri = value
+
+    @property
+    def targets(self):
+        targets = self._targets
+        if type(targets) is _PackedTarget:
+            targets = (targets, )
+        if type(targets) is tuple:
+            uri = getattr(self, 'uri', None)
+            targets = self._targets = [_unpack_target(target, uri) for target in targets]
+        return targets
+
+    @targets.setter
+    def targets(self, value):
+        self._targets = value
+
+
+class DomainRecord(_Record):
+    '''Information about a single domain.'''
+    __slots__ = ('id', 'uri', 'name', 'policy', 'parent')
+    _fields = __slots__
+    _shared = frozenset(['policy', 'parent'])
+
+
+class _UriPrefix(str):
+    # the part of a pid uri before the noid; one instance for each prefix
+    __slots__ = ()
+
+
+_URI_PREFIXES = {}
+
+
+# targets are kept as tuples of values in field order until accessed;
+# a tuple takes much less memory than a dictionary or record.  A pid with
+# a single target (the most common case) stores the target tuple itself,
+# and values equal to the pid uri are stored as _PID_URI.
+class _PackedTarget(tuple):
+    __slots__ = ()
+
+
+_MISSING = object()
+_PID_URI = object()
+_TARGET_FIELDS = frozenset(TargetRecord._fields)
+
+
+def _pack_targets(targets, strings, uri):
+    if not isinstance(targets, list):
+        return targets
+    packed = tuple(_pack_target(target, strings, uri) for target in targets)
+    if len(packed) == 1 and type(packed[0]) is _PackedTarget:
+        return packed[0]
+    return packed
+
+
+def _pack_target(target, strings, uri):
+    if not isinstance(target, dict) or not _TARGET_FIELDS.issuperset(target):
+        return target
+    shared = TargetRecord._shared
+    values = []
+    for key in TargetRecord._fields:
+        value = target.get(key, _MISSING)
+        if type(value) is str:
+            if value == uri:
+                value = _PID_URI
+            elif key in shared:
+                value = sys.intern(value)
+            else:
+                value = strings.setdefault(value, value)
+        values.append(value)
+    return _PackedTarget(values)
+
+
+def _unpack_target(target, uri):
+    if type(target) is _PackedTarget:
+        return TargetRecord.from_dict(dict(
+            (key, uri if value is _PID_URI else value)
+            for key, value in zip(TargetRecord._fields, target)
+            if value is not _MISSING))
+    if isinstance(target, dict):
+        return TargetRecord.from_dict(target)
+    return target
+
+
+def search_results(data):
+    '''Convert the results in a page of pid search results to
+    :class:`PidRecord` objects.  Other values in the page (e.g.,
+    ``page_count``) are left as is.'''
+    if isinstance(data, dict) and 'results' in data:
+        data = dict(data, results=PidRecord.from_list(data['results']))
+    return data
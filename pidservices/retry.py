@@ -0,0 +1,213 @@
+'''
+*"Our greatest glory is not in never falling, but in rising every time
+we fall."* - **Confucius**
+
+Retry and circuit breaker support for pidman API requests, so that long
+running batch jobs can survive brief network or server problems.
+'''
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    '''Raised without making a request when a :class:`CircuitBreaker` is
+    open because the server is known to be unhealthy.'''
+
+
+class RetryPolicy(object):
+    '''Policy for retrying failed pidman API requests.  Requests that fail
+    with a connection error or timeout, or with one of the configured
+    status codes, are retried after an exponentially increasing delay.
+
+    By default, only idempotent requests (GET, PUT, DELETE) are retried;
+    a POST that fails after reaching the server may already have created
+    a new pid.
+
+    :param total: maximum number of retries for a single request; defaults to 3
+    :param backoff_factor: base delay in seconds; the delay before retry
+        *n* is ``backoff_factor * 2 ** (n - 1)``; defaults to 0.5
+    :param max_backoff: maximum delay in seconds between retries
+    :param jitter: if True (the default), use a random delay between zero
+        and the calculated backoff, so that many clients retrying at once
+        do not all retry at the same time
+    :param methods: http methods that should be retried
+    :param status_codes: response status codes that should be retried
+    :param respect_retry_after: if True (the default), wait as long as
+        requested by a ``Retry-After`` response header, up to ``max_retry_after``
+    :param max_retry_after: maximum delay in seconds to honor from a
+        ``Retry-After`` header
+    '''
+
+    #: exceptions that indicate a request can be retried
+    retry_exceptions = (requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout)
+
+    def __init__(self, total=3, backoff_factor=0.5, max_backoff=30, jitter=True,
+                 methods=('GET', 'PUT', 'DELETE'), status_codes=(429, 502, 503, 504),
+                 respect_retry_after=True, max_retry_after=120):
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.methods = frozenset(method.upper() for method in methods)
+        self.status_codes = frozenset(status_codes)
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+
+    def retry_response(self, method, status_code, attempt):
+        '''Check if a request that returned the specified status should be retried.
+
+        :param method: http method name, e.g. ``GET``
+        :param status_code: response status code
+        :param attempt: number of the attempt that failed, starting at 1
+        '''
+        return method in self.methods and status_code in self.status_codes \
+            and attempt <= self.total
+
+    def retry_exception(self, method, err, attempt):
+        '''Check if a request that raised the specified exception should be
+        retried.  :class:`CircuitOpenError` is never retried.
+
+        :param method: http method name, e.g. ``GET``
+        :param err: exception raised by the request
+        :param attempt: number of the attempt that failed, starting at 1
+        '''
+        return method in self.methods and attempt <= self.total \
+            and isinstance(err, self.retry_exceptions) \
+            and not isinstance(err, CircuitOpenError)
+
+    def backoff(self, attempt):
+        '''Delay in seconds before retrying after the specified attempt.'''
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def retry_after(self, headers):
+        '''Delay in seconds requested by a ``Retry-After`` header, either
+        a number of seconds or an http date, or None if not present or valid.
+
+        :param headers: response headers
+        '''
+        value = headers.get('Retry-After') if headers is not None else None
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                date = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=timezone.utc)
+            seconds = (date - datetime.now(timezone.utc)).total_seconds()
+        return min(max(0, seconds), self.max_retry_after)
+
+    def delay(self, attempt, headers=None):
+        '''Delay in seconds before retrying after the specified attempt,
+        using the ``Retry-After`` response header when present and allowed.
+
+        :param attempt: number of the attempt that failed, starting at 1
+        :param headers: response headers, if a response was received
+        '''
+        if self.respect_retry_after:
+            retry_after = self.retry_after(headers)
+            if retry_after is not None:
+                return retry_after
+        return self.backoff(attempt)
+
+    def sleep(self, attempt, headers=None):
+        '''Wait before retrying after the specified attempt; see :meth:`delay`.'''
+        time.sleep(self.delay(attempt, headers))
+
+
+class CircuitBreaker(object):
+    '''Circuit breaker for failing fast while the pidman server is known to
+    be unhealthy.  After ``failure_threshold`` consecutive failures (connection
+    errors or server error responses), the circuit opens and requests raise
+    :class:`CircuitOpenError` without contacting the server.  After
+    ``reset_timeout`` seconds, a single trial request is allowed; if it
+    succeeds the circuit closes, otherwise it opens again.
+
+    A single circuit breaker may be shared by several clients and threads.
+
+    :param failure_threshold: number of consecutive failures that open the circuit
+    :param reset_timeout: seconds to wait before allowing a trial request
+    :param failure_status_codes: response status codes counted as failures
+    '''
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30,
+                 failure_status_codes=(502, 503, 504)):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_status_codes = frozenset(failure_status_codes)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        '''Current state of the circuit: closed, open, or half-open.'''
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_request(self):
+        '''Check that a request may be made; raises :class:`CircuitOpenError`
+        if the circuit is open, or if it is half-open and a trial request is
+        already in progress.'''
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return
+        raise CircuitOpenError('Circuit breaker is open after %d consecutive failures'
+                               % self.failures)
+
+    def record_success(self):
+        '''Record a successful request, closing the circuit.'''
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        '''Record a failed request, opening the circuit if the failure
+        threshold is reached or a trial request failed.'''
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_progress or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_in_progress:
+                    logger.warning('Opening circuit breaker after %d consecutive failures',
+                                   self.failures)
+                self.opened_at = time.monotonic()
+                self._trial_in_progress = False
+
+    def record_response(self, status_code):
+        '''Record a request outcome based on the response status code.'''
+        if status_code in self.failure_status_codes:
+            self.record_failure()
+        else:
+            self.record_success()
@@ -0,0 +1,295 @@
+'''
+*"The only constant in life is change."* - **Heraclitus**
+
+Bulk rewriting of pid target URIs, e.g. to move every target in a domain
+to a new host.  A :class:`TargetRewriter` scans the results of a pid search
+one page at a time, applies a list of :class:`Rule` objects to each target,
+and updates the targets that change concurrently while the scan continues::
+
+    rules = [
+        Rule(r'^http://old\\.example\\.com/', 'https://new.example.com/',
+             type='ark', domain=domain_uri),
+    ]
+    rewriter = TargetRewriter(client, rules, workers=8)
+    summary = rewriter.run(dry_run=True, output=sys.stdout, domain='LSDI')
+    print(summary.report())
+
+A rule can also have a ``check`` function, to only apply the rule to targets
+that pass a test of their own, and can set targets active or inactive.  For
+example, to point each pid in a collection to a web application if the
+object can be viewed there, to the repository if the object exists but
+cannot be viewed, and otherwise to mark the target inactive::
+
+    rules = [
+        Rule(r'^.*$', 'https://app.example.com/documents/emory:{%PID%}',
+             check=viewable, active=True, name='app'),
+        Rule(r'^.*$', 'https://repo.example.com/objects/emory:{%PID%}',
+             check=exists, active=True, name='repository'),
+        Rule(r'^.*$', r'\\g<0>', active=False, name='missing'),
+    ]
+
+The ``rewrite_targets`` script runs a rewrite described in a config file.
+'''
+
+from collections import Counter, namedtuple
+import logging
+import re
+import time
+
+from pidservices.bulk import bounded_map
+from pidservices.clients import PidmanRestClient
+from pidservices.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class Rule(object):
+    '''A target rewrite rule: targets that match all of the specified
+    conditions have the first match of ``pattern`` in their target URI
+    replaced with ``replacement``.
+
+    :param pattern: regular expression to search for in the target URI
+    :param replacement: replacement for the matched text, as for
+        :func:`re.sub`, so it may include groups from the pattern (e.g.,
+        ``\\1``); may also include the
+        :attr:`~pidservices.clients.PidmanRestClient.pid_token`, which is
+        replaced with the noid of the pid
+    :param type: only match targets of this type of pid (ark or purl)
+    :param domain: only match pids in the domain with this URI
+    :param qualifier: only match targets with this qualifier; use an
+        empty string to only match unqualified targets
+    :param name: name for the rule in summary reports; defaults to the pattern
+    :param check: optional function called with the :class:`Change` for
+        each target the rule matches, e.g. to check that the new target URI
+        resolves; if it returns False, the rule is not applied and the
+        following rules are tried
+    :param active: if True or False, also set matching targets active or
+        inactive; to only change whether a target is active, use a
+        replacement of ``\\g<0>``
+    '''
+
+    def __init__(self, pattern, replacement, type=None, domain=None, qualifier=None,
+                 name=None, check=None, active=None):
+        if type is not None and type not in ('ark', 'purl'):
+            raise ValueError('Unsupported pid type: %s' % type)
+        self.pattern = re.compile(pattern)
+        self.replacement = replacement
+        self.type = type
+        self.domain = domain
+        self.qualifier = qualifier
+        self.name = name or self.pattern.pattern
+        self.check = check
+        self.active = active
+
+    def __repr__(self):
+        return '<Rule %s>' % self.name
+
+    def rewrite(self, type, domain, noid, qualifier, target_uri):
+        '''Apply the rule to a single target.
+
+        :returns: the new target URI, or None if the rule does not match
+        '''
+        if self.type is not None and type != self.type:
+            return None
+        if self.domain is not None and domain != self.domain:
+            return None
+        if self.qualifier is not None and qualifier != self.qualifier:
+            return None
+        new_uri, count = self.pattern.subn(self.replacement, target_uri, count=1)
+        if not count:
+            return None
+        return new_uri.replace(PidmanRestClient.pid_token, noid)
+
+
+class Change(namedtuple('Change', ['type', 'noid', 'qualifier', 'old_uri', 'new_uri',
+                                   'rule', 'active'], defaults=[None])):
+    '''A target URI to be rewritten, and the rule that matched it.
+    ``active`` is True or False if the target should also be set active or
+    inactive, or None to leave it as it is.'''
+    __slots__ = ()
+
+    def diff(self):
+        '''The change as a short diff, e.g. for reviewing a dry run.'''
+        target = '%s %s' % (self.type, self.noid)
+        if self.qualifier:
+            target += '/%s' % self.qualifier
+        rule = self.rule.name
+        if self.active is not None:
+            rule += ', active' if self.active else ', inactive'
+        return '@@ %s (%s)\n- %s\n+ %s\n' % (target, rule, self.old_uri, self.new_uri)
+
+
+class RewriteSummary(object):
+    '''Counts for a single rewrite run.'''
+
+    def __init__(self, dry_run=False):
+        #: True if targets were not actually updated
+        self.dry_run = dry_run
+        #: number of pids and targets scanned
+        self.pids = 0
+        self.targets = 0
+        #: number of targets matched by each rule, keyed on rule name
+        self.matched = Counter()
+        #: number of matched targets that were already rewritten
+        self.unchanged = 0
+        #: number of targets updated (or to be updated, for a dry run)
+        self.updated = 0
+        #: number of errors updating targets, keyed on the response status
+        #: or the exception class name
+        self.errors = Counter()
+        #: changes that could not be applied, as a list of tuples of the
+        #: :class:`Change` and the exception
+        self.failed = []
+        #: duration of the run, in seconds
+        self.elapsed = 0.0
+
+    def report(self):
+        '''The summary as text, one count per line.'''
+        verb = 'To update' if self.dry_run else 'Updated'
+        lines = ['Scanned %d pids, %d targets in %.1fs' % (self.pids, self.targets,
+                                                          self.elapsed)]
+        for name, count in self.matched.most_common():
+            lines.append('  matched %s: %d' % (name, count))
+        lines.append('%s: %d (%.1f/sec)' % (
+            verb, self.updated, self.updated / self.elapsed if self.elapsed else 0))
+        if self.unchanged:
+            lines.append('Unchanged: %d' % self.unchanged)
+        if self.errors:
+            lines.append('Errors: %d' % sum(self.errors.values()))
+            for label, count in self.errors.most_common():
+                lines.append('  %s: %d' % (label, count))
+        return '\n'.join(lines)
+
+
+def _error_label(err):
+    # response status for an http error, or the exception class name
+    response = getattr(err, 'response', None)
+    if response is not None:
+        return 'HTTP %s' % response.status_code
+    return type(err).__name__
+
+
+class TargetRewriter(object):
+    '''Rewrite pid target URIs in bulk, based on a list of :class:`Rule`
+    objects; for each target, the first rule that matches is applied.
+
+    Search results are scanned with
+    :meth:`~pidservices.clients.PidmanRestClient.iter_search_pids`, so only
+    a page or two of results is held in memory, and changed targets are
+    updated with :meth:`~pidservices.clients.PidmanRestClient.update_target`
+    on a pool of threads while the scan continues.  If any rule has a
+    ``check`` function, the rules are applied to several pids at once on a
+    second pool of threads, since a check usually makes a request of its
+    own; an exception raised by a check ends the run.
+
+    :param client: :class:`~pidservices.clients.PidmanRestClient`
+    :param rules: list of :class:`Rule` objects
+    :param workers: maximum number of targets to update concurrently, or
+        an :class:`~pidservices.concurrency.AdaptiveLimit` that is also
+        configured on the client
+    :param page_size: number of search results to request on each page
+    :param rate: optional maximum number of updates per second
+    '''
+
+    def __init__(self, client, rules, workers=8, page_size=100, rate=None):
+        self.client = client
+        self.rules = list(rules)
+        self.workers = workers
+        self.page_size = page_size
+        self.ratelimit = TokenBucket(rate, capacity=1) if rate else None
+
+    def rewrite(self, pid):
+        '''Apply the rules to the targets of a single pid (as returned by
+        a pid search), and generate a :class:`Change` for each target that
+        matches a rule.'''
+        type = pid['type'].lower()
+        for target in pid['targets']:
+            for rule in self.rules:
+                new_uri = rule.rewrite(type, pid['domain'], pid['pid'],
+                                       target['qualifier'] or '', target['target_uri'])
+                if new_uri is None:
+                    continue
+                # only set active if the target is not already
+                active = rule.active
+                if active is not None and target.get('active') == active:
+                    active = None
+                change = Change(type, pid['pid'], target['qualifier'] or '',
+                                target['target_uri'], new_uri, rule, active)
+                if rule.check is not None and not rule.check(change):
+                    continue
+                yield change
+                break
+
+    def changes(self, summary=None, **search):
+        '''Scan the results of a pid search, and generate a :class:`Change`
+        for each target that matches a rule and would be changed.  Takes
+        the same search parameters as
+        :meth:`~pidservices.clients.PidmanRestClient.search_pids`; if no
+        parameters are specified, all pids are scanned.
+
+        :param summary: optional :class:`RewriteSummary` to update with
+            counts of the pids and targets scanned
+        '''
+        pids = self.client.iter_search_pids(count=self.page_size, **search)
+        if any(rule.check is not None for rule in self.rules):
+            scanned = bounded_map(lambda pid: (pid, list(self.rewrite(pid))), pids,
+                                  workers=self.workers)
+        else:
+            scanned = ((pid, self.rewrite(pid)) for pid in pids)
+        for pid, changes in scanned:
+            if summary is not None:
+                summary.pids += 1
+                summary.targets += len(pid['targets'])
+            for change in changes:
+                if summary is not None:
+                    summary.matched[change.rule.name] += 1
+                if change.new_uri == change.old_uri and change.active is None:
+                    if summary is not None:
+                        summary.unchanged += 1
+                    continue
+                yield change
+
+    def _apply(self, change):
+        if self.ratelimit is not None:
+            self.ratelimit.acquire()
+        self.client.update_target(change.type, change.noid, change.qualifier,
+                                  target_uri=change.new_uri, active=change.active)
+        return change
+
+    def run(self, dry_run=False, output=None, **search):
+        '''Rewrite the targets of the pids in a search; see :meth:`changes`.
+
+        :param dry_run: if True, report the changes without updating
+            any targets
+        :param output: optional file object; a diff of each change is
+            written to it when the change has been made (or, for a dry run,
+            as it is found)
+        :returns: :class:`RewriteSummary`
+        '''
+        summary = RewriteSummary(dry_run=dry_run)
+        start = time.perf_counter()
+        changes = self.changes(summary=summary, **search)
+        if dry_run:
+            results = changes
+        else:
+            # wrap each change so a failed update can be reported with it
+            def apply(change):
+                try:
+                    return self._apply(change), None
+                except Exception as err:
+                    return change, err
+            results = bounded_map(apply, changes, workers=self.workers, ordered=False)
+
+        for result in results:
+            change, err = result if not dry_run else (result, None)
+            if err is not None:
+                logger.error('Error updating %s %s target %r: %s', change.type,
+                             change.noid, change.qualifier, err)
+                summary.errors[_error_label(err)] += 1
+                summary.failed.append((change, err))
+                continue
+            summary.updated += 1
+            if output is not None:
+                output.write(change.diff())
+        summary.elapsed = time.perf_counter() - start
+        return summary
@@ -0,0 +1,109 @@
+'''
+*"Many hands make light work."* - **John Heywood**
+
+Request coalescing: when several threads (or asyncio tasks) make the same
+call at the same time, only the first one runs it, and the others wait for
+and share its result, or its exception.  Used by the pidman clients so that
+concurrent identical GET requests (e.g., for a popular ARK when a cached
+copy expires) result in a single request to the pid manager.
+
+Results are only shared by calls that overlap; nothing is kept once a call
+completes, so a call made afterwards runs again.
+'''
+
+import asyncio
+import threading
+
+
+class _Call(object):
+    # a call in progress, and its outcome
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''Coalesces concurrent calls with the same key, across threads.'''
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        '''Call ``func`` with the specified arguments, unless a call with
+        the same key is already in progress, in which case wait for that
+        call to complete and return its result (or raise its exception).
+
+        :param key: hashable key identifying the call
+        :returns: tuple of the result, and a boolean indicating whether
+            the result came from a call made by another caller
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def __len__(self):
+        # number of calls in progress
+        return len(self._calls)
+
+
+class AsyncSingleFlight(object):
+    '''Coalesces concurrent calls with the same key, across asyncio tasks
+    in a single event loop.  The shared call runs in its own task, so that
+    cancelling the task that started it does not cancel it for the others
+    waiting on the result.'''
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        '''Await the coroutine function ``func`` with the specified
+        arguments, unless a call with the same key is already in progress,
+        in which case wait for that call and return its result (or raise its
+        exception).
+
+        :param key: hashable key identifying the call
+        :returns: tuple of the result, and a boolean indicating whether
+            the result came from a call made by another caller
+        '''
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = self._calls[key] = asyncio.ensure_future(func(*args, **kwargs))
+        task.add_done_callback(lambda task: self._done(key, task))
+        return await asyncio.shield(task), False
+
+    def _done(self, key, task):
+        del self._calls[key]
+        if not task.cancelled():
+            # mark the exception as retrieved, in case every caller was cancelled
+            task.exception()
+
+    def __len__(self):
+        # number of calls in progress
+        return len(self._calls)
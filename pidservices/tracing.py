@@ -0,0 +1,178 @@
+'''
+*"Time is what we want most, but what we use worst."* - **William Penn**
+
+Lightweight tracing for pidman API requests.  A :class:`Tracer` creates a
+:class:`Span` for each request, with the API operation, noid, url template,
+response status, and timing, and passes a W3C ``traceparent`` header to the
+server so requests can be matched with server logs.  Spans for requests
+made within :meth:`Tracer.span` (e.g., all the pid requests for a single
+ingest) share a trace id and have that span as their parent, so it is
+possible to see where the time goes when one task makes many pid calls.
+
+No tracing library is required; to send spans to one (e.g. OpenTelemetry),
+pass ``on_start`` / ``on_end`` callbacks or subclass :class:`Tracer`.
+'''
+
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import random
+import re
+import time
+
+# span for the current task, if any; used as the parent for new spans
+_current_span = contextvars.ContextVar('pidservices_current_span', default=None)
+
+TRACEPARENT_REGEXP = re.compile(
+    r'^(?P<version>[0-9a-f]{2})-(?P<trace_id>[0-9a-f]{32})-'
+    r'(?P<span_id>[0-9a-f]{16})-(?P<flags>[0-9a-f]{2})$')
+
+
+def _trace_id():
+    return '%032x' % random.getrandbits(128)
+
+
+def _span_id():
+    return '%016x' % random.getrandbits(64)
+
+
+class Span(object):
+    '''Timing and details for a single pidman API request, or for a block
+    of code that makes requests (see :meth:`Tracer.span`).'''
+    __slots__ = ('operation', 'method', 'url', 'url_template', 'noid',
+                 'trace_id', 'span_id', 'parent_id', 'start_time', 'duration',
+                 'status', 'error', 'attributes', '_started')
+
+    def __init__(self, operation, method=None, url=None, url_template=None, noid=None,
+                 trace_id=None, parent_id=None):
+        #: name of the API operation, e.g. ``get_pid``
+        self.operation = operation
+        #: http method
+        self.method = method
+        #: full request url
+        self.url = url
+        #: request url with the noid replaced by ``{noid}``, for grouping
+        self.url_template = url_template
+        #: noid the request is for, if any
+        self.noid = noid
+        self.trace_id = trace_id or _trace_id()
+        self.span_id = _span_id()
+        #: span id of the parent span, if any
+        self.parent_id = parent_id
+        #: start time, in seconds since the epoch
+        self.start_time = time.time()
+        #: duration in seconds, once the span has ended
+        self.duration = None
+        #: response status code, if a response was received
+        self.status = None
+        #: exception, if the request failed
+        self.error = None
+        #: any additional information
+        self.attributes = {}
+        self._started = time.perf_counter()
+
+    @property
+    def traceparent(self):
+        '''W3C trace context ``traceparent`` header value for this span.'''
+        return '00-%s-%s-01' % (self.trace_id, self.span_id)
+
+    def end(self, status=None, error=None):
+        '''Record the end of the span.'''
+        self.duration = time.perf_counter() - self._started
+        if status is not None:
+            self.status = status
+        if error is not None:
+            self.error = error
+
+    def __repr__(self):
+        return '<Span %s %s %s>' % (self.operation, self.url_template or self.url or '',
+                                    '%.1fms' % (self.duration * 1000)
+                                    if self.duration is not None else 'in progress')
+
+
+class Tracer(object):
+    '''Creates and collects :class:`Span` objects for pidman API requests.
+    Pass a tracer to a client to trace its requests::
+
+        tracer = Tracer()
+        client = PidmanRestClient(url, username, password, tracer=tracer)
+        with tracer.span('ingest', item=item_id):
+            ...  # pid requests made here are part of the ingest trace
+        for span in tracer.finished:
+            print(span.operation, span.noid, span.duration)
+
+    :param max_spans: number of most recently finished spans to keep in
+        :attr:`finished`; use 0 to not keep any, or None to keep all
+    :param on_start: optional function to call with each new span
+    :param on_end: optional function to call with each span when it ends,
+        e.g. to send it to a tracing library
+    '''
+
+    def __init__(self, max_spans=1000, on_start=None, on_end=None):
+        #: recently finished spans, oldest first
+        self.finished = deque(maxlen=max_spans)
+        self.on_start = on_start
+        self.on_end = on_end
+
+    def start_span(self, operation, method=None, url=None, url_template=None, noid=None,
+                   traceparent=None):
+        '''Start a new span, as a child of the current span if there is one.
+
+        :param traceparent: optional ``traceparent`` header value from an
+            incoming request, to continue an existing trace instead
+        '''
+        match = TRACEPARENT_REGEXP.match(traceparent) if traceparent else None
+        parent = _current_span.get()
+        if match is not None:
+            span = Span(operation, method, url, url_template, noid,
+                        trace_id=match.group('trace_id'), parent_id=match.group('span_id'))
+        elif parent is not None:
+            span = Span(operation, method, url, url_template, noid,
+                        trace_id=parent.trace_id, parent_id=parent.span_id)
+        else:
+            span = Span(operation, method, url, url_template, noid)
+        if self.on_start is not None:
+            self.on_start(span)
+        return span
+
+    def end_span(self, span, status=None, error=None):
+        '''End a span started with :meth:`start_span`.'''
+        span.end(status, error)
+        if self.finished.maxlen != 0:
+            self.finished.append(span)
+        if self.on_end is not None:
+            self.on_end(span)
+
+    @contextmanager
+    def span(self, operation, traceparent=None, **attributes):
+        '''Context manager for a span around a block of code; requests made
+        within the block, including from other asyncio tasks it starts and
+        from the client's bulk methods, are traced as its children.
+
+        :param operation: name for the span
+        :param traceparent: optional ``traceparent`` header value from an
+            incoming request, to continue an existing trace
+        :param attributes: any additional information to store on the span
+        '''
+        span = self.start_span(operation, traceparent=traceparent)
+        span.attributes.update(attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            span.error = err
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def spans(self, trace_id=None, operation=None):
+        '''Finished spans, optionally filtered by trace id or operation.'''
+        return [span for span in self.finished
+                if (trace_id is None or span.trace_id == trace_id) and
+                (operation is None or span.operation == operation)]
+
+
+def current_span():
+    '''The span for the currently running code, if any (see :meth:`Tracer.span`).'''
+    return _current_span.get()
@@ -10,7 +10,10 @@ setup(
     install_requires=[
         'requests',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+    },
     setup_requires=['pytest-runner'],
-    scripts=['scripts/allocate_pids',],
-    tests_require=['pytest', 'django', 'mock>=1.0.1', 'pytest-cov'],
+    scripts=['scripts/allocate_pids', 'scripts/rewrite_targets'],
+    tests_require=['pytest', 'django', 'mock>=1.0.1', 'pytest-cov', 'aiohttp'],
 )
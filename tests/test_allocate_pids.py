@@ -0,0 +1,103 @@
+import contextlib
+import importlib.machinery
+import importlib.util
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pidservices.concurrency import AdaptiveLimit
+
+
+def load_script(name):
+    # scripts are installed without a .py extension, so load by path
+    path = os.path.join(os.path.dirname(__file__), os.pardir, 'scripts', name)
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader(name, loader))
+    loader.exec_module(module)
+    return module
+
+
+allocate_pids = load_script('allocate_pids')
+
+
+class AllocatePidsArgsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def parse_args(self, *args):
+        script = allocate_pids.AllocatePids()
+        script.config_arg_parser()
+        return script.parser.parse_args(list(args))
+
+    def run_script(self, *args):
+        # run the script, and return the exit status and error output
+        stderr = io.StringIO()
+        with patch.object(sys, 'argv', ['allocate_pids'] + list(args)), \
+          contextlib.redirect_stderr(stderr):
+            try:
+                allocate_pids.AllocatePids().run()
+                status = 0
+            except SystemExit as exit:
+                status = exit.code
+        return status, stderr.getvalue()
+
+    def configfile(self, **options):
+        path = os.path.join(self.tmpdir, 'allocate.cfg')
+        with open(path, 'w') as cfgfile:
+            cfgfile.write('[Pid Options]\n')
+            for option, value in options.items():
+                cfgfile.write('%s = %s\n' % (option, value))
+        return path
+
+    def test_workers(self):
+        self.assertEqual(8, self.parse_args('--workers', '8').workers)
+        self.assertIsInstance(self.parse_args('--workers', 'auto').workers, AdaptiveLimit)
+        for value in ['0', '-2', 'many', '2.5']:
+            status, errors = self.run_script('--workers', value)
+            self.assertEqual(2, status)
+            self.assertIn('usage: allocate_pids', errors)
+            self.assertIn('argument --workers/-w: must be a positive integer or "auto"',
+                          errors)
+
+    def test_rate(self):
+        self.assertEqual(2.5, self.parse_args('--rate', '2.5').rate)
+        for value in ['0', '-1', 'fast', 'nan', 'inf']:
+            status, errors = self.run_script('--rate', value)
+            self.assertEqual(2, status)
+            self.assertIn('usage: allocate_pids', errors)
+            self.assertIn('argument --rate/-r: must be a positive number', errors)
+
+    def test_config_workers(self):
+        for value in ['0', '-2', 'many']:
+            status, errors = self.run_script('-c', self.configfile(workers=value))
+            self.assertEqual(2, status)
+            self.assertIn('usage: allocate_pids', errors)
+            self.assertIn('workers in config file', errors)
+            self.assertIn('must be a positive integer or "auto"', errors)
+
+    def test_config_rate(self):
+        for value in ['0', '-1', 'fast']:
+            status, errors = self.run_script('-c', self.configfile(rate=value))
+            self.assertEqual(2, status)
+            self.assertIn('usage: allocate_pids', errors)
+            self.assertIn('rate in config file', errors)
+            self.assertIn('must be a positive number', errors)
+
+    def test_config_values(self):
+        # valid config values are converted as the command-line arguments are
+        path = os.path.join(self.tmpdir, 'generated.cfg')
+        status, errors = self.run_script('-c', self.configfile(workers='4', rate='10'),
+                                         '-g', path, '-q')
+        self.assertEqual(0, status)
+        with open(path) as cfgfile:
+            generated = cfgfile.read()
+        self.assertIn('workers = 4\n', generated)
+        self.assertIn('rate = 10.0\n', generated)
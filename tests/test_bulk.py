@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from pidservices.bulk import bounded_map, bounded_map_async
+from pidservices.concurrency import AdaptiveLimit
+
+
+class BoundedMapTest(unittest.TestCase):
+
+    def test_ordered(self):
+        # later items finish first, but results are in input order
+        def slow_square(n):
+            time.sleep(0.001 * (10 - n))
+            return n * n
+        self.assertEqual([n * n for n in range(10)],
+                         list(bounded_map(slow_square, range(10), workers=4)))
+
+    def test_unordered(self):
+        results = bounded_map(lambda n: n * n, range(10), workers=3, ordered=False)
+        self.assertEqual(sorted(n * n for n in range(10)), sorted(results))
+
+    def test_exceptions(self):
+        def check(n):
+            if n == 3:
+                raise ValueError('bad item')
+            return n
+
+        self.assertRaises(ValueError, list, bounded_map(check, range(5)))
+        results = list(bounded_map(check, range(5), return_exceptions=True))
+        self.assertEqual([0, 1, 2], results[:3])
+        self.assertTrue(isinstance(results[3], ValueError))
+        self.assertEqual(4, results[4])
+
+    def test_concurrency_bound(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max': 0}
+
+        def track(n):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            time.sleep(0.005)
+            with lock:
+                state['running'] -= 1
+            return n
+
+        list(bounded_map(track, range(20), workers=3))
+        self.assertEqual(3, state['max'])
+
+    def test_lazy_input(self):
+        # only a small window of the input is consumed ahead of the results
+        consumed = []
+
+        def items():
+            for n in range(1000):
+                consumed.append(n)
+                yield n
+
+        results = bounded_map(lambda n: n, items(), workers=2)
+        self.assertEqual(0, next(results))
+        results.close()
+        self.assertTrue(len(consumed) <= 5)
+
+        self.assertRaises(ValueError, list, bounded_map(lambda n: n, [1], workers=0))
+
+    def test_adaptive_limit(self):
+        limit = AdaptiveLimit(initial=2, maximum=6)
+        lock = threading.Lock()
+        state = {'running': 0, 'max': []}
+
+        def track(n):
+            with lock:
+                state['running'] += 1
+                state['max'].append((limit.limit, state['running']))
+            time.sleep(0.002 * (n % 3))
+            with lock:
+                state['running'] -= 1
+            limit.record(0.002, 200 if n < 40 else 503)
+            return n
+
+        self.assertEqual(list(range(60)), list(bounded_map(track, range(60), workers=limit)))
+        # the number of calls in flight follows the limit as it changes
+        self.assertTrue(all(running <= 2 for lim, running in state['max'][:3]))
+        self.assertTrue(max(running for lim, running in state['max']) >= 5)
+        self.assertTrue(all(running <= 6 for lim, running in state['max']))
+        self.assertEqual(1, limit.limit)
+
+        results = bounded_map(track, range(20), workers=AdaptiveLimit(initial=3),
+                              ordered=False)
+        self.assertEqual(list(range(20)), sorted(results))
+
+
+class BoundedMapAsyncTest(unittest.TestCase):
+
+    def run_map(self, func, items, **kwargs):
+        async def collect():
+            return [result async for result in bounded_map_async(func, items, **kwargs)]
+        return asyncio.run(collect())
+
+    def test_ordered(self):
+        async def slow_square(n):
+            await asyncio.sleep(0.001 * (10 - n))
+            return n * n
+        self.assertEqual([n * n for n in range(10)],
+                         self.run_map(slow_square, range(10), workers=4))
+        self.assertEqual(sorted(n * n for n in range(10)),
+                         sorted(self.run_map(slow_square, range(10), workers=3,
+                                             ordered=False)))
+
+    def test_exceptions(self):
+        async def check(n):
+            if n == 3:
+                raise ValueError('bad item')
+            return n
+
+        self.assertRaises(ValueError, self.run_map, check, range(5))
+        results = self.run_map(check, range(5), return_exceptions=True)
+        self.assertEqual([0, 1, 2, 4], results[:3] + results[4:])
+        self.assertTrue(isinstance(results[3], ValueError))
+
+    def test_bounded(self):
+        # no more than workers tasks run at once, and only a small window
+        # of the input is consumed ahead of the results
+        state = {'running': 0, 'max': 0, 'consumed': 0}
+
+        def items():
+            for n in range(100):
+                state['consumed'] += 1
+                yield n
+
+        async def track(n):
+            state['running'] += 1
+            state['max'] = max(state['max'], state['running'])
+            await asyncio.sleep(0.001)
+            state['running'] -= 1
+            return n
+
+        async def first_result():
+            results = bounded_map_async(track, items(), workers=3)
+            first = await results.__anext__()
+            await results.aclose()
+            return first
+
+        self.assertEqual(0, asyncio.run(first_result()))
+        self.assertTrue(state['consumed'] <= 6)
+        self.assertEqual(list(range(100)), self.run_map(track, range(100), workers=3))
+        self.assertEqual(3, state['max'])
+
+        limit = AdaptiveLimit(initial=2, maximum=4)
+        state['max'] = 0
+        self.assertEqual(list(range(20)), self.run_map(track, range(20), workers=limit))
+        self.assertEqual(2, state['max'])
+
+        self.assertRaises(ValueError, self.run_map, track, [1], workers=0)
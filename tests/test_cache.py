@@ -0,0 +1,189 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from pidservices.cache import LRUCache, SQLiteCache, TieredCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(maxsize=10)
+        self.assertEqual(None, cache.get('aa'))
+        self.assertEqual('missing', cache.get('aa', 'missing'))
+        cache.set('aa', {'pid': 'aa'})
+        self.assertEqual({'pid': 'aa'}, cache.get('aa'))
+        cache.set('aa', {'pid': 'aa', 'name': 'updated'})
+        self.assertEqual('updated', cache.get('aa')['name'])
+        self.assertEqual(1, len(cache))
+        cache.delete('aa')
+        self.assertEqual(None, cache.get('aa'))
+        self.assertEqual({'hits': 2, 'misses': 3, 'evictions': 0, 'revalidations': 0,
+                          'size': 0, 'maxsize': 10}, cache.stats())
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=10)
+        cache.set('aa', 1)
+        cache.set('bb', 2, ttl=100)
+        later = time.monotonic() + 11
+        with patch('pidservices.cache.time.monotonic', return_value=later):
+            self.assertEqual(None, cache.get('aa'))
+            self.assertEqual(2, cache.get('bb'))
+        self.assertEqual(1, len(cache))
+
+    def test_revalidation(self):
+        cache = LRUCache(ttl=10)
+        cache.set('aa', 1, etag='"v1"')
+        cache.set('bb', 2, last_modified='Wed, 21 Oct 2015 07:28:00 GMT')
+        cache.set('cc', 3)
+        later = time.monotonic() + 11
+        with patch('pidservices.cache.time.monotonic', return_value=later):
+            for key in ['aa', 'bb', 'cc']:
+                self.assertEqual(None, cache.get(key))
+            # expired entries with validators are kept for revalidation
+            self.assertEqual('"v1"', cache.get_entry('aa').etag)
+            self.assertTrue(cache.get_entry('bb').revalidatable)
+            self.assertEqual(None, cache.get_entry('cc'))
+
+            cache.refresh('aa')
+            self.assertEqual(1, cache.get('aa'))
+        self.assertEqual(1, cache.stats()['revalidations'])
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=3)
+        for key in ['aa', 'bb', 'cc']:
+            cache.set(key, key)
+        # access aa so that bb is least recently used
+        cache.get('aa')
+        cache.set('dd', 'dd')
+        self.assertEqual(None, cache.get('bb'))
+        for key in ['aa', 'cc', 'dd']:
+            self.assertEqual(key, cache.get(key))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        cache.set(('pid', 'ark', 'aa'), 1, tag=('ark', 'aa'))
+        cache.set(('target', 'ark', 'aa', ''), 2, tag=('ark', 'aa'))
+        cache.set(('target', 'ark', 'aa', 'PDF'), 3, tag=('ark', 'aa'))
+        cache.set(('pid', 'ark', 'bb'), 4, tag=('ark', 'bb'))
+        cache.invalidate(('ark', 'aa'))
+        self.assertEqual(1, len(cache))
+        self.assertEqual(4, cache.get(('pid', 'ark', 'bb')))
+        # invalidating an unknown tag is not an error
+        cache.invalidate(('purl', 'cc'))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+class SQLiteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'pidcache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set(self):
+        cache = SQLiteCache(self.path, ttl=10)
+        key = ('pid', 'ark', 'aa')
+        self.assertEqual(None, cache.get(key))
+        cache.set(key, {'pid': 'aa'}, tag=('ark', 'aa'))
+        self.assertEqual({'pid': 'aa'}, cache.get(key))
+        self.assertEqual(1, len(cache))
+
+        # shared with another cache instance (e.g., another process)
+        other = SQLiteCache(self.path)
+        self.assertEqual({'pid': 'aa'}, other.get(key))
+        self.assertEqual(('ark', 'aa'), other.get_entry(key).tag)
+        other.invalidate(('ark', 'aa'))
+        self.assertEqual(None, cache.get(key))
+
+        cache.set(key, 1)
+        cache.delete(key)
+        self.assertEqual(None, cache.get(key))
+        cache.set(key, 1)
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(3, stats['misses'])
+
+        # uses write-ahead logging
+        journal_mode = sqlite3.connect(self.path).execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual('wal', journal_mode)
+
+    def test_ttl_and_revalidation(self):
+        cache = SQLiteCache(self.path, ttl=10)
+        cache.set('aa', 1)
+        cache.set('bb', 2, etag='"v1"')
+        later = time.time() + 11
+        with patch('pidservices.cache.time.time', return_value=later):
+            self.assertEqual(None, cache.get('aa'))
+            self.assertEqual(None, cache.get('bb'))
+            self.assertEqual(None, cache.get_entry('aa'))
+            entry = cache.get_entry('bb')
+            self.assertEqual('"v1"', entry.etag)
+            self.assertFalse(entry.fresh())
+            cache.refresh('bb')
+            self.assertEqual(2, cache.get('bb'))
+        self.assertEqual(1, cache.stats()['revalidations'])
+
+    def test_eviction(self):
+        cache = SQLiteCache(self.path, maxsize=5)
+        cache.evict_interval = 1000
+        now = time.time()
+        for i in range(8):
+            with patch('pidservices.cache.time.time', return_value=now + i):
+                cache.set('key%d' % i, i)
+        self.assertEqual(3, cache.evict())
+        self.assertEqual(5, len(cache))
+        # least recently used entries are removed
+        self.assertEqual(None, cache.get('key0'))
+        self.assertEqual(7, cache.get('key7'))
+
+    def test_threads(self):
+        cache = SQLiteCache(self.path)
+
+        def update(n):
+            for i in range(20):
+                cache.set(('thread', n, i), i)
+                self.assertEqual(i, cache.get(('thread', n, i)))
+
+        threads = [threading.Thread(target=update, args=(n, )) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(80, len(cache))
+
+    def test_tiered_warm_start(self):
+        shared = SQLiteCache(self.path)
+        shared.set(('pid', 'ark', 'aa'), {'pid': 'aa'}, tag=('ark', 'aa'))
+        shared.set(('pid', 'ark', 'bb'), {'pid': 'bb'}, tag=('ark', 'bb'))
+
+        cache = TieredCache(LRUCache(), SQLiteCache(self.path))
+        # local cache is pre-loaded from the shared cache
+        self.assertEqual(2, len(cache.local))
+        self.assertEqual({'pid': 'aa'}, cache.local.get(('pid', 'ark', 'aa')))
+
+        # values set in the shared cache are copied into the local cache
+        shared.set(('pid', 'ark', 'cc'), {'pid': 'cc'}, tag=('ark', 'cc'))
+        self.assertEqual({'pid': 'cc'}, cache.get(('pid', 'ark', 'cc')))
+        self.assertEqual({'pid': 'cc'}, cache.local.get(('pid', 'ark', 'cc')))
+
+        # invalidation applies to both levels
+        cache.invalidate(('ark', 'cc'))
+        self.assertEqual(None, cache.get(('pid', 'ark', 'cc')))
+        self.assertEqual(None, shared.get(('pid', 'ark', 'cc')))
+
+        cache.set('dd', 4)
+        self.assertEqual(4, shared.get('dd'))
+        self.assertEqual(['local', 'shared'], sorted(cache.stats().keys()))
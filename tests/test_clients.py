@@ -5,7 +5,12 @@
 
 """
 
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
+import logging
+import threading
+import time
 import unittest
 from mock import patch, MagicMock
 import requests
@@ -18,8 +23,14 @@ settings.configure(
     PIDMAN_PASSWORD='testpass',
 )
 
-from pidservices.clients import PidmanRestClient, is_ark, parse_ark
+from pidservices.clients import PidmanRestClient, AsyncPidmanRestClient, \
+    is_ark, parse_ark, parse_arks, noid_check_character, valid_noid, validate_arks
 from pidservices.djangowrapper.shortcuts import DjangoPidmanRestClient
+from pidservices.cache import LRUCache
+from pidservices.metrics import ClientMetrics
+from pidservices.records import PidRecord, TargetRecord, DomainRecord
+from pidservices.retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+from pidservices.tracing import Tracer
 
 # Mock httplib so we don't need an actual server to test against.
 class MockHttpResponse():
@@ -104,6 +115,440 @@ class PidmanRestClientTest(unittest.TestCase):
             '/pidman',
             'Path not correctly set when baseurl specified with trailing slash')
 
+    def test_connection_pool(self):
+        """Tests connection pool configuration and statistics."""
+        client = PidmanRestClient(self.baseurl, pool_connections=2, pool_maxsize=20,
+                                  pool_block=True)
+        adapter = client.session.get_adapter(self.baseurl)
+        self.assertEqual(20, adapter.poolmanager.connection_pool_kw['maxsize'])
+        self.assertEqual(True, adapter.poolmanager.connection_pool_kw['block'])
+        self.assertTrue('Connection' not in client.session.headers)
+        # no requests made yet
+        self.assertEqual({'pools': 0, 'requests': 0, 'connections_created': 0,
+                          'connections_reused': 0, 'idle_connections': 0},
+                         client.pool_stats())
+
+        client = PidmanRestClient(self.baseurl, keep_alive=False)
+        self.assertEqual('close', client.session.headers['Connection'])
+
+        # make real requests to a local server to check connection reuse
+        class PidHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                body = b'{"pid": "aa"}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), PidHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            client = PidmanRestClient('http://127.0.0.1:%d/' % server.server_port)
+            for i in range(5):
+                self.assertEqual({'pid': 'aa'}, client.get_ark('aa'))
+            stats = client.pool_stats()
+            self.assertEqual(1, stats['pools'])
+            self.assertEqual(5, stats['requests'])
+            self.assertEqual(1, stats['connections_created'])
+            self.assertEqual(4, stats['connections_reused'])
+            self.assertEqual(1, stats['idle_connections'])
+        finally:
+            client.session.close()
+            server.shutdown()
+            server.server_close()
+
+    @patch('pidservices.retry.time.sleep')
+    def test_retries(self, mocksleep):
+        """Tests retrying failed requests."""
+        client = self._new_client()
+        unavailable = MagicMock(status_code=requests.codes.service_unavailable,
+                                content='', headers={'Retry-After': '2'})
+        ok = MagicMock(status_code=requests.codes.ok, headers={})
+        ok.json.return_value = {'pid': 'aa'}
+        with patch.object(client, 'session') as mocksession:
+            # GET is retried after server unavailable response and connection error
+            mocksession.get = MagicMock(__name__='get', side_effect=[
+                unavailable, requests.exceptions.ConnectionError('reset'), ok])
+            self.assertEqual({'pid': 'aa'}, client.get_ark('aa'))
+            self.assertEqual(3, mocksession.get.call_count)
+            self.assertEqual(2, mocksleep.call_count)
+            # retry-after header is honored
+            mocksleep.assert_any_call(2)
+            # the retried response is closed to release its connection
+            unavailable.close.assert_called_once_with()
+
+            # retries are limited by the policy
+            mocksession.get = MagicMock(__name__='get', return_value=unavailable)
+            unavailable.raise_for_status.side_effect = requests.exceptions.HTTPError
+            self.assertRaises(requests.exceptions.HTTPError, client.get_ark, 'aa')
+            self.assertEqual(client.retry_policy.total + 1, mocksession.get.call_count)
+
+            # POST is not retried by default
+            mocksession.post = MagicMock(__name__='post', return_value=unavailable)
+            self.assertRaises(requests.exceptions.HTTPError, client.create_ark,
+                              'domain', 'http://some.url')
+            self.assertEqual(1, mocksession.post.call_count)
+
+        # per-method retry policy
+        client = PidmanRestClient(self.baseurl, method_retry_policies={
+            'POST': RetryPolicy(total=1, methods=['POST']), 'GET': None})
+        with patch.object(client, 'session') as mocksession:
+            mocksession.post = MagicMock(__name__='post', return_value=unavailable)
+            self.assertRaises(requests.exceptions.HTTPError, client.create_ark,
+                              'domain', 'http://some.url')
+            self.assertEqual(2, mocksession.post.call_count)
+            mocksession.get = MagicMock(__name__='get', return_value=unavailable)
+            self.assertRaises(requests.exceptions.HTTPError, client.get_ark, 'aa')
+            self.assertEqual(1, mocksession.get.call_count)
+
+        # retries disabled
+        client = PidmanRestClient(self.baseurl, retry_policy=False)
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get',
+                side_effect=requests.exceptions.ConnectionError('reset'))
+            self.assertRaises(requests.exceptions.ConnectionError, client.get_ark, 'aa')
+            self.assertEqual(1, mocksession.get.call_count)
+
+    def test_circuit_breaker(self):
+        """Tests failing fast when the circuit breaker is open."""
+        client = PidmanRestClient(self.baseurl, retry_policy=False,
+            circuit_breaker=CircuitBreaker(failure_threshold=2))
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get',
+                side_effect=requests.exceptions.ConnectionError('reset'))
+            for i in range(2):
+                self.assertRaises(requests.exceptions.ConnectionError, client.get_ark, 'aa')
+            self.assertRaises(CircuitOpenError, client.get_ark, 'aa')
+            self.assertEqual(2, mocksession.get.call_count)
+
+    def test_cache(self):
+        """Tests caching pid, target, and domain information."""
+        client = PidmanRestClient(self.baseurl, self.username, self.password,
+                                  cache=LRUCache())
+        pid_data = {'pid': 'aa', 'name': 'foo'}
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = self.mock_get
+            mocksession.put = self.mock_put
+            mocksession.delete = self.mock_delete
+            self.mock_get.return_value.status_code = requests.codes.ok
+            self.mock_get.return_value.json.return_value = pid_data
+            for mockmeth in [self.mock_put, self.mock_delete]:
+                mockmeth.return_value.status_code = requests.codes.ok
+
+            for i in range(3):
+                self.assertEqual(pid_data, client.get_ark('aa'))
+                client.get_ark_target('aa', 'PDF')
+                client.get_domain(1)
+            # each is only requested once
+            self.assertEqual(3, self.mock_get.call_count)
+            self.assertEqual(6, client.cache.stats()['hits'])
+
+            # different pid type is cached separately
+            client.get_purl('aa')
+            self.assertEqual(4, self.mock_get.call_count)
+
+            # updating the pid invalidates cached pid and targets
+            client.update_ark('aa', name='bar')
+            client.get_ark('aa')
+            client.get_ark_target('aa', 'PDF')
+            self.assertEqual(6, self.mock_get.call_count)
+
+            # updating or deleting a target invalidates
+            client.update_ark_target('aa', 'PDF', active=False)
+            client.get_ark_target('aa', 'PDF')
+            self.assertEqual(7, self.mock_get.call_count)
+            client.delete_ark_target('aa', 'PDF')
+            client.get_ark('aa')
+            self.assertEqual(8, self.mock_get.call_count)
+            # purl is unaffected
+            client.get_purl('aa')
+            self.assertEqual(8, self.mock_get.call_count)
+
+            # updating domain invalidates the domain
+            client.update_domain(1, name='new name')
+            client.get_domain(1)
+            self.assertEqual(9, self.mock_get.call_count)
+
+            # failed update still invalidates
+            self.mock_put.return_value.status_code = requests.codes.not_found
+            self.assertRaises(requests.exceptions.HTTPError, client.update_purl, 'aa',
+                              name='bar')
+            client.get_purl('aa')
+            self.assertEqual(10, self.mock_get.call_count)
+
+            # errors are not cached
+            self.mock_get.return_value.status_code = requests.codes.not_found
+            self.assertRaises(requests.exceptions.HTTPError, client.get_ark, 'bb')
+            self.assertRaises(requests.exceptions.HTTPError, client.get_ark, 'bb')
+            self.assertEqual(12, self.mock_get.call_count)
+
+    def test_cache_revalidation(self):
+        """Tests revalidating expired cached information."""
+        client = PidmanRestClient(self.baseurl, cache=LRUCache(ttl=10))
+        pid_data = {'pid': 'aa', 'name': 'foo'}
+        ok = MagicMock(status_code=requests.codes.ok,
+                       headers={'ETag': '"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        ok.json.return_value = pid_data
+        not_modified = MagicMock(status_code=requests.codes.not_modified, headers={})
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get', return_value=ok)
+            client.get_ark('aa')
+            args, kwargs = mocksession.get.call_args
+            self.assertTrue('If-None-Match' not in kwargs['headers'])
+
+            later = time.monotonic() + 11
+            with patch('pidservices.cache.time.monotonic', return_value=later):
+                mocksession.get.return_value = not_modified
+                self.assertEqual(pid_data, client.get_ark('aa'))
+                args, kwargs = mocksession.get.call_args
+                self.assertEqual('"v1"', kwargs['headers']['If-None-Match'])
+                self.assertEqual('Wed, 21 Oct 2015 07:28:00 GMT',
+                                 kwargs['headers']['If-Modified-Since'])
+                # refreshed entry is used without another request
+                self.assertEqual(pid_data, client.get_ark('aa'))
+                self.assertEqual(2, mocksession.get.call_count)
+                self.assertEqual(1, client.cache.stats()['revalidations'])
+
+            later = time.monotonic() + 22
+            with patch('pidservices.cache.time.monotonic', return_value=later):
+                # modified pid is returned and cached
+                updated = MagicMock(status_code=requests.codes.ok, headers={'ETag': '"v2"'})
+                updated.json.return_value = {'pid': 'aa', 'name': 'bar'}
+                mocksession.get.return_value = updated
+                self.assertEqual('bar', client.get_ark('aa')['name'])
+                self.assertEqual('"v2"', client.cache.get_entry(('pid', 'ark', 'aa')).etag)
+
+            # 304 is not accepted when no conditional request was made
+            mocksession.get.return_value = not_modified
+            not_modified.content = ''
+            not_modified.raise_for_status.side_effect = requests.exceptions.HTTPError
+            self.assertRaises(requests.exceptions.HTTPError, client.get_ark, 'bb')
+            # conditional headers are not added to the shared request headers
+            args, kwargs = mocksession.get.call_args
+            self.assertTrue('If-None-Match' not in kwargs['headers'])
+
+    def test_records(self):
+        """Tests returning record objects instead of dictionaries."""
+        client = PidmanRestClient(self.baseurl, self.username, self.password,
+                                  cache=LRUCache(), records=True)
+        pid_data = {'pid': 'aa', 'name': 'foo', 'targets': [{'qualifier': ''}]}
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = self.mock_get
+            self.mock_get.return_value.status_code = requests.codes.ok
+            self.mock_get.return_value.json.return_value = pid_data
+            for i in range(2):
+                pid = client.get_ark('aa')
+                self.assertTrue(isinstance(pid, PidRecord))
+                self.assertEqual(pid_data, pid)
+                self.assertEqual('foo', pid['name'])
+            # cache stores the response, not the record
+            self.assertEqual(1, self.mock_get.call_count)
+            self.assertEqual(pid_data, client.cache.get(('pid', 'ark', 'aa')))
+            self.assertTrue(isinstance(client.cache.get(('pid', 'ark', 'aa')), dict))
+
+            self.mock_get.return_value.json.return_value = {'qualifier': 'PDF'}
+            self.assertTrue(isinstance(client.get_ark_target('aa', 'PDF'), TargetRecord))
+            self.mock_get.return_value.json.return_value = {'id': 1, 'name': 'dom'}
+            self.assertTrue(isinstance(client.get_domain(1), DomainRecord))
+            self.mock_get.return_value.json.return_value = [{'id': 1, 'name': 'dom'}]
+            self.assertTrue(isinstance(client.list_domains()[0], DomainRecord))
+
+            self.mock_get.return_value.json.return_value = {
+                'page_count': 1, 'results': [pid_data, pid_data]}
+            results = client.search_pids(domain='foo')
+            self.assertEqual(1, results['page_count'])
+            self.assertTrue(isinstance(results['results'][1], PidRecord))
+            self.assertEqual([pid_data, pid_data], list(client.iter_search_pids()))
+
+        # not enabled by default
+        client = self._new_client()
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = self.mock_get
+            self.mock_get.return_value.json.return_value = pid_data
+            self.assertTrue(isinstance(client.get_ark('aa'), dict))
+
+    @patch('pidservices.clients.RetryPolicy.sleep')
+    def test_metrics(self, mocksleep):
+        """Tests recording request metrics."""
+        metrics = ClientMetrics()
+        client = PidmanRestClient(self.baseurl, self.username, self.password,
+                                  cache=LRUCache(), metrics=metrics)
+        unavailable = MagicMock(status_code=requests.codes.service_unavailable,
+                                content='', headers={})
+        ok = MagicMock(status_code=requests.codes.ok, content=b'{"pid": "aa"}', headers={})
+        ok.json.return_value = {'pid': 'aa'}
+        created = MagicMock(status_code=requests.codes.created,
+                            content=b'http://pid.emory.edu/ark:/25593/1fx', headers={})
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get', side_effect=[
+                unavailable, requests.exceptions.ConnectionError('reset'), ok])
+            client.get_ark('aa')
+            client.get_ark('aa')    # cached
+            mocksession.post = MagicMock(__name__='post', return_value=created)
+            client.create_ark('http://pid.emory.edu/domains/1/', 'http://some.url')
+            mocksession.get = MagicMock(__name__='get', side_effect=
+                requests.exceptions.ConnectionError('refused'))
+            client.retry_policy = None
+            self.assertRaises(requests.exceptions.ConnectionError,
+                              client.get_ark_target, 'aa', 'PDF')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(set(['get_pid', 'create_pid', 'get_target']), set(snapshot))
+        self.assertEqual({200: 1}, snapshot['get_pid']['status_codes'])
+        self.assertEqual(2, snapshot['get_pid']['retries'])
+        self.assertEqual(1, snapshot['get_pid']['cache_hits'])
+        self.assertEqual(13, snapshot['get_pid']['bytes_received'])
+        self.assertEqual(1, snapshot['get_pid']['latency']['count'])
+        self.assertEqual({201: 1}, snapshot['create_pid']['status_codes'])
+        self.assertEqual(len('domain=http%3A%2F%2Fpid.emory.edu%2Fdomains%2F1%2F'
+                             '&target_uri=http%3A%2F%2Fsome.url'),
+                         snapshot['create_pid']['bytes_sent'])
+        self.assertEqual({'ConnectionError': 1}, snapshot['get_target']['status_codes'])
+        self.assertTrue('pidman_client_requests_total{operation="create_pid",status="201"} 1'
+                        in metrics.prometheus())
+
+    def test_tracing(self):
+        """Tests request spans and the traceparent header."""
+        tracer = Tracer()
+        client = PidmanRestClient(self.baseurl, self.username, self.password, tracer=tracer)
+        ok = MagicMock(status_code=requests.codes.ok, content=b'{"pid": "aa"}', headers={})
+        ok.json.return_value = {'pid': 'aa'}
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get', return_value=ok)
+            with tracer.span('ingest', item='foo') as parent:
+                client.get_ark('aa')
+            args, kwargs = mocksession.get.call_args
+            mocksession.get = MagicMock(__name__='get', side_effect=
+                requests.exceptions.ConnectionError('refused'))
+            client.retry_policy = None
+            self.assertRaises(requests.exceptions.ConnectionError,
+                              client.get_ark_target, 'aa', 'PDF')
+
+        span, ingest, failed = tracer.finished
+        self.assertEqual('get_pid', span.operation)
+        self.assertEqual('GET', span.method)
+        self.assertEqual('aa', span.noid)
+        self.assertTrue(span.url_template.endswith('/ark/{noid}'))
+        self.assertEqual(200, span.status)
+        self.assertTrue(span.duration is not None)
+        self.assertEqual(span.traceparent, kwargs['headers']['traceparent'])
+        # request span is a child of the span it was made in
+        self.assertEqual(ingest, parent)
+        self.assertEqual(parent.trace_id, span.trace_id)
+        self.assertEqual(parent.span_id, span.parent_id)
+        self.assertEqual({'item': 'foo'}, parent.attributes)
+        # failed request
+        self.assertEqual('get_target', failed.operation)
+        self.assertTrue(failed.url_template.endswith('/ark/{noid}/PDF'))
+        self.assertEqual(None, failed.status)
+        self.assertTrue(isinstance(failed.error, requests.exceptions.ConnectionError))
+        self.assertNotEqual(span.trace_id, failed.trace_id)
+        self.assertEqual(None, failed.parent_id)
+        # shared request headers are not modified
+        self.assertTrue('traceparent' not in client._request_headers('GET', None, 'application/json'))
+
+    def test_hooks(self):
+        """Tests request event hooks."""
+        events = []
+
+        def before_request(span, headers):
+            events.append(('before', span.operation))
+            headers['X-Request-Source'] = 'test'
+
+        def after_response(span, response):
+            events.append(('after', span.operation, span.status, response))
+
+        client = PidmanRestClient(self.baseurl, self.username, self.password,
+                                  hooks={'before_request': before_request,
+                                         'after_response': [after_response]})
+        self.assertRaises(ValueError, client.add_hook, 'before_sleep', before_request)
+        created = MagicMock(status_code=requests.codes.created,
+                            content=b'http://pid.emory.edu/ark:/25593/1fx', headers={})
+        with patch.object(client, 'session') as mocksession:
+            mocksession.post = MagicMock(__name__='post', return_value=created)
+            client.create_ark('http://pid.emory.edu/domains/1/', 'http://some.url')
+            args, kwargs = mocksession.post.call_args
+
+        self.assertEqual([('before', 'create_pid'), ('after', 'create_pid', 201, created)],
+                         events)
+        self.assertEqual('test', kwargs['headers']['X-Request-Source'])
+        # no tracer, so no trace context is sent
+        self.assertTrue('traceparent' not in kwargs['headers'])
+
+    def test_hook_errors(self):
+        """Tests that requests ended by a hook error are traced and recorded."""
+        tracer = Tracer()
+        metrics = ClientMetrics()
+        client = PidmanRestClient(self.baseurl, self.username, self.password,
+                                  tracer=tracer, metrics=metrics)
+
+        def before_request(span, headers):
+            raise RuntimeError('hook failed')
+        client.add_hook('before_request', before_request)
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get')
+            self.assertRaises(RuntimeError, client.get_ark, 'aa')
+            # the request is not sent
+            self.assertFalse(mocksession.get.called)
+
+        span, = tracer.finished
+        self.assertEqual('get_pid', span.operation)
+        self.assertTrue(isinstance(span.error, RuntimeError))
+        self.assertTrue(span.duration is not None)
+        self.assertEqual({'RuntimeError': 1},
+                         metrics.snapshot()['get_pid']['status_codes'])
+
+    def test_request_overhead(self):
+        """Tests client-side overhead for each request."""
+        client = self._new_client()
+
+        class Response(object):
+            status_code = requests.codes.ok
+            headers = {}
+
+            def json(self):
+                return {'pid': 'aa'}
+
+        requests_made = []
+
+        def get(url, headers=None, **kwargs):
+            requests_made.append(headers)
+            return Response()
+
+        client.session.get = get
+        # headers for requests without a body are built once and shared
+        with patch.dict('pidservices.clients._REQUEST_HEADERS', clear=True), \
+          patch.object(client, '_build_request_headers',
+                       wraps=client._build_request_headers) as build_headers:
+            for noid in ['aa', 'bb', 'cc']:
+                client.get_ark(noid)
+            self.assertEqual(1, build_headers.call_count)
+        self.assertTrue(requests_made[0] is requests_made[1] is requests_made[2])
+
+        # request details are not logged or formatted unless debugging is enabled
+        logger = logging.getLogger('pidservices.clients')
+        level = logger.level
+        try:
+            with patch.object(logger, 'debug') as mockdebug:
+                logger.setLevel(logging.INFO)
+                client.get_ark('aa')
+                self.assertEqual(0, mockdebug.call_count)
+                logger.setLevel(logging.DEBUG)
+                client.get_ark('aa')
+                self.assertEqual(1, mockdebug.call_count)
+        finally:
+            logger.setLevel(level)
+        # see benchmarks/bench_request_overhead.py to time the overhead
+
     def test_search_pids(self):
         """Tests the REST return for searching pids."""
         # Be a normal return.
@@ -124,6 +569,110 @@ class PidmanRestClientTest(unittest.TestCase):
             # bad_client.connection.response.set_status(400)
             self.assertRaises(requests.exceptions.HTTPError, bad_client.search_pids)
 
+    def test_stream_search_pids(self):
+        """Tests decoding search results incrementally."""
+        client = self._new_client()
+        data = json.dumps({'page_count': 1, 'results': [{'pid': 'aa'}, {'pid': 'bb'}]})
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = self.mock_get
+            response = self.mock_get.return_value
+            response.status_code = requests.codes.ok
+            response.iter_content.return_value = [data[i:i + 5].encode()
+                                                  for i in range(0, len(data), 5)]
+            results = client.stream_search_pids(domain='LSDI', count=220000)
+            self.assertEqual([{'pid': 'aa'}, {'pid': 'bb'}], list(results))
+            self.assertEqual(1, results.fields['page_count'])
+            args, kwargs = self.mock_get.call_args
+            self.assertEqual(True, kwargs['stream'])
+            self.assertEqual({'domain': 'LSDI', 'count': 220000}, kwargs['params'])
+            # response is not decoded all at once, and is closed when done
+            self.assertEqual(0, response.json.call_count)
+            response.close.assert_called_once_with()
+
+            response.status_code = requests.codes.bad_request
+            response.content = 'Error: invalid search'
+            self.assertRaises(requests.exceptions.HTTPError, client.stream_search_pids)
+
+    def test_iter_search_pids(self):
+        """Tests iterating over all pages of search results."""
+        client = self._new_client()
+        pages = {
+            1: {'page_count': 3, 'results': [{'pid': 'aa'}, {'pid': 'bb'}]},
+            2: {'page_count': 3, 'results': [{'pid': 'cc'}, {'pid': 'dd'}]},
+            3: {'page_count': 3, 'results': [{'pid': 'ee'}]},
+        }
+
+        def mock_get(url, params=None, **kwargs):
+            response = MagicMock()
+            response.status_code = requests.codes.ok
+            response.json.return_value = pages[params['page']]
+            return response
+
+        for prefetch in [True, False]:
+            with patch.object(client, 'session') as mocksession:
+                mocksession.get = MagicMock(__name__='get', side_effect=mock_get)
+                results = client.iter_search_pids(domain='LSDI', count=2,
+                                                  prefetch=prefetch)
+                # nothing is requested until iteration starts
+                self.assertEqual(0, mocksession.get.call_count)
+                self.assertEqual({'pid': 'aa'}, next(results))
+                if prefetch:
+                    # next page is requested while the first is processed
+                    for i in range(100):
+                        if mocksession.get.call_count == 2:
+                            break
+                        time.sleep(0.01)
+                    self.assertEqual(2, mocksession.get.call_count)
+                    next(results)
+                remaining = [result['pid'] for result in results]
+                self.assertEqual(['cc', 'dd', 'ee'] if prefetch else ['bb', 'cc', 'dd', 'ee'],
+                                 remaining)
+                self.assertEqual(3, mocksession.get.call_count)
+                args, kwargs = mocksession.get.call_args
+                self.assertEqual({'domain': 'LSDI', 'count': 2, 'page': 3},
+                                 kwargs['params'])
+
+        # single page of results
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get', side_effect=mock_get)
+            pages[1]['page_count'] = 1
+            self.assertEqual(['aa', 'bb'],
+                             [result['pid'] for result in client.iter_search_pids()])
+            self.assertEqual(1, mocksession.get.call_count)
+
+    def test_iter_search_pages(self):
+        """Tests requesting pages of search results concurrently."""
+        client = self._new_client()
+
+        def mock_get(url, params=None, **kwargs):
+            # later pages are returned more quickly
+            time.sleep(0.002 * (10 - params['page']))
+            response = MagicMock()
+            response.status_code = requests.codes.ok
+            response.json.return_value = {
+                'page_count': 8,
+                'results': [{'pid': '%s-%d' % (params['page'], i)} for i in range(3)]
+            }
+            return response
+
+        with patch.object(client, 'session') as mocksession:
+            mocksession.get = MagicMock(__name__='get', side_effect=mock_get)
+            pages = list(client.iter_search_pages(domain='LSDI', count=3, workers=3))
+            self.assertEqual(8, mocksession.get.call_count)
+            self.assertEqual(list(range(1, 9)), [page for page, data in pages])
+            self.assertEqual([{'pid': '2-%d' % i} for i in range(3)], pages[1][1]['results'])
+
+            # unordered: all pages are returned, first page first
+            pages = [page for page, data in
+                     client.iter_search_pages(domain='LSDI', workers=3, ordered=False)]
+            self.assertEqual(1, pages[0])
+            self.assertEqual(list(range(1, 9)), sorted(pages))
+
+            # iterate over individual results across pages
+            results = list(client.iter_search_pids(domain='LSDI', workers=4))
+            self.assertEqual(24, len(results))
+            self.assertEqual({'pid': '8-2'}, results[-1])
+
     def test_list_domains(self):
         """Tests the REST list domain method."""
         data_client = self._new_client()
@@ -305,6 +854,45 @@ class PidmanRestClientTest(unittest.TestCase):
             client.create_ark(domain, target)
             mockcreate_pid.assert_called_with('ark', domain, target)
 
+    def test_create_pids(self):
+        """Test creating a batch of pids concurrently."""
+        client = self._new_client()
+
+        def mock_post(url, data=None, **kwargs):
+            response = MagicMock()
+            if data['target_uri'] == 'http://bad.url':
+                response.status_code = requests.codes.bad_request
+                response.content = 'Error: invalid target'
+            else:
+                response.status_code = requests.codes.created
+                response.content = 'http://pid.emory.edu/%s' % data['name']
+            return response
+
+        domain = 'http://pid.emory.edu/domains/1/'
+        specs = [('purl', domain, 'http://some.url/%d' % i, 'pid%d' % i)
+                 for i in range(20)]
+        # keyword arguments are also supported
+        specs[5] = {'type': 'ark', 'domain': domain, 'target_uri': 'http://bad.url',
+                    'name': 'pid5'}
+        with patch.object(client, 'session') as mocksession:
+            mocksession.post = MagicMock(__name__='post', side_effect=mock_post)
+            results = client.create_pids(specs, workers=4)
+
+        self.assertEqual(20, len(results))
+        self.assertEqual(20, mocksession.post.call_count)
+        # results are returned in input order
+        self.assertEqual('http://pid.emory.edu/pid0', results[0])
+        self.assertEqual('http://pid.emory.edu/pid19', results[19])
+        # failed item carries the exception instead of aborting the batch
+        self.assertTrue(isinstance(results[5], requests.exceptions.HTTPError))
+        self.assertTrue(isinstance(results[6], str))
+
+        # unordered iteration generates spec with each result
+        with patch.object(client, 'session') as mocksession:
+            mocksession.post = MagicMock(__name__='post', side_effect=mock_post)
+            results = dict(client.iter_create_pids(specs[:4], workers=2, ordered=False))
+        self.assertEqual('http://pid.emory.edu/pid3', results[specs[3]])
+
     def test_get_pid(self):
         """Test retrieving info about a pid."""
         # Test a normal working return.
@@ -562,6 +1150,275 @@ class PidmanRestClientTest(unittest.TestCase):
             self.assertRaises(requests.exceptions.HTTPError, client.delete_ark_target, 'ee', 'pdf')
 
 
+# Mock aiohttp session and response for testing the asyncio client.
+class MockAsyncResponse():
+
+    def __init__(self, status=200, content=b'', reason='OK', headers=None):
+        self.status = status
+        self.content = content
+        self.reason = reason
+        self.headers = headers or {}
+
+    async def read(self):
+        return self.content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+class MockAsyncSession():
+
+    def __init__(self):
+        self.response = MockAsyncResponse()
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.response
+
+
+class AsyncPidmanRestClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = AsyncPidmanRestClient('http://brutus.library.emory.edu/pidman',
+                                            'testuser', 'testuserpass')
+        self.session = MockAsyncSession()
+        self.client._get_session = lambda: self.session
+
+    def test_get_pid(self):
+        pid_data = {'domain': 'foo', 'name': 'bar'}
+        self.session.response = MockAsyncResponse(content=json.dumps(pid_data).encode())
+        pid_info = asyncio.run(self.client.get_pid('purl', 'aa'))
+        self.assertEqual(pid_data, pid_info)
+        method, url, kwargs = self.session.calls[-1]
+        self.assertEqual('GET', method)
+        self.assertTrue(url.endswith('/purl/aa'),
+            'get_pid requests expected url; should end with /purl/aa')
+        self.assertTrue('auth' not in kwargs,
+            'auth is not passed when accessing a pid')
+        self.assertEqual('application/json', kwargs['headers']['Accept'])
+
+        # 404 - pid not found, no detail
+        self.session.response = MockAsyncResponse(status=requests.codes.not_found,
+                                                  reason='Not Found')
+        with self.assertRaises(requests.exceptions.HTTPError) as cm:
+            asyncio.run(self.client.get_pid('ark', 'ee'))
+        self.assertTrue(str(cm.exception).startswith('404 Client Error: Not Found'))
+
+        # invalid pid type raises immediately
+        self.assertRaises(Exception, self.client.get_pid, 'faux-pid', 'aa')
+
+    def test_create_pid(self):
+        new_ark = b'http://pid.emory.edu/ark:/25593/1fx'
+        self.session.response = MockAsyncResponse(status=requests.codes.created,
+                                                  content=new_ark)
+        domain, target = 'http://pid.emory.edu/domains/1/', 'http://some.url'
+        created = asyncio.run(self.client.create_ark(domain, target, name='my ark'))
+        self.assertEqual(new_ark, created)
+        method, url, kwargs = self.session.calls[-1]
+        self.assertEqual('POST', method)
+        self.assertTrue(url.endswith('/ark/'))
+        self.assertEqual('testuser', kwargs['auth'].login)
+        self.assertEqual('application/x-www-form-urlencoded',
+            kwargs['headers']['Content-type'])
+        self.assertEqual({'domain': domain, 'target_uri': target, 'name': 'my ark'},
+            kwargs['data'])
+
+        # bad request error detail is included in the exception
+        self.session.response = MockAsyncResponse(status=requests.codes.bad_request,
+            content=b'Error: Could not resolve domain URI')
+        with self.assertRaises(requests.exceptions.HTTPError) as cm:
+            asyncio.run(self.client.create_ark('domain-2', target))
+        self.assertTrue('Could not resolve domain URI' in str(cm.exception))
+
+    def test_update_and_delete_target(self):
+        target_info = {'target_uri': 'http://foo.bar/'}
+        self.session.response = MockAsyncResponse(status=requests.codes.created,
+            content=json.dumps(target_info).encode())
+        target = asyncio.run(self.client.update_ark_target('bb', 'PDF',
+                                                           target_uri='http://foo.bar/'))
+        self.assertEqual(target_info, target)
+        method, url, kwargs = self.session.calls[-1]
+        self.assertEqual('PUT', method)
+        self.assertEqual(target_info, json.loads(kwargs['data']))
+
+        self.session.response = MockAsyncResponse()
+        self.assertTrue(asyncio.run(self.client.delete_ark_target('aa')))
+        method, url, kwargs = self.session.calls[-1]
+        self.assertEqual('DELETE', method)
+        self.assertTrue(url.endswith('/ark/aa/'))
+
+    @patch('pidservices.clients.asyncio.sleep')
+    def test_retries(self, mocksleep):
+        responses = iter([MockAsyncResponse(status=503, headers={'Retry-After': '1'}),
+                          MockAsyncResponse(content=b'{"pid": "aa"}')])
+        self.session.request = lambda method, url, **kwargs: next(responses)
+        self.assertEqual({'pid': 'aa'}, asyncio.run(self.client.get_ark('aa')))
+        mocksleep.assert_called_once_with(1)
+
+    def test_cache(self):
+        self.client.cache = LRUCache()
+        self.session.response = MockAsyncResponse(content=b'{"pid": "aa"}')
+
+        async def get_and_update():
+            await self.client.get_ark('aa')
+            await self.client.get_ark('aa')
+            await self.client.update_ark('aa', name='foo')
+            await self.client.get_ark('aa')
+
+        asyncio.run(get_and_update())
+        self.assertEqual(['GET', 'PUT', 'GET'],
+                         [method for method, url, kwargs in self.session.calls])
+
+    def test_records(self):
+        self.client.records = True
+        self.session.response = MockAsyncResponse(content=b'{"pid": "aa", "targets": []}')
+        pid = asyncio.run(self.client.get_ark('aa'))
+        self.assertTrue(isinstance(pid, PidRecord))
+        self.assertEqual({'pid': 'aa', 'targets': []}, pid)
+
+    def test_metrics(self):
+        self.client.metrics = ClientMetrics()
+        self.session.response = MockAsyncResponse(content=b'{"pid": "aa"}')
+        asyncio.run(self.client.get_ark('aa'))
+        self.session.response = MockAsyncResponse(status=requests.codes.not_found)
+        self.assertRaises(requests.exceptions.HTTPError, asyncio.run,
+                          self.client.update_ark('aa', name='foo'))
+        snapshot = self.client.metrics.snapshot()
+        self.assertEqual({200: 1}, snapshot['get_pid']['status_codes'])
+        self.assertEqual(13, snapshot['get_pid']['bytes_received'])
+        self.assertEqual({404: 1}, snapshot['update_pid']['status_codes'])
+        self.assertEqual(len('{"name": "foo"}'), snapshot['update_pid']['bytes_sent'])
+
+    def test_tracing(self):
+        tracer = self.client.tracer = Tracer()
+        responses = []
+        self.client.add_hook('after_response', lambda span, response: responses.append(response))
+        self.session.response = MockAsyncResponse(content=b'{"pid": "aa"}')
+
+        async def ingest():
+            with tracer.span('ingest') as parent:
+                await asyncio.gather(self.client.get_ark('aa'), self.client.get_ark('bb'))
+            return parent
+
+        parent = asyncio.run(ingest())
+        spans = tracer.spans(trace_id=parent.trace_id, operation='get_pid')
+        self.assertEqual(['aa', 'bb'], sorted(span.noid for span in spans))
+        for span in spans:
+            self.assertEqual(parent.span_id, span.parent_id)
+            self.assertEqual(200, span.status)
+        self.assertEqual([self.session.response] * 2, responses)
+        headers = [kwargs['headers'] for method, url, kwargs in self.session.calls]
+        self.assertEqual(set(span.traceparent for span in spans),
+                         set(header['traceparent'] for header in headers))
+
+    def test_hook_errors(self):
+        tracer = self.client.tracer = Tracer()
+        self.client.metrics = ClientMetrics()
+
+        def before_request(span, headers):
+            raise RuntimeError('hook failed')
+        self.client.add_hook('before_request', before_request)
+        self.assertRaises(RuntimeError, asyncio.run, self.client.get_ark('aa'))
+        self.assertEqual([], self.session.calls)
+        span, = tracer.finished
+        self.assertTrue(isinstance(span.error, RuntimeError))
+        self.assertTrue(span.duration is not None)
+        self.assertEqual({'RuntimeError': 1},
+                         self.client.metrics.snapshot()['get_pid']['status_codes'])
+
+    def test_create_pids(self):
+        self.session.response = MockAsyncResponse(status=requests.codes.created,
+                                                  content=b'http://pid.emory.edu/ark:/25593/1fx')
+        specs = [('ark', 'http://pid.emory.edu/domains/1/', 'http://some.url/%d' % i)
+                 for i in range(5)]
+        specs.append(('faux-pid', 'domain', 'target'))
+        results = asyncio.run(self.client.create_pids(specs, workers=2))
+        self.assertEqual(6, len(results))
+        self.assertEqual(5, len(self.session.calls))
+        self.assertEqual(b'http://pid.emory.edu/ark:/25593/1fx', results[0])
+        self.assertTrue(isinstance(results[5], Exception))
+
+        async def created():
+            return [result async for result
+                    in self.client.iter_create_pids(specs[:3], ordered=False)]
+        results = asyncio.run(created())
+        self.assertEqual(sorted(specs[:3]), sorted(spec for spec, pid in results))
+
+    def test_iter_search_pids(self):
+        pages = [
+            {'page_count': 2, 'results': [{'pid': 'aa'}, {'pid': 'bb'}]},
+            {'page_count': 2, 'results': [{'pid': 'cc'}]},
+        ]
+        responses = iter([MockAsyncResponse(content=json.dumps(page).encode())
+                          for page in pages])
+        self.session.request = lambda method, url, **kwargs: \
+            self.session.calls.append(kwargs['params']) or next(responses)
+
+        async def all_results():
+            return [result['pid'] async for result
+                    in self.client.iter_search_pids(domain='LSDI')]
+
+        self.assertEqual(['aa', 'bb', 'cc'], asyncio.run(all_results()))
+        self.assertEqual([1, 2], [params['page'] for params in self.session.calls])
+
+    def test_iter_search_pages(self):
+        self.session.request = lambda method, url, **kwargs: MockAsyncResponse(
+            content=json.dumps({'page_count': 4, 'results': [
+                {'pid': 'p%d' % kwargs['params']['page']}]}).encode())
+
+        async def all_pages(**kwargs):
+            return [page async for page, data
+                    in self.client.iter_search_pages(workers=2, **kwargs)]
+
+        self.assertEqual([1, 2, 3, 4], asyncio.run(all_pages()))
+        self.assertEqual([1, 2, 3, 4], sorted(asyncio.run(all_pages(ordered=False))))
+
+        async def all_results():
+            return [result['pid'] async for result
+                    in self.client.iter_search_pids(workers=3)]
+
+        self.assertEqual(['p1', 'p2', 'p3', 'p4'], asyncio.run(all_results()))
+
+    def test_iter_search_pages_bounded(self):
+        # pages after a slow page are not all requested up front
+        class SlowResponse(MockAsyncResponse):
+            async def read(self):
+                await asyncio.sleep(0.05 if self.page == 2 else 0)
+                return self.content
+
+        def request(method, url, **kwargs):
+            page = kwargs['params']['page']
+            self.session.calls.append(page)
+            response = SlowResponse(content=json.dumps(
+                {'page_count': 50, 'results': [{'pid': 'p%d' % page}]}).encode())
+            response.page = page
+            return response
+        self.session.request = request
+
+        async def first_pages():
+            pages = self.client.iter_search_pages(workers=2)
+            first = [(await pages.__anext__())[0] for i in range(2)]
+            await pages.aclose()
+            return first
+
+        self.assertEqual([1, 2], asyncio.run(first_pages()))
+        self.assertTrue(len(self.session.calls) <= 6)
+
+    def test_concurrent_requests(self):
+        self.session.response = MockAsyncResponse(content=b'{"pid": "aa"}')
+
+        async def fetch_all():
+            return await asyncio.gather(*[self.client.get_ark('aa%d' % i)
+                                          for i in range(20)])
+
+        results = asyncio.run(fetch_all())
+        self.assertEqual(20, len(results))
+        self.assertEqual(20, len(self.session.calls))
+
+
 # Test the Django wrapper code for pidman Client.
 class DjangoPidmanRestClientTest(unittest.TestCase):
 
@@ -579,6 +1436,11 @@ class DjangoPidmanRestClientTest(unittest.TestCase):
         self.assertEqual('testpass', password,
             'Client password %s is not expected value' % password)
 
+     def test_client_options(self):
+        'Test passing client options through from Django init.'
+        client = DjangoPidmanRestClient(keep_alive=False)
+        self.assertEqual('close', client.session.headers['Connection'])
+
      def test_runtime_error(self):
         'Test Django init without required Django settings'
         del settings.PIDMAN_HOST
@@ -609,6 +1471,31 @@ class IsArkTest(unittest.TestCase):
         self.assertFalse(is_ark('http://genes.is/noahs/ark'))
         self.assertFalse(is_ark('doi:10.1000/182'))
 
+    def test_verify(self):
+        'Test noid check character verification'
+        self.assertEqual('x', noid_check_character('1f'))
+        self.assertEqual('1', noid_check_character('xf93gt2'))
+        self.assertTrue(valid_noid('1fx'))
+        self.assertTrue(valid_noid('1FX'))
+        self.assertFalse(valid_noid('1fz'))     # typo
+        self.assertFalse(valid_noid('f1x'))     # transposed
+        self.assertFalse(valid_noid('1f'))      # truncated
+        self.assertFalse(valid_noid('x'))
+        # any single substitution or adjacent transposition is detected
+        noid = 'xf93gt21'
+        for i in range(len(noid)):
+            for char in '0123456789bcdfghjkmnpqrstvwxz':
+                if char != noid[i]:
+                    self.assertFalse(valid_noid(noid[:i] + char + noid[i + 1:]))
+        for i in range(len(noid) - 2):
+            if noid[i] != noid[i + 1]:
+                self.assertFalse(valid_noid(noid[:i] + noid[i + 1] + noid[i] + noid[i + 2:]))
+
+        self.assertTrue(is_ark('http://pid.emory.edu/ark:/25593/1fx/qual', verify=True))
+        self.assertFalse(is_ark('http://pid.emory.edu/ark:/25593/1fz/qual', verify=True))
+        self.assertTrue(is_ark('http://pid.emory.edu/ark:/25593/1fz/qual'))
+        self.assertFalse(is_ark('doi:10.1000/182', verify=True))
+
 class ParseArkTest(unittest.TestCase):
     def test_parse_ark(self):
         'Test parse_ark method'
@@ -654,12 +1541,68 @@ class ParseArkTest(unittest.TestCase):
         self.assertEqual(None, parse_ark('doi:10.1000/182'),
             'attempting to parse non-ark results in None')
 
+        # check character
+        self.assertEqual('1fx', parse_ark('ark:/25593/1fx', verify=True)['noid'])
+        self.assertEqual(None, parse_ark('ark:/25593/1f', verify=True))
+        self.assertEqual('1f', parse_ark('ark:/25593/1f')['noid'])
+
+    def test_validate_arks(self):
+        'Test validate_arks method'
+        arks = ['ark:/25593/1fx', 'http://pid.emory.edu/ark:/25593/1f/PDF',
+                'doi:10.1000/182', 'ark:/25593/xf93gt21', 'ark:/25593/xf39gt21']
+        self.assertEqual([
+            (1, arks[1], 'invalid check character'),
+            (2, arks[2], 'not an ARK'),
+            (4, arks[4], 'invalid check character'),
+        ], validate_arks(iter(arks)))
+        self.assertEqual([], validate_arks([]))
+
+    def test_parse_arks(self):
+        'Test parse_arks method'
+        arks = [
+            'http://pid.emory.edu/ark:/25593/1fx',
+            'doi:10.1000/182',
+            'ark:/25593/1fx/qual/1.23/foo-bar',
+            'http://genes.is/noahs/ark',
+            'ARK:/25593/1FX',
+            'http://pid.emory.edu/ark:/25593/not-a-noid',
+            '',
+        ]
+        parsed = parse_arks(arks)
+        self.assertEqual(len(arks), len(parsed))
+        self.assertEqual(('http://pid.emory.edu/', '25593', '1fx', None), parsed[0])
+        self.assertEqual(None, parsed[1])
+        self.assertEqual((None, '25593', '1fx', 'qual/1.23/foo-bar'), parsed[2])
+        self.assertEqual([None, None, None], parsed[5:] + [parsed[3]])
+        self.assertEqual('1FX', parsed[4][2])
+        # same results as parse_ark
+        for ark, result in zip(arks, parsed):
+            expected = parse_ark(ark)
+            if expected is None:
+                self.assertEqual(None, result)
+            else:
+                self.assertEqual(expected, dict(zip(['nma', 'naan', 'noid', 'qualifier'],
+                                                    result)))
+
+        columns = parse_arks(iter(arks), columnar=True)
+        self.assertEqual([0, 2, 4], columns.index)
+        self.assertEqual(['1fx', '1fx', '1FX'], columns.noid)
+        self.assertEqual(['25593'] * 3, columns.naan)
+        self.assertEqual(['http://pid.emory.edu/', None, None], columns.nma)
+        self.assertEqual([None, 'qual/1.23/foo-bar', None], columns.qualifier)
+
+        self.assertEqual([], parse_arks([]))
+        self.assertEqual(None, parse_arks(['ark:/25593/1fz'], verify=True)[0])
+        self.assertEqual([0, 2, 4], parse_arks(arks, columnar=True, verify=True).index)
+        self.assertEqual(([], [], [], [], []), parse_arks(['doi:10.1000/182'], columnar=True))
+
 def suite():
     suite = unittest.TestSuite()
     loader = unittest.TestLoader()
 
     test_cases = (
         PidmanRestClientTest,
+        AsyncPidmanRestClientTest,
         DjangoPidmanRestClientTest,
         IsArkTest,
         ParseArkTest,
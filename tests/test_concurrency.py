@@ -0,0 +1,53 @@
+import unittest
+
+from pidservices.concurrency import AdaptiveLimit
+
+
+class AdaptiveLimitTest(unittest.TestCase):
+
+    def test_increase(self):
+        limit = AdaptiveLimit(initial=4, maximum=8)
+        # grows by about one for each limit's worth of successful requests
+        for i in range(5):
+            limit.record(0.01, 200)
+        self.assertEqual(5, limit.limit)
+        for i in range(100):
+            limit.record(0.01, 200)
+        self.assertEqual(8, limit.limit)
+        self.assertEqual(4, limit.increases)
+        # client errors are still successful responses
+        limit.record(0.01, 404)
+        self.assertEqual(8, limit.limit)
+
+    def test_overload(self):
+        limit = AdaptiveLimit(initial=16, maximum=32)
+        self.assertEqual(8, limit.record(0.01, 503))
+        # other requests that were in flight do not decrease it again
+        for i in range(15):
+            self.assertEqual(8, limit.record(0.01, 429))
+        self.assertEqual(4, limit.record(0.01, 'ConnectionError'))
+        self.assertEqual(2, limit.decreases)
+        for i in range(100):
+            limit.record(0.01, 503)
+        self.assertEqual(1, limit.limit)
+
+        # other server errors neither increase nor decrease the limit
+        limit = AdaptiveLimit(initial=4)
+        for i in range(10):
+            limit.record(0.01, 500)
+        self.assertEqual(4, limit.limit)
+
+    def test_latency_spike(self):
+        limit = AdaptiveLimit(initial=10, maximum=10)
+        for i in range(50):
+            limit.record(0.01, 200)
+        self.assertEqual(10, limit.limit)
+        limit.record(0.2, 200)
+        self.assertEqual(5, limit.limit)
+        self.assertEqual(1, limit.decreases)
+
+    def test_options(self):
+        self.assertRaises(ValueError, AdaptiveLimit, initial=10, maximum=5)
+        self.assertRaises(ValueError, AdaptiveLimit, minimum=0)
+        self.assertRaises(ValueError, AdaptiveLimit, decrease=1)
+        self.assertEqual('<AdaptiveLimit 4>', repr(AdaptiveLimit()))
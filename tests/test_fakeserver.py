@@ -0,0 +1,258 @@
+import asyncio
+import time
+import unittest
+
+import requests
+
+from pidservices.clients import PidmanRestClient, AsyncPidmanRestClient, \
+    noid_check_character
+from pidservices.bulk import bounded_map
+from pidservices.concurrency import AdaptiveLimit
+from pidservices.fakeserver import FakePidmanServer
+from pidservices.metrics import ClientMetrics
+from pidservices.ratelimit import RateLimiter, TokenBucket
+from pidservices.retry import RetryPolicy
+
+
+class FakePidmanServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakePidmanServer(username='testuser', password='testpass').start()
+        self.client = PidmanRestClient(self.server.url, 'testuser', 'testpass')
+        self.domain = self.server.add_domain('Test Domain')
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.stop()
+
+    def test_domains(self):
+        uri = self.client.create_domain('Another Domain', policy='Permanent Retention')
+        self.assertEqual(('%sdomains/2/' % self.server.url).encode(), uri)
+        domains = self.client.list_domains()
+        self.assertEqual(['Test Domain', 'Another Domain'],
+                         [domain['name'] for domain in domains])
+        self.assertEqual('Permanent Retention', self.client.get_domain(2)['policy'])
+        domain = self.client.update_domain(2, name='Renamed')
+        self.assertEqual('Renamed', domain['name'])
+        self.assertRaises(requests.exceptions.HTTPError, self.client.get_domain, 3)
+
+    def test_pids(self):
+        ark = self.client.create_ark(self.domain['uri'], 'http://example.com/{%PID%}',
+                                     name='test ark').decode()
+        self.assertTrue(ark.startswith('http://pid.emory.edu/ark:/25593/'))
+        noid = ark.rsplit('/', 1)[1]
+        self.assertEqual(noid[-1], noid_check_character(noid[:-1]))
+
+        pid = self.client.get_ark(noid)
+        self.assertEqual('test ark', pid['name'])
+        self.assertEqual(self.domain['uri'], pid['domain'])
+        target, = pid['targets']
+        self.assertEqual('http://example.com/%s' % noid, target['target_uri'])
+        self.assertEqual(ark, target['access_uri'])
+
+        self.assertEqual('new name', self.client.update_ark(noid, name='new name')['name'])
+        target = self.client.update_ark_target(noid, 'PDF', target_uri='http://example.com/pdf')
+        self.assertEqual(ark + '/PDF', target['access_uri'])
+        self.assertEqual(2, len(self.client.get_ark(noid)['targets']))
+        self.assertTrue(self.client.delete_ark_target(noid, 'PDF'))
+        self.assertRaises(requests.exceptions.HTTPError,
+                          self.client.get_ark_target, noid, 'PDF')
+
+        purl = self.client.create_purl(self.domain['uri'], 'http://example.com/purl').decode()
+        noid = purl.rsplit('/', 1)[1]
+        self.assertEqual('http://example.com/purl',
+                         self.client.get_purl_target(noid)['target_uri'])
+        self.assertRaises(requests.exceptions.HTTPError, self.client.get_purl, 'bogus')
+
+    def test_authentication(self):
+        client = PidmanRestClient(self.server.url, 'testuser', 'wrong')
+        self.assertRaises(requests.exceptions.HTTPError, client.create_ark,
+                          self.domain['uri'], 'http://example.com/')
+        self.assertEqual(1, self.server.request_counts[('POST', 401)])
+        client.session.close()
+
+    def test_search(self):
+        other = self.server.add_domain('Other Domain')
+        noids = self.server.add_pids(25, domain=self.domain['uri'])
+        self.server.add_pids(5, domain=other['uri'])
+
+        page = self.client.search_pids(domain='Test Domain', count=10, page=3)
+        self.assertEqual(25, page['results_count'])
+        self.assertEqual(3, page['page_count'])
+        self.assertEqual(noids[20:], [pid['pid'] for pid in page['results']])
+        self.assertEqual(noids, [pid['pid'] for pid in
+                                 self.client.iter_search_pids(domain_uri=self.domain['uri'],
+                                                              count=10)])
+        self.assertEqual(30, len(list(self.client.iter_search_pids(count=7, workers=3))))
+        self.assertEqual([noids[1]], [pid['pid'] for pid in
+                                      self.client.search_pids(pid=noids[1])['results']])
+        self.assertRaises(requests.exceptions.HTTPError, self.client.search_pids, page=9)
+
+    def test_errors(self):
+        self.client.retry_policy = RetryPolicy(total=2, backoff_factor=0)
+        noid = self.server.add_pids(1)[0]
+        self.server.fail_next(2, status=503)
+        self.assertEqual(noid, self.client.get_ark(noid)['pid'])
+        self.assertEqual(2, self.server.request_counts[('GET', 503)])
+
+        self.client.retry_policy = None
+        self.server.fail_next(status=None)
+        self.assertRaises(requests.exceptions.ConnectionError, self.client.get_ark, noid)
+
+        self.server.error_rate = 1
+        self.assertRaises(requests.exceptions.HTTPError, self.client.get_ark, noid)
+
+    def test_latency(self):
+        self.server.latency = 0.05
+        noid = self.server.add_pids(1)[0]
+        start = time.perf_counter()
+        self.client.get_ark(noid)
+        self.assertTrue(time.perf_counter() - start >= 0.05)
+
+    def test_rate_limit(self):
+        noids = self.server.add_pids(5)
+        metrics = ClientMetrics()
+        limiter = RateLimiter(read=TokenBucket(rate=100, capacity=1),
+                              write=TokenBucket(rate=10, capacity=1))
+        client = PidmanRestClient(self.server.url, 'testuser', 'testpass', metrics=metrics,
+                                  rate_limiter=limiter)
+        start = time.perf_counter()
+        list(bounded_map(client.get_ark, noids, workers=5))
+        self.assertTrue(time.perf_counter() - start >= 0.035)
+        # writes have a separate, lower limit
+        start = time.perf_counter()
+        for noid in noids[:3]:
+            client.update_ark(noid, name='updated')
+        self.assertTrue(time.perf_counter() - start >= 0.19)
+        client.session.close()
+        snapshot = metrics.snapshot()
+        self.assertEqual(4, snapshot['get_pid']['rate_limited'])
+        self.assertEqual(2, snapshot['update_pid']['rate_limited'])
+        self.assertTrue(snapshot['update_pid']['rate_limit_wait'] >= 0.19)
+        # waiting for the rate limit is not included in request latency
+        self.assertTrue(snapshot['update_pid']['latency']['sum'] < 0.19)
+
+        # the same limiter can be shared with an asyncio client
+        async def get_pids():
+            async with AsyncPidmanRestClient(self.server.url, rate_limiter=limiter) as client:
+                return await asyncio.gather(*[client.get_ark(noid) for noid in noids])
+        start = time.perf_counter()
+        self.assertEqual(noids, [pid['pid'] for pid in asyncio.run(get_pids())])
+        self.assertTrue(time.perf_counter() - start >= 0.035)
+
+    def test_adaptive_limit(self):
+        domain = self.domain['uri']
+        # only overload responses should decrease the limit, not latency
+        # variation on a busy test machine
+        limit = AdaptiveLimit(initial=2, maximum=8, latency_tolerance=1000)
+        metrics = ClientMetrics()
+        client = PidmanRestClient(self.server.url, 'testuser', 'testpass', metrics=metrics,
+                                  adaptive_limit=limit)
+        specs = [('ark', domain, 'http://example.com/%d' % i) for i in range(40)]
+        results = client.create_pids(specs, workers=limit)
+        self.assertEqual(40, len(self.server.pids))
+        self.assertFalse(any(isinstance(result, Exception) for result in results))
+        self.assertEqual(8, limit.limit)
+        self.assertEqual(8, metrics.concurrency_limit)
+
+        # an overloaded server cuts the limit, including responses that are retried
+        self.server.fail_next(count=3, status=503, retry_after=0)
+        noids = [pid['pid'] for pid in
+                 client.iter_search_pids(domain_uri=domain, count=10, workers=limit)]
+        self.assertEqual(40, len(noids))
+        self.assertTrue(limit.limit < 8)
+        self.assertEqual(limit.limit, metrics.concurrency_limit)
+        client.session.close()
+
+        async def create_pids():
+            async with AsyncPidmanRestClient(self.server.url, 'testuser', 'testpass',
+                                             adaptive_limit=limit) as client:
+                return await client.create_pids(specs[:10], workers=limit)
+        self.assertFalse(any(isinstance(result, Exception)
+                             for result in asyncio.run(create_pids())))
+        self.assertEqual(50, len(self.server.pids))
+
+    def test_coalesce(self):
+        self.server.latency = 0.1
+        noid = self.server.add_pids(1)[0]
+        metrics = ClientMetrics()
+        client = PidmanRestClient(self.server.url, coalesce=True, metrics=metrics)
+        results = list(bounded_map(lambda i: client.get_ark(noid), range(8), workers=8))
+        client.session.close()
+        self.assertEqual([noid] * 8, [pid['pid'] for pid in results])
+        # a single request was sent to the server for all the threads
+        self.assertEqual(1, self.server.request_counts[('GET', 200)])
+        self.assertEqual(1, metrics.snapshot()['get_pid']['count'])
+        self.assertEqual(7, metrics.snapshot()['get_pid']['coalesced'])
+
+        # errors go to all waiting callers
+        self.server.fail_next(status=404)
+        client = PidmanRestClient(self.server.url, coalesce=True)
+        results = list(bounded_map(lambda i: client.get_ark(noid), range(4), workers=4,
+                                   return_exceptions=True))
+        client.session.close()
+        self.assertTrue(all(isinstance(result, requests.exceptions.HTTPError)
+                            for result in results))
+        self.assertEqual(1, self.server.request_counts[('GET', 404)])
+
+        async def get_pids():
+            async with AsyncPidmanRestClient(self.server.url, coalesce=True) as client:
+                return await asyncio.gather(*[client.get_ark(noid) for i in range(4)])
+
+        self.assertEqual([noid] * 4, [pid['pid'] for pid in asyncio.run(get_pids())])
+        self.assertEqual(2, self.server.request_counts[('GET', 200)])
+
+    def test_async_client(self):
+        noids = self.server.add_pids(4)
+
+        async def get_pids():
+            async with AsyncPidmanRestClient(self.server.url, 'testuser', 'testpass') as client:
+                return await asyncio.gather(*[client.get_ark(noid) for noid in noids])
+
+        self.assertEqual(noids, [pid['pid'] for pid in asyncio.run(get_pids())])
+
+    def test_async_stream_search(self):
+        noids = self.server.add_pids(25, domain=self.domain['uri'])
+        metrics = ClientMetrics()
+
+        async def stream_search():
+            async with AsyncPidmanRestClient(self.server.url, metrics=metrics,
+                                             retry_policy=RetryPolicy(backoff_factor=0),
+                                             limit=1) as client:
+                # a retried response releases its connection, so the
+                # stream can reuse it with a single connection in the pool
+                self.server.fail_next(status=503)
+                results = await client.stream_search_pids(domain='Test Domain', count=100,
+                                                          chunk_size=64)
+                found = [pid['pid'] async for pid in results]
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    await client.stream_search_pids(page=9)
+                return found, results.fields
+
+        found, fields = asyncio.run(asyncio.wait_for(stream_search(), 5))
+        self.assertEqual(noids, found)
+        self.assertEqual(1, fields['page_count'])
+        self.assertEqual(1, self.server.request_counts[('GET', 503)])
+        self.assertEqual(1, metrics.snapshot()['stream_search_pids']['retries'])
+
+    def test_async_pool_stats(self):
+        noids = self.server.add_pids(5)
+        client = AsyncPidmanRestClient(self.server.url)
+        self.assertEqual({'pools': 0, 'requests': 0, 'connections_created': 0,
+                          'connections_reused': 0, 'idle_connections': 0},
+                         client.pool_stats())
+
+        async def get_pids():
+            async with client:
+                for noid in noids:
+                    await client.get_ark(noid)
+                return client.pool_stats()
+
+        stats = asyncio.run(get_pids())
+        self.assertEqual(1, stats['pools'])
+        self.assertEqual(5, stats['requests'])
+        self.assertEqual(1, stats['connections_created'])
+        self.assertEqual(4, stats['connections_reused'])
+        self.assertEqual(1, stats['idle_connections'])
+        # counts are kept after the session is closed
+        self.assertEqual(dict(stats, idle_connections=0), client.pool_stats())
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import unittest
+
+from pidservices.jsonstream import JSONArrayStream
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+async def async_chunks(chunks):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+
+
+class JSONArrayStreamTest(unittest.TestCase):
+
+    search_results = {
+        'results_count': 3,
+        'page_count': 12,
+        'results': [
+            {'pid': 'aa', 'name': 'café …', 'targets': [
+                {'target_uri': 'http://example.com/a', 'qualifier': '', 'active': True}]},
+            {'pid': 'bb', 'name': None, 'targets': []},
+            {'pid': 'cc', 'name': 'x', 'targets': [], 'number': 12345.5},
+        ],
+        'current_page': 1,
+    }
+
+    def test_chunk_sizes(self):
+        data = json.dumps(self.search_results, indent=2).encode('utf-8')
+        for size in [1, 2, 3, 7, 64, len(data)]:
+            stream = JSONArrayStream(chunked(data, size))
+            self.assertEqual(self.search_results['results'], list(stream),
+                             'results decoded with chunk size %d' % size)
+            self.assertEqual({'results_count': 3, 'page_count': 12, 'current_page': 1},
+                             stream.fields)
+
+    def test_incremental(self):
+        # items are generated before the rest of the data is read
+        data = json.dumps(self.search_results)
+        chunks_read = []
+
+        def chunks():
+            for chunk in chunked(data, 10):
+                chunks_read.append(chunk)
+                yield chunk
+
+        stream = JSONArrayStream(chunks())
+        self.assertEqual('aa', next(stream)['pid'])
+        self.assertEqual(12, stream.fields['page_count'])
+        self.assertTrue(len(chunks_read) < len(data) / 10)
+
+    def test_numbers_across_chunks(self):
+        stream = JSONArrayStream(['{"page_count": 12', '34, "results": [1', '0, 2', '0]}'])
+        self.assertEqual([10, 20], list(stream))
+        self.assertEqual({'page_count': 1234}, stream.fields)
+
+    def test_item(self):
+        stream = JSONArrayStream(['{"results": [{"pid": "aa"}, {"pid": "bb"}]}'],
+                                 item=lambda result: result['pid'])
+        self.assertEqual(['aa', 'bb'], list(stream))
+
+    def test_empty(self):
+        self.assertEqual([], list(JSONArrayStream(['{}'])))
+        stream = JSONArrayStream([' { "results" : [ ] , "page_count": 0 } '])
+        self.assertEqual([], list(stream))
+        self.assertEqual({'page_count': 0}, stream.fields)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, list, JSONArrayStream(['[1, 2]']))
+        self.assertRaises(ValueError, list, JSONArrayStream(['{"results": [1, 2}']))
+        self.assertRaises(ValueError, list, JSONArrayStream(['{"results": [{"pid": ']))
+        self.assertRaises(ValueError, list, JSONArrayStream(['']))
+
+    def test_close(self):
+        closed = []
+        stream = JSONArrayStream(['{"results": [1, 2, 3]}'], close=lambda: closed.append(True))
+        self.assertEqual(1, next(stream))
+        stream.close()
+        self.assertEqual([True], closed)
+
+        stream = JSONArrayStream(['{"results": [1]}'], close=lambda: closed.append(True))
+        list(stream)
+        self.assertEqual([True, True], closed)
+
+    def test_async(self):
+        data = json.dumps(self.search_results, indent=2).encode('utf-8')
+
+        async def decode(stream):
+            return [item async for item in stream]
+
+        for size in [1, 3, 64, len(data)]:
+            stream = JSONArrayStream(async_chunks(chunked(data, size)))
+            self.assertEqual(self.search_results['results'], asyncio.run(decode(stream)),
+                             'results decoded with chunk size %d' % size)
+            self.assertEqual({'results_count': 3, 'page_count': 12, 'current_page': 1},
+                             stream.fields)
+
+        stream = JSONArrayStream(async_chunks(['{"page_count": 12', '34, "results": [1',
+                                               '0, 2', '0]}']))
+        self.assertEqual([10, 20], asyncio.run(decode(stream)))
+        self.assertEqual({'page_count': 1234}, stream.fields)
+        self.assertRaises(ValueError, asyncio.run,
+                          decode(JSONArrayStream(async_chunks(['{"results": [1, 2}']))))
+
+        # an asynchronous stream must be iterated with async for
+        stream = JSONArrayStream(async_chunks(['{"results": [1]}']))
+        self.assertRaises(TypeError, next, stream)
+
+    def test_async_close(self):
+        closed = []
+
+        async def first_item():
+            stream = JSONArrayStream(async_chunks(['{"results": [1,', ' 2, 3]}']),
+                                     close=lambda: closed.append(True))
+            first = await stream.__anext__()
+            stream.close()
+            return first
+
+        self.assertEqual(1, asyncio.run(first_item()))
+        self.assertEqual([True], closed)
+
+        async def failing_chunks():
+            yield '{"results": [1,'
+            raise ConnectionError('reset')
+
+        async def all_items():
+            stream = JSONArrayStream(failing_chunks(), close=lambda: closed.append(True))
+            return [item async for item in stream]
+
+        self.assertRaises(ConnectionError, asyncio.run, all_items())
+        self.assertEqual([True, True], closed)
@@ -0,0 +1,111 @@
+import threading
+import unittest
+
+from pidservices.metrics import ClientMetrics, LatencyHistogram
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_observe(self):
+        histogram = LatencyHistogram(buckets=(0.1, 0.5, 1))
+        self.assertEqual(None, histogram.quantile(0.5))
+        for value in [0.05, 0.1, 0.2, 0.3, 0.7, 3]:
+            histogram.observe(value)
+        self.assertEqual(6, histogram.count)
+        self.assertAlmostEqual(4.35, histogram.sum)
+        self.assertEqual([(0.1, 2), (0.5, 4), (1, 5), (float('inf'), 6)],
+                         histogram.cumulative())
+        self.assertEqual(0.5, histogram.quantile(0.5))
+        self.assertEqual(float('inf'), histogram.quantile(0.99))
+
+
+class ClientMetricsTest(unittest.TestCase):
+
+    def test_snapshot(self):
+        metrics = ClientMetrics(buckets=(0.1, 1))
+        self.assertEqual({}, metrics.snapshot())
+        metrics.record_request('get_pid', 200, 0.05, bytes_received=120)
+        metrics.record_request('get_pid', 404, 0.5, bytes_received=9)
+        metrics.record_request('create_pid', 201, 2.0, bytes_sent=80, bytes_received=40)
+        metrics.record_request('create_pid', 'ConnectionError', 0.01, bytes_sent=80)
+        metrics.record_retry('create_pid')
+        metrics.record_cache_hit('get_pid')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(set(['get_pid', 'create_pid']), set(snapshot))
+        get_pid = snapshot['get_pid']
+        self.assertEqual(2, get_pid['count'])
+        self.assertEqual({200: 1, 404: 1}, get_pid['status_codes'])
+        self.assertEqual(129, get_pid['bytes_received'])
+        self.assertEqual(0, get_pid['bytes_sent'])
+        self.assertEqual(1, get_pid['cache_hits'])
+        self.assertEqual(0, get_pid['retries'])
+        self.assertEqual([(0.1, 1), (1, 2), (float('inf'), 2)], get_pid['latency']['buckets'])
+        self.assertEqual(1, snapshot['create_pid']['retries'])
+        self.assertEqual(160, snapshot['create_pid']['bytes_sent'])
+        self.assertEqual({201: 1, 'ConnectionError': 1},
+                         snapshot['create_pid']['status_codes'])
+        self.assertEqual(float('inf'), snapshot['create_pid']['latency']['p99'])
+
+        # snapshot is a copy
+        metrics.record_request('get_pid', 200, 0.05)
+        self.assertEqual(2, get_pid['count'])
+
+        metrics.reset()
+        self.assertEqual({}, metrics.snapshot())
+
+    def test_threads(self):
+        metrics = ClientMetrics()
+
+        def record():
+            for i in range(1000):
+                metrics.record_request('get_pid', 200, 0.01, bytes_received=1)
+
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = metrics.snapshot()['get_pid']
+        self.assertEqual(4000, snapshot['count'])
+        self.assertEqual(4000, snapshot['bytes_received'])
+        self.assertEqual(4000, snapshot['latency']['count'])
+
+    def test_prometheus(self):
+        metrics = ClientMetrics(buckets=(0.1, 1))
+        metrics.record_request('get_pid', 200, 0.05, bytes_received=120)
+        metrics.record_request('create_pid', 'ConnectionError', 0.5, bytes_sent=80)
+        metrics.record_retry('create_pid')
+        text = metrics.prometheus()
+        lines = text.splitlines()
+        self.assertTrue(text.endswith('\n'))
+        self.assertTrue('# TYPE pidman_client_requests_total counter' in lines)
+        self.assertTrue('pidman_client_requests_total{operation="get_pid",status="200"} 1'
+                        in lines)
+        self.assertTrue('pidman_client_requests_total{operation="create_pid",'
+                        'status="ConnectionError"} 1' in lines)
+        self.assertTrue('pidman_client_response_bytes_total{operation="get_pid"} 120' in lines)
+        self.assertTrue('pidman_client_request_bytes_total{operation="create_pid"} 80' in lines)
+        self.assertTrue('pidman_client_retries_total{operation="create_pid"} 1' in lines)
+        self.assertTrue('# TYPE pidman_client_request_duration_seconds histogram' in lines)
+        self.assertTrue('pidman_client_request_duration_seconds_bucket'
+                        '{operation="get_pid",le="0.1"} 1' in lines)
+        self.assertTrue('pidman_client_request_duration_seconds_bucket'
+                        '{operation="create_pid",le="0.1"} 0' in lines)
+        self.assertTrue('pidman_client_request_duration_seconds_bucket'
+                        '{operation="create_pid",le="+Inf"} 1' in lines)
+        self.assertTrue('pidman_client_request_duration_seconds_count'
+                        '{operation="get_pid"} 1' in lines)
+        self.assertTrue('pidman_client_request_duration_seconds_sum'
+                        '{operation="create_pid"} 0.5' in lines)
+
+        self.assertTrue(metrics.prometheus(prefix='ingest').startswith('# HELP ingest_'))
+        self.assertFalse('concurrency_limit' in text)
+        metrics.record_concurrency_limit(12)
+        self.assertTrue('pidman_client_concurrency_limit 12' in
+                        metrics.prometheus().splitlines())
+        # every sample line has a metric name and a value
+        for line in lines:
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                float(value.replace('+Inf', 'inf'))
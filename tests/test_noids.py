@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pidservices.noids import encode_noid, decode_noid, NoidSet, MAX_NOID_LENGTH
+
+
+class EncodeNoidTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for noid in ['0', '1fx', 'b', '0b', '00b', 'zzzz', 'xf93gt21', 'z' * MAX_NOID_LENGTH]:
+            self.assertEqual(noid, decode_noid(encode_noid(noid)))
+        self.assertEqual(encode_noid('1fx'), encode_noid('1FX'))
+        # leading zeros are significant
+        self.assertNotEqual(encode_noid('b'), encode_noid('0b'))
+        # fits in an unsigned 64-bit integer
+        self.assertTrue(encode_noid('z' * MAX_NOID_LENGTH) < 2 ** 64)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, encode_noid, 'abc')     # a is not a noid character
+        self.assertRaises(ValueError, encode_noid, '1f/x')
+        self.assertRaises(ValueError, encode_noid, 'b' * (MAX_NOID_LENGTH + 1))
+        self.assertRaises(ValueError, decode_noid, 0)
+
+
+class NoidSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_set(self):
+        noids = NoidSet(['1fx', 'b', '0b', '1FX', 'zzz'])
+        self.assertEqual(4, len(noids))
+        self.assertTrue('1fx' in noids)
+        self.assertTrue('1Fx' in noids)
+        self.assertTrue('0b' in noids)
+        self.assertFalse('00b' in noids)
+        self.assertFalse('zz' in noids)
+        self.assertFalse('not-a-noid' in noids)
+        self.assertFalse(None in noids)
+        self.assertEqual(set(['1fx', 'b', '0b', 'zzz']), set(noids))
+        self.assertEqual(0, len(NoidSet()))
+        self.assertFalse('b' in NoidSet())
+        self.assertEqual(NoidSet(['b', '1fx']), NoidSet(['1fx', 'b', 'b']))
+
+    def test_operations(self):
+        fedora = NoidSet(['1fx', '2bc', '3df', 'zz'])
+        pidman = NoidSet(['2bc', '3df', '4gh', '5jk'])
+        self.assertEqual(set(['1fx', '2bc', '3df', 'zz', '4gh', '5jk']), set(fedora | pidman))
+        self.assertEqual(set(['2bc', '3df']), set(fedora & pidman))
+        self.assertEqual(set(['1fx', 'zz']), set(fedora - pidman))
+        self.assertEqual(set(['4gh', '5jk']), set(pidman.difference(fedora)))
+        self.assertEqual(fedora, fedora.union(NoidSet()))
+        self.assertEqual(0, len(fedora.intersection(NoidSet())))
+        self.assertEqual(fedora, fedora - NoidSet())
+        self.assertEqual(0, len(NoidSet() - fedora))
+
+    def test_from_arks(self):
+        noids = NoidSet.from_arks(['http://pid.emory.edu/ark:/25593/1fx/PDF',
+                                   'ark:/25593/2bc', 'doi:10.1000/182'])
+        self.assertEqual(set(['1fx', '2bc']), set(noids))
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmpdir, 'pids.noids')
+        noids = NoidSet(['1fx', '2bc', '3df', 'zz'])
+        noids.save(path)
+        self.assertEqual(8 + 4 * 8, os.path.getsize(path))
+
+        with NoidSet.load(path) as loaded:
+            self.assertEqual(noids, loaded)
+            self.assertTrue('2bc' in loaded)
+            self.assertFalse('2bd' in loaded)
+            self.assertEqual(set(['1fx', 'zz']), set(loaded - NoidSet(['2bc', '3df'])))
+            # a loaded set can be saved again
+            loaded.save(os.path.join(self.tmpdir, 'copy.noids'))
+        self.assertEqual(0, len(loaded))
+
+        loaded = NoidSet.load(os.path.join(self.tmpdir, 'copy.noids'), use_mmap=False)
+        self.assertEqual(noids, loaded)
+
+        path = os.path.join(self.tmpdir, 'empty.noids')
+        NoidSet().save(path)
+        with NoidSet.load(path) as loaded:
+            self.assertEqual(0, len(loaded))
+            self.assertFalse('b' in loaded)
+
+        with open(path, 'wb') as outfile:
+            outfile.write(b'not a noid set')
+        self.assertRaises(ValueError, NoidSet.load, path)
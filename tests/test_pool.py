@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pidservices.clients import PidmanRestClient
+from pidservices.fakeserver import FakePidmanServer
+from pidservices.pool import PidPool
+
+
+class PidPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakePidmanServer().start()
+        self.client = PidmanRestClient(self.server.url, 'testuser', 'testpass')
+        self.domain = self.server.add_domain('Test Domain')['uri']
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal = os.path.join(self.tmpdir, 'pids.jsonl')
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def server_pid(self, pid):
+        return self.server.pids[('ark', pid.rsplit('/', 1)[1])]
+
+    def journal_events(self):
+        with open(self.journal) as infile:
+            return [json.loads(line)['event'] for line in infile]
+
+    def test_assign(self):
+        with PidPool(self.client, 'http://example.com/pending', size=4, low_water=2,
+                     journal=self.journal) as pool:
+            pool.fill('ark', self.domain)
+            self.assertEqual(4, pool.available('ark', self.domain))
+            self.assertEqual(4, len(self.server.pids))
+
+            ark = pool.assign('ark', self.domain, 'http://example.com/{%PID%}',
+                              name='first item')
+            self.assertEqual(3, pool.available('ark', self.domain))
+            pool.join()
+            pid = self.server_pid(ark)
+            self.assertEqual('first item', pid['name'])
+            self.assertEqual('http://example.com/%s' % pid['pid'],
+                             pid['targets'][0]['target_uri'])
+
+            # falling below the low-water mark refills in the background
+            for i in range(2):
+                pool.assign('ark', self.domain, 'http://example.com/', wait=True)
+            pool.fill('ark', self.domain)
+            self.assertEqual(4, pool.available('ark', self.domain))
+            self.assertEqual(7, len(self.server.pids))
+            self.assertRaises(TypeError, pool.assign, 'ark', self.domain,
+                              'http://example.com/', color='blue')
+
+        self.assertEqual(['minted'] * 4 + ['assigned', 'updated'], self.journal_events()[:6])
+
+    def test_empty_pool(self):
+        # with no pids available, a pid is created with the requested values
+        with PidPool(self.client, 'http://example.com/pending', size=2) as pool:
+            ark = pool.assign('ark', self.domain, 'http://example.com/item', name='item')
+            self.assertEqual('item', self.server_pid(ark)['name'])
+            pool.fill('ark', self.domain)
+            self.assertEqual(2, pool.available('ark', self.domain))
+
+    def test_recover(self):
+        pids = [self.server.add_pid('ark', self.domain, 'http://example.com/pending')
+                for i in range(3)]
+        arks = ['http://pid.emory.edu/ark:/25593/%s' % pid['pid'] for pid in pids]
+        # journal left by a process that exited before updating an assigned pid
+        with open(self.journal, 'w') as outfile:
+            for ark in arks:
+                outfile.write(json.dumps({'event': 'minted', 'pid': ark, 'type': 'ark',
+                                          'domain': self.domain}) + '\n')
+            outfile.write(json.dumps({'event': 'assigned', 'pid': arks[0], 'type': 'ark',
+                                      'domain': self.domain, 'name': 'recovered',
+                                      'target_uri': 'http://example.com/item'}) + '\n')
+            outfile.write('{"event": "assig')
+
+        with PidPool(self.client, 'http://example.com/pending', size=3,
+                     journal=self.journal) as pool:
+            self.assertEqual(2, pool.available('ark', self.domain))
+            pool.join()
+            self.assertEqual('recovered', pids[0]['name'])
+            self.assertEqual(arks[1], pool.assign('ark', self.domain, 'http://example.com/'))
+
+            pool.join()
+            pool.compact()
+            self.assertEqual(['minted'], self.journal_events())
+
+    def test_failed_update(self):
+        with PidPool(self.client, 'http://example.com/pending', size=2) as pool:
+            pool.fill('ark', self.domain)
+            self.server.fail_next(status=500)
+            ark = pool.assign('ark', self.domain, 'http://example.com/', name='item')
+            pool.join()
+            entry, err = pool.failed[0]
+            self.assertEqual(ark, entry['pid'])
+            pool.retry_failed()
+            pool.join()
+            self.assertEqual([], pool.failed)
+            self.assertEqual('item', self.server_pid(ark)['name'])
+
+    def test_failed_update_wait(self):
+        with PidPool(self.client, 'http://example.com/pending', size=2,
+                     journal=self.journal) as pool:
+            pool.fill('ark', self.domain)
+            self.server.fail_next(status=500)
+            with self.assertRaises(Exception):
+                pool.assign('ark', self.domain, 'http://example.com/', name='item',
+                            wait=True)
+            entry, err = pool.failed[0]
+            ark = entry['pid']
+            # the assigned pid is kept in the journal until it is updated
+            pool.compact()
+            self.assertEqual(['minted', 'assigned'], self.journal_events())
+            pool.retry_failed()
+            pool.join()
+            self.assertEqual([], pool.failed)
+            self.assertEqual('item', self.server_pid(ark)['name'])
+            pool.compact()
+            self.assertEqual(['minted'], self.journal_events())
@@ -0,0 +1,169 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pidservices.ratelimit import TokenBucket, SharedTokenBucket, RateLimiter, fcntl
+
+
+class FakeClockBucket(TokenBucket):
+    # token bucket with a simulated clock, where sleeping advances the time
+
+    def __init__(self, *args, **kwargs):
+        self.now = 0.0
+        self.sleeps = []
+        super(FakeClockBucket, self).__init__(*args, **kwargs)
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeClockSharedBucket(SharedTokenBucket):
+
+    def __init__(self, *args, **kwargs):
+        self.now = 1000.0
+        super(FakeClockSharedBucket, self).__init__(*args, **kwargs)
+
+    def clock(self):
+        return self.now
+
+
+def _acquire_shared(path, count):
+    # acquire tokens from a shared bucket in a separate process
+    bucket = SharedTokenBucket(path, rate=100, capacity=1)
+    for i in range(count):
+        bucket.acquire()
+    bucket.close()
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_acquire(self):
+        bucket = FakeClockBucket(rate=10, capacity=2)
+        # initial burst up to capacity
+        self.assertEqual(0, bucket.acquire())
+        self.assertEqual(0, bucket.acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertAlmostEqual(0.1, bucket.acquire())
+        self.assertAlmostEqual(0.1, bucket.acquire())
+        # tokens accumulate while idle, up to capacity
+        bucket.now += 10
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_rate(self):
+        bucket = FakeClockBucket(rate=50)
+        self.assertEqual(50, bucket.capacity)
+        for i in range(550):
+            bucket.acquire()
+        # 500 requests after the initial burst take 10 seconds
+        self.assertAlmostEqual(10, bucket.now)
+        self.assertEqual(1, FakeClockBucket(rate=0.5).capacity)
+        self.assertRaises(ValueError, TokenBucket, 0)
+
+    def test_threads(self):
+        bucket = TokenBucket(rate=200, capacity=1)
+        waits = []
+        threads = [threading.Thread(target=lambda: waits.append(bucket.acquire()))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # requests are spaced out, rather than all waiting the same time
+        self.assertAlmostEqual(0.045, max(waits), delta=0.01)
+
+    def test_acquire_async(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+
+        async def acquire_all():
+            return await asyncio.gather(*[bucket.acquire_async() for i in range(5)])
+        start = time.perf_counter()
+        waits = asyncio.run(acquire_all())
+        self.assertEqual(0, waits[0])
+        self.assertAlmostEqual(0.04, max(waits), delta=0.005)
+        self.assertTrue(time.perf_counter() - start >= 0.035)
+
+
+@unittest.skipIf(fcntl is None, 'requires fcntl')
+class SharedTokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'bucket')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_shared_state(self):
+        first = FakeClockSharedBucket(self.path, rate=10, capacity=2)
+        second = FakeClockSharedBucket(self.path, rate=10, capacity=2)
+        self.assertTrue(first.try_acquire())
+        self.assertTrue(second.try_acquire())
+        # tokens taken by one bucket are not available to the other
+        self.assertFalse(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+        self.assertAlmostEqual(0.1, second._reserve(1, block=True))
+        self.assertAlmostEqual(0.2, first._reserve(1, block=True))
+        first.now = second.now = first.now + 10
+        self.assertTrue(first.try_acquire())
+        self.assertTrue(second.try_acquire())
+        self.assertFalse(first.try_acquire())
+        first.close()
+        second.close()
+
+    def test_processes(self):
+        context = multiprocessing.get_context('fork')
+        start = time.perf_counter()
+        processes = [context.Process(target=_acquire_shared, args=(self.path, 5))
+                     for i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        # 15 requests at 100 per second, across all the processes
+        self.assertTrue(time.perf_counter() - start >= 0.14)
+        self.assertEqual([0, 0, 0], [process.exitcode for process in processes])
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_read_write(self):
+        limiter = RateLimiter(read=100, write=FakeClockBucket(rate=10, capacity=1))
+        self.assertEqual(100, limiter.read.rate)
+        self.assertIs(limiter.read, limiter.bucket('GET'))
+        self.assertIs(limiter.write, limiter.bucket('PUT'))
+        self.assertIs(limiter.write, limiter.bucket('POST'))
+        self.assertEqual(0, limiter.acquire('POST'))
+        self.assertAlmostEqual(0.1, limiter.acquire('DELETE'))
+        # reads are not limited by writes
+        self.assertEqual(0, limiter.acquire('GET'))
+        self.assertEqual(0, asyncio.run(limiter.acquire_async('GET')))
+
+        # no limit
+        limiter = RateLimiter(write=5)
+        self.assertIsNone(limiter.read)
+        self.assertEqual(0, limiter.acquire('GET'))
+        self.assertEqual(0, asyncio.run(limiter.acquire_async('GET')))
+
+    @unittest.skipIf(fcntl is None, 'requires fcntl')
+    def test_shared(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            limiter = RateLimiter.shared(os.path.join(tmpdir, 'pidman'), write=5)
+            self.assertIsNone(limiter.read)
+            self.assertIsInstance(limiter.write, SharedTokenBucket)
+            limiter.acquire('PUT')
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, 'pidman.write')))
+            limiter.write.close()
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,127 @@
+import json
+import tracemalloc
+import unittest
+
+from pidservices.records import PidRecord, TargetRecord, DomainRecord, \
+    search_results
+
+
+def pid_data(i):
+    # pid information as returned by the REST api
+    ark = 'http://pid.example.com/ark:/25593/%05dx' % i
+    return {
+        'pid': '%05dx' % i, 'type': 'Ark', 'uri': ark, 'name': 'Item %d' % i,
+        'domain': 'http://pid.example.com/domains/12/',
+        'external_system_id': 'EUCLID', 'external_system_key': 'ocm%d' % i,
+        'policy': 'Permanent, Stable Content', 'created_by': 'testuser',
+        'created_at': '2015-01-02T03:04:05', 'updated_by': 'testuser',
+        'updated_at': '2015-01-02T03:04:05',
+        'targets': [{'uri': ark, 'target_uri': 'http://example.com/item/%d' % i,
+                     'access_uri': ark, 'qualifier': '', 'proxy': None,
+                     'active': True}],
+    }
+
+
+class PidRecordTest(unittest.TestCase):
+
+    def test_mapping(self):
+        data = pid_data(1)
+        record = PidRecord.from_dict(data)
+        self.assertEqual(data, record)
+        self.assertEqual(data, record.to_dict())
+        self.assertEqual('Item 1', record['name'])
+        self.assertEqual('Item 1', record.name)
+        self.assertEqual('EUCLID', record.get('external_system_id'))
+        self.assertEqual(sorted(data.keys()), sorted(record.keys()))
+        self.assertEqual(len(data), len(record))
+        self.assertTrue('targets' in record)
+        self.assertEqual(json.dumps(data, sort_keys=True),
+                         json.dumps(record.to_dict(), sort_keys=True,
+                                    default=TargetRecord.to_dict))
+
+        # fields not in the response are missing, not None
+        record = PidRecord.from_dict({'pid': 'aa', 'policy': None})
+        self.assertRaises(KeyError, record.__getitem__, 'name')
+        self.assertEqual(None, record.get('name'))
+        self.assertEqual(None, record['policy'])
+        self.assertFalse('name' in record)
+        self.assertFalse('targets' in record)
+        self.assertEqual(['pid', 'policy'], list(record))
+
+        # unknown fields are kept
+        record = PidRecord(pid='aa', ark='ark:/25593/aa')
+        self.assertEqual({'pid': 'aa', 'ark': 'ark:/25593/aa'}, record)
+        self.assertEqual('ark:/25593/aa', record['ark'])
+        self.assertEqual("PidRecord(pid='aa', ark='ark:/25593/aa')", repr(record))
+
+    def test_lazy_targets(self):
+        record = PidRecord.from_dict(pid_data(1))
+        # targets are not decoded until accessed
+        self.assertTrue(isinstance(record._targets, tuple))
+        self.assertEqual(13, len(record))
+        self.assertTrue(isinstance(record._targets, tuple))
+
+        target = record['targets'][0]
+        self.assertTrue(isinstance(target, TargetRecord))
+        self.assertEqual('http://example.com/item/1', target['target_uri'])
+        self.assertEqual(True, target.active)
+        self.assertTrue(record.targets is record['targets'])
+
+        # a target with unexpected information is still decoded
+        data = pid_data(2)
+        data['targets'].append({'qualifier': 'PDF', 'target_uri': 'http://example.com/2.pdf',
+                                'hits': 3})
+        record = PidRecord.from_dict(data)
+        self.assertEqual(data['targets'], record.targets)
+        self.assertEqual(3, record.targets[1]['hits'])
+        self.assertRaises(KeyError, record.targets[1].__getitem__, 'proxy')
+
+    def test_shared_values(self):
+        first, second = PidRecord.from_dict(pid_data(1)), PidRecord.from_dict(pid_data(2))
+        self.assertTrue(first.domain is second.domain)
+        self.assertTrue(first.policy is second.policy)
+        # the pid uri is stored as a prefix shared with other pids, and
+        # targets with the same uri use it
+        self.assertTrue(first._uri is second._uri)
+        self.assertEqual('http://pid.example.com/ark:/25593/00001x', first.uri)
+        self.assertEqual(first.uri, first.targets[0].access_uri)
+        self.assertTrue(first.targets[0].uri is first.targets[0].access_uri)
+        self.assertEqual(pid_data(1), first)
+
+        # values shared by records loaded together are stored once
+        first, second = PidRecord.from_list([pid_data(1), pid_data(2)])
+        self.assertTrue(first.created_at is second.created_at)
+
+        # a pid uri that does not end with the noid is stored as is
+        record = PidRecord.from_dict({'pid': 'aa', 'uri': 'http://pid.example.com/aa/',
+                                      'targets': [{'uri': 'http://pid.example.com/aa/',
+                                                   'target_uri': 'http://example.com/'}]})
+        self.assertEqual('http://pid.example.com/aa/', record.uri)
+        self.assertEqual('http://pid.example.com/aa/', record.targets[0].uri)
+
+    def test_memory(self):
+        text = json.dumps([pid_data(i) for i in range(2000)])
+        tracemalloc.start()
+        try:
+            dicts = json.loads(text)
+            dict_size = tracemalloc.get_traced_memory()[0]
+            records = PidRecord.from_list(dicts)
+            del dicts
+            record_size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(2000, len(records))
+        self.assertTrue(record_size * 3 < dict_size,
+                        'records use %d bytes, dictionaries %d' % (record_size, dict_size))
+
+    def test_domain_and_search(self):
+        domain = DomainRecord.from_dict({'id': 12, 'name': 'Test', 'policy': None,
+                                         'collections': []})
+        self.assertEqual(12, domain['id'])
+        self.assertEqual([], domain['collections'])
+
+        data = {'page_count': 1, 'results': [pid_data(1), pid_data(2)]}
+        page = search_results(data)
+        self.assertEqual(1, page['page_count'])
+        self.assertTrue(all(isinstance(result, PidRecord) for result in page['results']))
+        self.assertEqual(data, page)
@@ -0,0 +1,87 @@
+from email.utils import formatdate
+import time
+import unittest
+
+from mock import patch
+import requests
+
+from pidservices.retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_retry_response(self):
+        policy = RetryPolicy(total=2)
+        self.assertTrue(policy.retry_response('GET', 503, 1))
+        self.assertTrue(policy.retry_response('PUT', 502, 2))
+        # retries used up
+        self.assertFalse(policy.retry_response('GET', 503, 3))
+        # POST is not idempotent, so not retried by default
+        self.assertFalse(policy.retry_response('POST', 503, 1))
+        # client errors are not retried
+        self.assertFalse(policy.retry_response('GET', 404, 1))
+
+        policy = RetryPolicy(methods=['post'])
+        self.assertTrue(policy.retry_response('POST', 503, 1))
+
+    def test_retry_exception(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.retry_exception('GET',
+            requests.exceptions.ConnectionError('reset'), 1))
+        self.assertTrue(policy.retry_exception('DELETE',
+            requests.exceptions.ReadTimeout('timeout'), 1))
+        self.assertFalse(policy.retry_exception('GET',
+            requests.exceptions.HTTPError('404'), 1))
+        self.assertFalse(policy.retry_exception('GET', CircuitOpenError('open'), 1))
+        self.assertFalse(policy.retry_exception('POST',
+            requests.exceptions.ConnectionError('reset'), 1))
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=False)
+        self.assertEqual([1, 2, 4, 5], [policy.backoff(n) for n in range(1, 5)])
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+        for i in range(20):
+            self.assertTrue(0 <= policy.backoff(3) <= 4)
+
+    def test_retry_after(self):
+        policy = RetryPolicy(backoff_factor=1, jitter=False, max_retry_after=60)
+        self.assertEqual(7, policy.delay(1, {'Retry-After': '7'}))
+        # limited to max retry after
+        self.assertEqual(60, policy.delay(1, {'Retry-After': '3600'}))
+        # http date
+        delay = policy.delay(1, {'Retry-After': formatdate(time.time() + 30, usegmt=True)})
+        self.assertTrue(25 <= delay <= 30)
+        # invalid or missing header uses backoff
+        self.assertEqual(2, policy.delay(2, {'Retry-After': 'soon'}))
+        self.assertEqual(2, policy.delay(2, {}))
+        policy.respect_retry_after = False
+        self.assertEqual(2, policy.delay(2, {'Retry-After': '7'}))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_open_and_reset(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+        breaker.before_request()
+        breaker.record_response(503)
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        self.assertRaises(CircuitOpenError, breaker.before_request)
+
+        with patch('pidservices.retry.time.monotonic', return_value=time.monotonic() + 11):
+            self.assertEqual(CircuitBreaker.HALF_OPEN, breaker.state)
+            # a single trial request is allowed
+            breaker.before_request()
+            self.assertRaises(CircuitOpenError, breaker.before_request)
+            # trial failure opens the circuit again
+            breaker.record_failure()
+            self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+
+        with patch('pidservices.retry.time.monotonic', return_value=time.monotonic() + 22):
+            breaker.before_request()
+            # trial success closes the circuit
+            breaker.record_response(200)
+            self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+            self.assertEqual(0, breaker.failures)
+            breaker.before_request()
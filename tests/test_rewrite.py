@@ -0,0 +1,157 @@
+import io
+import unittest
+
+import requests
+
+from pidservices.clients import PidmanRestClient
+from pidservices.fakeserver import FakePidmanServer
+from pidservices.rewrite import Rule, TargetRewriter
+
+
+class RuleTest(unittest.TestCase):
+
+    def test_rewrite(self):
+        rule = Rule(r'^http://old\.example\.com/', 'https://new.example.com/')
+        self.assertEqual('https://new.example.com/item',
+                         rule.rewrite('ark', 'http://domain/1', 'ab12', '', 'http://old.example.com/item'))
+        self.assertEqual(None, rule.rewrite('ark', 'http://domain/1', 'ab12', '', 'http://other.com/'))
+        self.assertEqual(rule.pattern.pattern, rule.name)
+
+        rule = Rule(r'/get/([^/]+)$', r'/objects/\1/{%PID%}', type='ark',
+                    domain='http://domain/1', qualifier='PDF')
+        self.assertEqual('http://example.com/objects/demo:1/ab12',
+                         rule.rewrite('ark', 'http://domain/1', 'ab12', 'PDF',
+                                      'http://example.com/get/demo:1'))
+        for args in [('purl', 'http://domain/1', 'ab12', 'PDF'),
+                     ('ark', 'http://domain/2', 'ab12', 'PDF'),
+                     ('ark', 'http://domain/1', 'ab12', '')]:
+            self.assertEqual(None, rule.rewrite(*(args + ('http://example.com/get/demo:1',))))
+
+        self.assertRaises(ValueError, Rule, 'a', 'b', type='doi')
+
+
+class TargetRewriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakePidmanServer(page_size=4).start()
+        self.client = PidmanRestClient(self.server.url, 'testuser', 'testpass')
+        self.domain = self.server.add_domain('Test Domain')['uri']
+        self.other_domain = self.server.add_domain('Other Domain')['uri']
+        self.pids = [self.server.add_pid('ark', self.domain, 'http://old.example.com/%d' % i)
+                     for i in range(10)]
+        self.server.add_pid('purl', self.domain, 'http://old.example.com/purl')
+        self.other = self.server.add_pid('ark', self.other_domain, 'http://old.example.com/other')
+        self.rules = [
+            Rule(r'^http://old\.example\.com/(\d+)$', r'https://new.example.com/items/\1',
+                 type='ark', domain=self.domain, name='items'),
+            Rule(r'^http://old\.example\.com/', 'https://new.example.com/', name='host'),
+        ]
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.stop()
+
+    def target_uris(self):
+        return sorted(target['target_uri'] for pid in self.server.pids.values()
+                      for target in pid['targets'])
+
+    def test_dry_run(self):
+        rewriter = TargetRewriter(self.client, self.rules, page_size=3)
+        output = io.StringIO()
+        before = self.target_uris()
+        summary = rewriter.run(dry_run=True, output=output, domain='Test Domain')
+        self.assertEqual(before, self.target_uris())
+        self.assertEqual(11, summary.pids)
+        self.assertEqual(11, summary.updated)
+        self.assertEqual({'items': 10, 'host': 1}, dict(summary.matched))
+        self.assertEqual(0, self.server.request_counts[('PUT', 200)])
+        diff = output.getvalue()
+        self.assertIn('@@ ark %s (items)\n- http://old.example.com/0\n'
+                      '+ https://new.example.com/items/0\n' % self.pids[0]['pid'], diff)
+        self.assertIn('+ https://new.example.com/purl\n', diff)
+        self.assertIn('To update: 11', summary.report())
+
+    def test_run(self):
+        self.server.add_pid('ark', self.domain, 'https://new.example.com/done')
+        rewriter = TargetRewriter(self.client, self.rules, workers=4, page_size=3)
+        summary = rewriter.run(domain_uri=self.domain)
+        self.assertEqual(12, summary.pids)
+        self.assertEqual(11, summary.updated)
+        self.assertEqual(0, summary.unchanged)
+        self.assertEqual(11, self.server.request_counts[('PUT', 200)])
+        self.assertEqual('https://new.example.com/items/3',
+                         self.pids[3]['targets'][0]['target_uri'])
+        # pids outside the search are not scanned
+        self.assertEqual('http://old.example.com/other', self.other['targets'][0]['target_uri'])
+
+        # a second run finds nothing left to rewrite
+        summary = rewriter.run(domain_uri=self.domain)
+        self.assertEqual(0, summary.updated)
+
+    def test_unchanged(self):
+        rules = [Rule(r'^(http://old\.example\.com/)', r'\1', name='same')]
+        summary = TargetRewriter(self.client, rules).run(domain_uri=self.other_domain)
+        self.assertEqual(1, summary.unchanged)
+        self.assertEqual(0, summary.updated)
+
+    def test_errors(self):
+        rewriter = TargetRewriter(self.client, self.rules, workers=2)
+        update_target = self.client.update_target
+        failing = set(pid['pid'] for pid in self.pids[:2])
+
+        def fail_some(type, noid, *args, **kwargs):
+            # update a pid that does not exist
+            if noid in failing:
+                type = 'purl'
+            return update_target(type, noid, *args, **kwargs)
+        self.client.update_target = fail_some
+        summary = rewriter.run(domain_uri=self.domain)
+        self.assertEqual(9, summary.updated)
+        self.assertEqual({'HTTP 404': 2}, dict(summary.errors))
+        self.assertEqual(2, len(summary.failed))
+        change, err = summary.failed[0]
+        self.assertIn(change.noid, failing)
+        self.assertIsInstance(err, requests.exceptions.HTTPError)
+        self.assertIn('HTTP 404: 2', summary.report())
+
+    def test_check(self):
+        # e.g. point pids to an application if the object can be viewed
+        # there, to the repository if it exists, and otherwise mark inactive
+        noids = [pid['pid'] for pid in self.pids]
+        exists, viewable = set(noids[:8]), set(noids[:5])
+        checked = []
+
+        def can_view(change):
+            checked.append(change)
+            return change.noid in viewable
+        rules = [
+            Rule(r'^.*$', 'https://app.example.com/{%PID%}', type='ark', domain=self.domain,
+                 check=can_view, active=True, name='app'),
+            Rule(r'^.*$', 'https://repo.example.com/{%PID%}', type='ark', domain=self.domain,
+                 check=lambda change: change.noid in exists, active=True, name='repository'),
+            Rule(r'^.*$', r'\g<0>', type='ark', domain=self.domain, active=False,
+                 name='missing'),
+        ]
+        rewriter = TargetRewriter(self.client, rules, workers=4, page_size=3)
+        output = io.StringIO()
+        summary = rewriter.run(dry_run=True, output=output, domain_uri=self.domain)
+        self.assertEqual(10, summary.updated)
+        self.assertEqual('https://app.example.com/%s' % noids[0], checked[0].new_uri)
+        self.assertIn('@@ ark %s (missing, inactive)\n- http://old.example.com/9\n'
+                      '+ http://old.example.com/9\n' % noids[9], output.getvalue())
+        # targets already active are not set active again
+        self.assertIn('@@ ark %s (app)\n' % noids[0], output.getvalue())
+
+        summary = rewriter.run(domain_uri=self.domain)
+        self.assertEqual({'app': 5, 'repository': 3, 'missing': 2}, dict(summary.matched))
+        self.assertEqual(10, summary.updated)
+        targets = [pid['targets'][0] for pid in self.pids]
+        self.assertEqual('https://app.example.com/%s' % noids[4], targets[4]['target_uri'])
+        self.assertEqual('https://repo.example.com/%s' % noids[5], targets[5]['target_uri'])
+        self.assertEqual('http://old.example.com/9', targets[9]['target_uri'])
+        self.assertEqual([True] * 8 + [False] * 2, [target['active'] for target in targets])
+
+        # rewritten and inactive targets are not updated again
+        summary = rewriter.run(domain_uri=self.domain)
+        self.assertEqual(0, summary.updated)
+        self.assertEqual(10, summary.unchanged)
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from pidservices.singleflight import SingleFlight, AsyncSingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_threads(self, count, func):
+        results = []
+
+        def call():
+            try:
+                results.append(func())
+            except Exception as err:
+                results.append(err)
+
+        threads = [threading.Thread(target=call) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_do(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def slow(value):
+            calls.append(value)
+            time.sleep(0.1)
+            return {'pid': value}
+
+        results = self.run_threads(5, lambda: single_flight.do('aa', slow, 'aa'))
+        self.assertEqual(['aa'], calls)
+        # one caller made the call, and the others shared the result
+        self.assertEqual([({'pid': 'aa'}, False)] + [({'pid': 'aa'}, True)] * 4,
+                         sorted(results, key=lambda result: result[1]))
+        # all callers get the same object
+        self.assertTrue(all(result[0] is results[0][0] for result in results))
+        # nothing is kept once the call completes
+        self.assertEqual(0, len(single_flight))
+        self.assertEqual(({'pid': 'bb'}, False), single_flight.do('aa', slow, 'bb'))
+        self.assertEqual(['aa', 'bb'], calls)
+
+    def test_error(self):
+        single_flight = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('not found')
+
+        results = self.run_threads(3, lambda: single_flight.do('aa', fail))
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(0, len(single_flight))
+
+
+class AsyncSingleFlightTest(unittest.TestCase):
+
+    def test_do(self):
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            if value == 'bad':
+                raise ValueError(value)
+            return value
+
+        async def main():
+            results = await asyncio.gather(
+                *[single_flight.do('aa', slow, 'aa') for i in range(3)],
+                single_flight.do('bb', slow, 'bb'),
+                *[single_flight.do('cc', slow, 'bad') for i in range(2)],
+                return_exceptions=True)
+            return results, len(single_flight)
+
+        results, in_progress = asyncio.run(main())
+        self.assertEqual(['aa', 'bb', 'bad'], calls)
+        self.assertEqual([('aa', False), ('aa', True), ('aa', True), ('bb', False)],
+                         results[:4])
+        self.assertTrue(all(isinstance(result, ValueError) for result in results[4:]))
+        self.assertEqual(0, in_progress)
+
+    def test_cancel(self):
+        single_flight = AsyncSingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        async def main():
+            first = asyncio.ensure_future(single_flight.do('aa', slow))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(single_flight.do('aa', slow))
+            await asyncio.sleep(0)
+            # cancelling the first caller does not cancel the shared call
+            first.cancel()
+            return await second
+
+        self.assertEqual(('done', True), asyncio.run(main()))
@@ -0,0 +1,81 @@
+import unittest
+
+from pidservices.bulk import bounded_map
+from pidservices.tracing import Span, Tracer, TRACEPARENT_REGEXP, current_span
+
+
+class SpanTest(unittest.TestCase):
+
+    def test_span(self):
+        span = Span('get_pid', 'GET', 'http://pid.emory.edu/ark/aa',
+                    'http://pid.emory.edu/ark/{noid}', 'aa')
+        self.assertEqual(32, len(span.trace_id))
+        self.assertEqual(16, len(span.span_id))
+        self.assertTrue(TRACEPARENT_REGEXP.match(span.traceparent))
+        self.assertTrue('in progress' in repr(span))
+        span.end(200)
+        self.assertEqual(200, span.status)
+        self.assertTrue(span.duration >= 0)
+        self.assertTrue('ms>' in repr(span))
+
+
+class TracerTest(unittest.TestCase):
+
+    def test_span_context(self):
+        started, ended = [], []
+        tracer = Tracer(on_start=started.append, on_end=ended.append)
+        self.assertEqual(None, current_span())
+        with tracer.span('ingest', item='foo') as parent:
+            self.assertEqual(parent, current_span())
+            child = tracer.start_span('get_pid', noid='aa')
+            tracer.end_span(child, 200)
+        self.assertEqual(None, current_span())
+
+        self.assertEqual([parent, child], started)
+        self.assertEqual([child, parent], ended)
+        self.assertEqual([child, parent], list(tracer.finished))
+        self.assertEqual(parent.trace_id, child.trace_id)
+        self.assertEqual(parent.span_id, child.parent_id)
+        self.assertEqual(None, parent.parent_id)
+        self.assertEqual({'item': 'foo'}, parent.attributes)
+        self.assertEqual([child], tracer.spans(trace_id=parent.trace_id, operation='get_pid'))
+        self.assertEqual([], tracer.spans(trace_id='0' * 32))
+
+    def test_span_error(self):
+        tracer = Tracer()
+        try:
+            with tracer.span('ingest'):
+                raise ValueError('oops')
+        except ValueError:
+            pass
+        span, = tracer.finished
+        self.assertTrue(isinstance(span.error, ValueError))
+        self.assertTrue(span.duration is not None)
+
+    def test_traceparent(self):
+        tracer = Tracer()
+        traceparent = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+        with tracer.span('ingest', traceparent=traceparent) as span:
+            pass
+        self.assertEqual('0af7651916cd43dd8448eb211c80319c', span.trace_id)
+        self.assertEqual('b7ad6b7169203331', span.parent_id)
+        # invalid values are ignored
+        with tracer.span('ingest', traceparent='bogus') as span:
+            pass
+        self.assertEqual(None, span.parent_id)
+
+    def test_max_spans(self):
+        tracer = Tracer(max_spans=2)
+        for i in range(3):
+            tracer.end_span(tracer.start_span('op%d' % i))
+        self.assertEqual(['op1', 'op2'], [span.operation for span in tracer.finished])
+        tracer = Tracer(max_spans=0)
+        tracer.end_span(tracer.start_span('op'))
+        self.assertEqual([], list(tracer.finished))
+
+    def test_bounded_map(self):
+        # worker threads run in the caller's context
+        tracer = Tracer()
+        with tracer.span('bulk') as parent:
+            spans = list(bounded_map(lambda i: current_span(), range(4), workers=2))
+        self.assertEqual([parent] * 4, spans)